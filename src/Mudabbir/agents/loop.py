@@ -15,24 +15,1108 @@ It replaces the old highly-coupled bot loops.
 """
 
 import asyncio
+import contextlib
 import json
 import logging
 import re
+import time
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
 from typing import Any
 
+import httpx
+
 from Mudabbir.agents.router import AgentRouter
 from Mudabbir.bootstrap import AgentContextBuilder
 from Mudabbir.bus import InboundMessage, OutboundMessage, SystemEvent, get_message_bus
 from Mudabbir.bus.commands import get_command_handler
 from Mudabbir.bus.events import Channel
 from Mudabbir.config import Settings, get_settings
-from Mudabbir.memory import get_memory_manager
+from Mudabbir.llm.client import LLMClient, resolve_llm_client
+from Mudabbir.memory import MemoryManager, get_memory_manager
 from Mudabbir.security.injection_scanner import ThreatLevel, get_injection_scanner
+from Mudabbir.tools.capabilities.windows_intent_map import resolve_windows_intent
 
 logger = logging.getLogger(__name__)
 
 FIRST_RESPONSE_TIMEOUT_SECONDS = 90
 STREAM_CHUNK_TIMEOUT_SECONDS = 120
+# Hard cap on a response-composer completion, SDK retries included.
+COMPOSER_TIMEOUT_SECONDS = 30
+# Identical one-shot prompts (same provider, model and sampling) reuse the last completion.
+ONE_SHOT_CACHE_SIZE = 128
+# At most this many one-shot completions are in flight at once; kept below the
+# pooled clients' connection limits so bursts queue here instead of in the pool.
+ONE_SHOT_CONCURRENCY = 8
+# Auto-learn runs on a few workers fed by a bounded queue; the oldest turn is
+# dropped when the queue is full so fact extraction never piles up under load.
+AUTO_LEARN_WORKERS = 2
+AUTO_LEARN_QUEUE_SIZE = 64
+AUTO_LEARN_DRAIN_SECONDS = 5.0
+# Stream coalescing: the first chunks go out immediately for a fast first token,
+# later ones are batched until enough text is buffered or the flush interval passes.
+STREAM_PASSTHROUGH_CHUNKS = 3
+STREAM_COALESCE_CHARS = 256
+STREAM_COALESCE_INTERVAL_SECONDS = 0.05
+# Thinking events: the first of each block goes out immediately, the rest are
+# published in batches of at least this many characters.
+THINKING_COALESCE_CHARS = 256
+# A proposed destructive desktop action expires if not confirmed within this window.
+PENDING_DANGEROUS_TTL_SECONDS = 300
+# Most sessions whose desktop follow-up context (last app, window, ...) is kept.
+WINDOWS_SESSION_STATE_CAP = 1024
+# Most sessions remembered as already having history; evicted ones re-check the store once.
+SEEN_SESSIONS_CAP = 4096
+
+# Replies that confirm or cancel a pending destructive desktop action.
+_CONFIRMATION_WORDS = frozenset({"yes", "y", "ok", "confirm", "نعم", "اي", "أجل", "اجل"})
+_CANCEL_TOKENS = ("cancel", "stop", "no", "لا", "الغاء", "إلغاء", "وقف")
+_RE_CANCEL = re.compile("|".join(map(re.escape, _CANCEL_TOKENS)))
+
+# Providers served through the OpenAI chat-completions SDK.
+_OPENAI_SDK_PROVIDERS = frozenset({"openai", "openai_compatible", "gemini"})
+# Providers whose timeouts are most often a bad API key or model name.
+_API_KEY_PROVIDERS = frozenset({"openai", "openai_compatible", "anthropic"})
+
+# Stream-sanitizer tables: substrings that mark leaked tool-call payloads.
+_SANITIZE_MARKERS = (
+    "execute",
+    "arguments",
+    "language",
+    "code",
+    "start-process",
+    "get-process",
+    "stop-process",
+    "set-volume",
+    "set-volumelevel",
+    "set-culture",
+    "set-win",
+    "set-bluetoothstate",
+    "write-output",
+    "ms-settings:",
+    "telegram:",
+    "shell:appsfolder",
+    "http://",
+    "https://",
+    "explorer.exe",
+    "pyautogui",
+    "powershell",
+    "powers ",
+    "python",
+    "mcp_sequential-thinking",
+    "tool▁sep",
+    "tool_call_end",
+)
+_BROKEN_TOOL_KEYS = ("namepowers", "argumentspowers", "namepython", "argumentspython")
+_POWERSHELL_NOISE = ("-volume", "start-process", "get-process", "set-", "pyautogui", "}}")
+_BARE_PUNCTUATION = frozenset({"{", "}", "[", "]", "```", "`"})
+_RE_POWERSHELL_LEAD = re.compile(r"^\s*(?:powers|powershell)\b")
+_RE_JSONISH_KEY = re.compile(r'^\s*"?\s*(name|arguments|language|code)\s*"?\s*:')
+_RE_LANGUAGE_VALUE = re.compile(r'^\s*"?\s*:\s*"(powershell|python|pwsh)"')
+_RE_KEY_COMMA = re.compile(r'^\s*"?\s*(name|arguments|language|code)\s*"?\s*,\s*"\s*:\s*')
+_RE_ARABIC = re.compile(r"[\u0600-\u06FF]")
+_RE_SANITIZE_MARKER = re.compile("|".join(map(re.escape, _SANITIZE_MARKERS)))
+# Every sanitizer rule needs one of these substrings in the lowered chunk; plain
+# prose tokens contain none and skip the individual checks.
+_RE_SANITIZE_TRIGGER = re.compile(
+    "|".join(
+        map(
+            re.escape,
+            sorted(
+                {*_SANITIZE_MARKERS, "powers", "pwsh", "name", "{", "}", "[", "]"},
+                key=len,
+                reverse=True,
+            ),
+        )
+    )
+)
+
+# Static acknowledgements for desktop fast-path actions: mode -> message, as (arabic, english).
+_ACTION_MESSAGES: dict[str, tuple[dict[str, str], dict[str, str]]] = {
+    "network_tools": (
+        {
+            "wifi_on": "تم تشغيل الواي فاي.",
+            "wifi_off": "تم إيقاف الواي فاي.",
+            "flush_dns": "تم مسح ذاكرة DNS.",
+            "display_dns": "تم عرض ذاكرة DNS الحالية.",
+            "renew_ip": "تم تجديد عنوان IP.",
+            "disconnect_current_network": "تم قطع الاتصال بالشبكة الحالية.",
+            "connect_wifi": "تم إرسال طلب الاتصال بالشبكة.",
+            "ip_internal": "تم جلب عنوان IP الداخلي.",
+            "ip_external": "تم جلب عنوان IP الخارجي.",
+            "ipconfig_all": "تم جلب معلومات الشبكة التفصيلية.",
+            "ping": "تم تنفيذ اختبار الاتصال (Ping).",
+            "open_ports": "تم جلب المنافذ المفتوحة.",
+            "port_owner": "تم جلب البرنامج الذي يستخدم المنفذ.",
+            "block_app_network": "تم حظر الإنترنت عن البرنامج.",
+            "unblock_app_network": "تمت إعادة الإنترنت للبرنامج.",
+            "limit_app_bandwidth": "تم تطبيق تحديد سرعة النت للبرنامج.",
+            "unlimit_app_bandwidth": "تم إلغاء تحديد سرعة النت للبرنامج.",
+            "route_table": "تم جلب جدول التوجيه.",
+            "tracert": "تم تنفيذ تتبع المسار.",
+            "pathping": "تم تنفيذ فحص المسار وفقدان الحزم.",
+            "nslookup": "تم تنفيذ استعلام DNS.",
+            "netstat_active": "تم جلب الاتصالات النشطة.",
+            "getmac": "تم جلب عناوين MAC للأجهزة.",
+            "arp_table": "تم جلب جدول ARP.",
+            "nbtstat_cache": "تم جلب كاش NetBIOS.",
+            "nbtstat_host": "تم تنفيذ استعلام NetBIOS للجهاز.",
+            "net_view": "تم جلب قائمة أجهزة الشبكة.",
+            "netstat_binary": "تم جلب الاتصالات مع البرامج المرتبطة بها.",
+            "wifi_profiles": "تم جلب قائمة شبكات الواي فاي المحفوظة.",
+            "net_scan": "تم جلب الأجهزة المتصلة على الشبكة المحلية.",
+            "file_sharing_on": "تم تشغيل مشاركة الملفات.",
+            "file_sharing_off": "تم إيقاف مشاركة الملفات.",
+            "shared_folders": "تم جلب قائمة المجلدات المشاركة.",
+            "server_online": "تم فحص توافر الخادم.",
+            "last_login_events": "تم جلب سجل آخر محاولات الدخول.",
+        },
+        {
+            "wifi_on": "Wi-Fi turned on.",
+            "wifi_off": "Wi-Fi turned off.",
+            "flush_dns": "DNS cache flushed.",
+            "display_dns": "Displayed DNS cache.",
+            "renew_ip": "IP renewed.",
+            "disconnect_current_network": "Disconnected from current network.",
+            "connect_wifi": "Sent Wi-Fi connection request.",
+            "ip_internal": "Fetched internal IP.",
+            "ip_external": "Fetched external IP.",
+            "ipconfig_all": "Fetched detailed network configuration.",
+            "ping": "Ping test executed.",
+            "open_ports": "Fetched open ports.",
+            "port_owner": "Fetched process using the selected port.",
+            "block_app_network": "Blocked internet access for the app.",
+            "unblock_app_network": "Restored internet access for the app.",
+            "limit_app_bandwidth": "Applied bandwidth limit for the app.",
+            "unlimit_app_bandwidth": "Removed app bandwidth limit.",
+            "route_table": "Fetched route table.",
+            "tracert": "Ran trace route.",
+            "pathping": "Ran path ping/packet-loss diagnostics.",
+            "nslookup": "Ran DNS lookup.",
+            "netstat_active": "Fetched active network connections.",
+            "getmac": "Fetched MAC addresses.",
+            "arp_table": "Fetched ARP table.",
+            "nbtstat_cache": "Fetched NetBIOS cache.",
+            "nbtstat_host": "Ran NetBIOS host query.",
+            "net_view": "Fetched visible network computers.",
+            "netstat_binary": "Fetched network connections with executable names.",
+            "wifi_profiles": "Fetched saved Wi-Fi profiles.",
+            "net_scan": "Fetched local network scan results.",
+            "file_sharing_on": "Enabled file sharing.",
+            "file_sharing_off": "Disabled file sharing.",
+            "shared_folders": "Fetched shared folders.",
+            "server_online": "Checked server availability.",
+            "last_login_events": "Fetched latest login attempt events.",
+        },
+    ),
+    "power_user_tools": (
+        {
+            "airplane_on": "✈️ تم تفعيل وضع الطيران.",
+            "airplane_off": "✈️ تم تعطيل وضع الطيران.",
+            "airplane_toggle": "✈️ تم تبديل وضع الطيران.",
+            "god_mode": "🧩 تم إنشاء مجلد God Mode على سطح المكتب.",
+            "invert_colors": "🎨 تم تبديل عكس الألوان.",
+        },
+        {
+            "airplane_on": "✈️ Airplane mode enabled.",
+            "airplane_off": "✈️ Airplane mode disabled.",
+            "airplane_toggle": "✈️ Airplane mode toggled.",
+            "god_mode": "🧩 God Mode folder created on desktop.",
+            "invert_colors": "🎨 Color inversion toggled.",
+        },
+    ),
+    "system_power": (
+        {
+            "hibernate_on": "🌙 تم تفعيل السبات.",
+            "hibernate_off": "🌙 تم تعطيل السبات.",
+        },
+        {
+            "hibernate_on": "🌙 Hibernate enabled.",
+            "hibernate_off": "🌙 Hibernate disabled.",
+        },
+    ),
+    "media_control": (
+        {
+            "play_pause": "تم تنفيذ تشغيل/إيقاف مؤقت.",
+            "next": "تم الانتقال للمقطع التالي.",
+            "previous": "تم الرجوع للمقطع السابق.",
+            "stop": "تم إيقاف الوسائط.",
+        },
+        {
+            "play_pause": "Play/Pause executed.",
+            "next": "Skipped to next track.",
+            "previous": "Went back to previous track.",
+            "stop": "Stopped media playback.",
+        },
+    ),
+    "process_tools": (
+        {
+            "restart_explorer": "تمت إعادة تشغيل واجهة ويندوز (Explorer).",
+            "kill_pid": "تم إنهاء العملية عبر PID.",
+            "kill_name": "تم إنهاء العملية بالاسم.",
+            "kill_unresponsive": "تم إنهاء العمليات غير المستجيبة.",
+            "blacklist_app": "تمت إضافة البرنامج لقائمة الحظر.",
+            "whitelist_app": "تمت إزالة البرنامج من قائمة الحظر.",
+            "list_blacklist_apps": "هذه قائمة البرامج المحظورة حالياً.",
+            "monitor_until_exit": "تمت مراقبة العملية المطلوبة.",
+            "path_by_name": "تم جلب مسار تشغيل العملية.",
+            "path_by_pid": "تم جلب مسار العملية.",
+            "cpu_by_pid": "تم جلب استهلاك CPU للعملية.",
+            "ram_by_pid": "تم جلب استهلاك RAM للعملية.",
+            "threads_by_pid": "تم جلب عدد الخيوط للعملية.",
+            "start_time_by_pid": "تم جلب وقت بدء العملية.",
+            "suspend_pid": "تم تعليق العملية.",
+            "resume_pid": "تم استئناف العملية.",
+            "set_priority": "تم تغيير أولوية العملية.",
+        },
+        {
+            "restart_explorer": "Windows Explorer has been restarted.",
+            "kill_pid": "Process terminated by PID.",
+            "kill_name": "Process terminated by name.",
+            "kill_unresponsive": "Unresponsive processes were terminated.",
+            "blacklist_app": "App added to launch blacklist.",
+            "whitelist_app": "App removed from launch blacklist.",
+            "list_blacklist_apps": "Here is the current launch blacklist.",
+            "monitor_until_exit": "Process monitoring completed.",
+            "path_by_name": "Fetched process executable path.",
+            "path_by_pid": "Fetched process path.",
+            "cpu_by_pid": "Fetched process CPU usage.",
+            "ram_by_pid": "Fetched process RAM usage.",
+            "threads_by_pid": "Fetched process thread count.",
+            "start_time_by_pid": "Fetched process start time.",
+            "suspend_pid": "Process suspended.",
+            "resume_pid": "Process resumed.",
+            "set_priority": "Process priority updated.",
+        },
+    ),
+    "security_tools": (
+        {
+            "firewall_status": "تم جلب حالة جدار الحماية.",
+            "firewall_enable": "تم تفعيل جدار الحماية.",
+            "firewall_disable": "تم تعطيل جدار الحماية.",
+            "block_port": "تم إضافة قاعدة حظر منفذ في الجدار الناري.",
+            "unblock_rule": "تم حذف قاعدة من الجدار الناري.",
+            "disable_usb": "تم تعطيل منافذ USB.",
+            "enable_usb": "تم تفعيل منافذ USB.",
+            "disable_camera": "تم تعطيل الكاميرا.",
+            "enable_camera": "تم تفعيل الكاميرا.",
+            "recent_files_list": "تم جلب قائمة الملفات المفتوحة مؤخراً.",
+            "recent_files_clear": "تم مسح قائمة الملفات المفتوحة مؤخراً.",
+            "close_remote_sessions": "تم تنفيذ إغلاق الجلسات البعيدة.",
+            "intrusion_summary": "تم تجهيز ملخص محاولات الدخول الفاشلة.",
+        },
+        {
+            "firewall_status": "Fetched firewall status.",
+            "firewall_enable": "Firewall enabled.",
+            "firewall_disable": "Firewall disabled.",
+            "block_port": "Added firewall block-port rule.",
+            "unblock_rule": "Removed firewall rule.",
+            "disable_usb": "USB ports disabled.",
+            "enable_usb": "USB ports enabled.",
+            "disable_camera": "Camera disabled.",
+            "enable_camera": "Camera enabled.",
+            "recent_files_list": "Fetched recent files list.",
+            "recent_files_clear": "Cleared recent files list.",
+            "close_remote_sessions": "Executed remote sessions close.",
+            "intrusion_summary": "Prepared failed-login intrusion summary.",
+        },
+    ),
+    "background_tools": (
+        {
+            "count_background": "تم جلب عدد تطبيقات الخلفية.",
+            "list_visible_windows": "تم جلب قائمة التطبيقات المرئية.",
+            "list_minimized_windows": "تم جلب قائمة التطبيقات المصغرة.",
+            "ghost_apps": "تم جلب التطبيقات الخلفية الثقيلة.",
+            "network_usage_per_app": "تم جلب التطبيقات التي تستخدم الشبكة الآن.",
+            "camera_usage_now": "تم فحص التطبيقات التي تستخدم الكاميرا.",
+            "mic_usage_now": "تم فحص التطبيقات التي تستخدم الميكروفون.",
+            "wake_lock_apps": "تم جلب التطبيقات التي تمنع السكون.",
+            "process_paths": "تم جلب مسارات التطبيقات الشغالة.",
+        },
+        {
+            "count_background": "Fetched background processes count.",
+            "list_visible_windows": "Fetched visible windows list.",
+            "list_minimized_windows": "Fetched minimized windows list.",
+            "ghost_apps": "Fetched heavy headless/background apps.",
+            "network_usage_per_app": "Fetched apps currently using network.",
+            "camera_usage_now": "Checked apps currently using camera.",
+            "mic_usage_now": "Checked apps currently using microphone.",
+            "wake_lock_apps": "Fetched apps blocking sleep.",
+            "process_paths": "Fetched running app paths.",
+        },
+    ),
+    "performance_tools": (
+        {
+            "top_cpu": "تم جلب أعلى 5 عمليات استهلاكاً للمعالج.",
+            "top_ram": "تم جلب أعلى 5 عمليات استهلاكاً للرام.",
+            "top_disk": "تم جلب أعلى 5 عمليات استهلاكاً للقرص.",
+            "cpu_clock": "تم جلب سرعة المعالج الحالية.",
+            "available_ram": "تم جلب حجم الذاكرة المتاحة.",
+            "pagefile_used": "تم جلب استهلاك ملف التبادل (Page File).",
+        },
+        {
+            "top_cpu": "Fetched top 5 CPU-consuming processes.",
+            "top_ram": "Fetched top 5 RAM-consuming processes.",
+            "top_disk": "Fetched top 5 disk-consuming processes.",
+            "cpu_clock": "Fetched current CPU clock speed.",
+            "available_ram": "Fetched available RAM.",
+            "pagefile_used": "Fetched page file usage.",
+        },
+    ),
+    "ui_tools": (
+        {
+            "night_light_on": "تم تفعيل الوضع الليلي.",
+            "night_light_off": "تم تعطيل الوضع الليلي.",
+            "desktop_icons_show": "تم إظهار أيقونات سطح المكتب.",
+            "desktop_icons_hide": "تم إخفاء أيقونات سطح المكتب.",
+            "open_display_resolution": "تم فتح إعدادات دقة الشاشة.",
+            "open_display_rotation": "تم فتح إعدادات تدوير الشاشة.",
+        },
+        {
+            "night_light_on": "Night light enabled.",
+            "night_light_off": "Night light disabled.",
+            "desktop_icons_show": "Desktop icons shown.",
+            "desktop_icons_hide": "Desktop icons hidden.",
+            "open_display_resolution": "Opened display resolution settings.",
+            "open_display_rotation": "Opened display rotation settings.",
+        },
+    ),
+    "browser_control": (
+        {
+            "new_tab": "تم فتح تبويب جديد.",
+            "close_tab": "تم إغلاق التبويب الحالي.",
+            "reopen_tab": "تمت إعادة فتح آخر تبويب مغلق.",
+            "next_tab": "تم الانتقال للتبويب التالي.",
+            "prev_tab": "تم الانتقال للتبويب السابق.",
+            "reload": "تم تحديث الصفحة.",
+            "incognito": "تم فتح نافذة التصفح الخفي.",
+            "home": "تم الذهاب إلى صفحة البداية.",
+            "history": "تم فتح سجل التصفح.",
+            "downloads": "تم فتح تنزيلات المتصفح.",
+            "find": "تم فتح البحث داخل الصفحة.",
+            "zoom_in": "تم تكبير الصفحة.",
+            "zoom_out": "تم تصغير الصفحة.",
+            "zoom_reset": "تمت إعادة الزوم إلى 100%.",
+            "save_pdf": "تم فتح نافذة حفظ الصفحة PDF.",
+        },
+        {
+            "new_tab": "Opened a new browser tab.",
+            "close_tab": "Closed current browser tab.",
+            "reopen_tab": "Reopened last closed tab.",
+            "next_tab": "Moved to next tab.",
+            "prev_tab": "Moved to previous tab.",
+            "reload": "Reloaded page.",
+            "incognito": "Opened incognito/private window.",
+            "home": "Opened browser home page.",
+            "history": "Opened browser history.",
+            "downloads": "Opened browser downloads.",
+            "find": "Opened Find in page.",
+            "zoom_in": "Zoomed in.",
+            "zoom_out": "Zoomed out.",
+            "zoom_reset": "Reset zoom to 100%.",
+            "save_pdf": "Opened save as PDF flow.",
+        },
+    ),
+    "search_tools": (
+        {
+            "search_text": "تم البحث عن النص داخل الملفات.",
+            "files_larger_than": "تم جلب الملفات الأكبر من الحجم المطلوب.",
+            "modified_today": "تم جلب الملفات المعدلة اليوم.",
+            "find_images": "تم جلب الصور الموجودة في المسار.",
+            "find_videos": "تم جلب الفيديوهات الموجودة في المسار.",
+            "count_files": "تم حساب عدد الملفات.",
+            "search_windows_content": "تم البحث في محتوى النوافذ المفتوحة.",
+        },
+        {
+            "search_text": "Searched text inside files.",
+            "files_larger_than": "Fetched files larger than requested size.",
+            "modified_today": "Fetched files modified today.",
+            "find_images": "Fetched image files in target path.",
+            "find_videos": "Fetched video files in target path.",
+            "count_files": "Counted files in target path.",
+            "search_windows_content": "Searched in open windows content.",
+        },
+    ),
+    "web_tools": (
+        {
+            "open_url": "تم فتح الرابط.",
+            "download_file": "تم بدء تنزيل الملف.",
+            "weather": "تم جلب حالة الطقس.",
+        },
+        {
+            "open_url": "Opened URL.",
+            "download_file": "Started file download.",
+            "weather": "Fetched weather information.",
+        },
+    ),
+    "media_tools": (
+        {
+            "stop_all_media": "⏸️ تم إيقاف الوسائط.",
+            "youtube_open": "▶️ تم فتح الفيديو.",
+            "media_next": "⏭️ تم تشغيل المقطع التالي.",
+            "media_prev": "⏮️ تم الرجوع للمقطع السابق.",
+            "play_pause": "⏯️ تم تبديل التشغيل/الإيقاف.",
+        },
+        {
+            "stop_all_media": "⏸️ Media paused.",
+            "youtube_open": "▶️ Video opened.",
+            "media_next": "⏭️ Skipped to next track.",
+            "media_prev": "⏮️ Went to previous track.",
+            "play_pause": "⏯️ Toggled play/pause.",
+        },
+    ),
+    "api_tools": (
+        {
+            "currency": "تم جلب أسعار العملات.",
+            "weather_city": "تم جلب حالة الطقس للمدينة.",
+            "translate_quick": "تم تنفيذ الترجمة السريعة.",
+        },
+        {
+            "currency": "Fetched currency prices.",
+            "weather_city": "Fetched city weather.",
+            "translate_quick": "Executed quick translation.",
+        },
+    ),
+    "browser_deep_tools": (
+        {
+            "multi_open": "تم فتح مجموعة الروابط.",
+            "clear_chrome_cache": "تم مسح كاش Chrome.",
+            "clear_edge_cache": "تم مسح كاش Edge.",
+        },
+        {
+            "multi_open": "Opened multiple URLs.",
+            "clear_chrome_cache": "Cleared Chrome cache.",
+            "clear_edge_cache": "Cleared Edge cache.",
+        },
+    ),
+    "office_tools": (
+        {
+            "open_word_new": "تم فتح ملف Word جديد.",
+            "docx_to_pdf": "تم تنفيذ تحويل DOCX إلى PDF.",
+            "silent_print": "تم إرسال الملف للطباعة.",
+        },
+        {
+            "open_word_new": "Opened a new Word document.",
+            "docx_to_pdf": "Executed DOCX to PDF conversion.",
+            "silent_print": "Sent file to printer.",
+        },
+    ),
+    "driver_tools": (
+        {
+            "drivers_list": "تم جلب قائمة التعريفات المثبتة.",
+            "drivers_backup": "تم بدء أخذ نسخة احتياطية للتعريفات.",
+            "updates_pending": "تم جلب التحديثات المعلقة.",
+            "drivers_issues": "تم جلب التعريفات التي فيها مشاكل.",
+        },
+        {
+            "drivers_list": "Fetched installed drivers list.",
+            "drivers_backup": "Started drivers backup.",
+            "updates_pending": "Fetched pending updates.",
+            "drivers_issues": "Fetched problematic drivers.",
+        },
+    ),
+    "info_tools": (
+        {
+            "windows_product_key": "تم جلب مفتاح تفعيل ويندوز.",
+            "model_info": "تم جلب موديل الجهاز والشركة المصنعة.",
+            "system_language": "تم جلب لغة النظام الحالية.",
+            "timezone_get": "تم جلب المنطقة الزمنية الحالية.",
+            "timezone_set": "تم تعديل المنطقة الزمنية.",
+            "windows_install_date": "تم جلب تاريخ تثبيت ويندوز.",
+            "refresh_rate": "تم جلب معدل تحديث الشاشة.",
+        },
+        {
+            "windows_product_key": "Fetched Windows product key.",
+            "model_info": "Fetched device model/manufacturer.",
+            "system_language": "Fetched current system language.",
+            "timezone_get": "Fetched current timezone.",
+            "timezone_set": "Updated timezone.",
+            "windows_install_date": "Fetched Windows install date.",
+            "refresh_rate": "Fetched display refresh rate.",
+        },
+    ),
+    "window_control": (
+        {
+            "minimize": "تم تصغير النافذة.",
+            "maximize": "تم تكبير النافذة.",
+            "restore": "تمت استعادة حجم النافذة.",
+            "close_current": "تم إغلاق النافذة الحالية.",
+            "show_desktop": "تم تصغير كل النوافذ وإظهار سطح المكتب.",
+            "show_desktop_verified": "تم عرض سطح المكتب.",
+            "undo_show_desktop": "تمت إعادة إظهار النوافذ المصغرة.",
+            "desktop_icons_show": "🖼️ تم إظهار أيقونات سطح المكتب.",
+            "desktop_icons_hide": "🖼️ تم إخفاء أيقونات سطح المكتب.",
+            "desktop_icons_toggle": "🖼️ تم تبديل حالة أيقونات سطح المكتب.",
+            "split_left": "تم نقل النافذة لليسار.",
+            "split_right": "تم نقل النافذة لليمين.",
+            "task_view": "تم فتح عرض المهام.",
+            "alt_tab": "تم تبديل النافذة.",
+        },
+        {
+            "minimize": "Window minimized.",
+            "maximize": "Window maximized.",
+            "restore": "Window restored.",
+            "close_current": "Current window closed.",
+            "show_desktop": "Minimized all windows (Show Desktop).",
+            "show_desktop_verified": "Show Desktop executed.",
+            "undo_show_desktop": "Restored minimized windows.",
+            "desktop_icons_show": "Desktop icons shown.",
+            "desktop_icons_hide": "Desktop icons hidden.",
+            "desktop_icons_toggle": "Desktop icons visibility toggled.",
+            "split_left": "Moved window to the left side.",
+            "split_right": "Moved window to the right side.",
+            "task_view": "Opened Task View.",
+            "alt_tab": "Switched window.",
+        },
+    ),
+    "app_tools": (
+        {
+            "open_task_manager": "تم فتح مدير المهام.",
+            "open_notepad": "تم فتح المفكرة.",
+            "open_calc": "تم فتح الآلة الحاسبة.",
+            "open_paint": "تم فتح الرسام.",
+            "open_default_browser": "تم فتح المتصفح الافتراضي.",
+            "open_chrome": "تم فتح Chrome.",
+            "open_control_panel": "تم فتح لوحة التحكم.",
+            "open_add_remove_programs": "تم فتح نافذة إضافة أو إزالة البرامج.",
+            "open_store": "تم فتح متجر Microsoft.",
+            "open_camera": "تم فتح الكاميرا.",
+            "open_calendar": "تم فتح التقويم.",
+            "open_mail": "تم فتح البريد.",
+            "open_music_player": "تم فتح مشغل الموسيقى.",
+            "open_volume_mixer": "تم فتح خالط الصوت.",
+            "open_mic_settings": "تم فتح إعدادات الميكروفون.",
+            "open_sound_output": "تم فتح إعدادات مخرج الصوت.",
+            "open_spatial_sound": "تم فتح إعدادات الصوت المكاني.",
+            "open_sound_cpl": "تم فتح إعدادات الصوت الكلاسيكية.",
+            "open_network_connections": "تم فتح اتصالات الشبكة.",
+            "open_netconnections_cpl": "تم فتح لوحة اتصالات الشبكة.",
+            "open_time_date": "تم فتح إعدادات الوقت والتاريخ.",
+            "open_system_properties": "تم فتح خصائص النظام.",
+            "open_power_options": "تم فتح خيارات الطاقة.",
+            "open_firewall_cpl": "تم فتح جدار الحماية.",
+            "open_internet_options_cpl": "تم فتح خصائص الإنترنت.",
+            "open_display_cpl": "تم فتح إعدادات العرض الكلاسيكية.",
+            "open_admin_tools_cpl": "تم فتح الأدوات الإدارية.",
+            "open_schedtasks_cpl": "تم فتح لوحة المهام المجدولة.",
+            "open_mouse_cpl": "تم فتح خصائص الفأرة.",
+            "open_keyboard_cpl": "تم فتح إعدادات لوحة المفاتيح.",
+            "open_fonts_cpl": "تم فتح لوحة الخطوط.",
+            "open_region_cpl": "تم فتح إعدادات الإقليم.",
+            "open_folder_options_cpl": "تم فتح خيارات المجلدات.",
+            "open_color_cpl": "تم فتح إعدادات الألوان.",
+            "open_desktop_cpl": "تم فتح إعدادات سطح المكتب.",
+            "open_printers_cpl": "تم فتح لوحة الطابعات.",
+            "open_user_accounts_cpl": "تم فتح إدارة حسابات المستخدمين.",
+            "open_bluetooth_cpl": "تم فتح إعدادات البلوتوث الكلاسيكية.",
+            "open_accessibility_cpl": "تم فتح خيارات سهولة الوصول.",
+        },
+        {
+            "open_task_manager": "Opened Task Manager.",
+            "open_notepad": "Opened Notepad.",
+            "open_calc": "Opened Calculator.",
+            "open_paint": "Opened Paint.",
+            "open_default_browser": "Opened default browser.",
+            "open_chrome": "Opened Chrome.",
+            "open_control_panel": "Opened Control Panel.",
+            "open_add_remove_programs": "Opened Programs and Features.",
+            "open_store": "Opened Microsoft Store.",
+            "open_camera": "Opened Camera.",
+            "open_calendar": "Opened Calendar.",
+            "open_mail": "Opened Mail.",
+            "open_music_player": "Opened default music player.",
+            "open_volume_mixer": "Opened Volume Mixer.",
+            "open_mic_settings": "Opened Microphone settings.",
+            "open_sound_output": "Opened audio output settings.",
+            "open_spatial_sound": "Opened spatial sound settings.",
+            "open_sound_cpl": "Opened classic Sound settings.",
+            "open_network_connections": "Opened Network Connections.",
+            "open_netconnections_cpl": "Opened Network Connections control panel.",
+            "open_time_date": "Opened Date and Time settings.",
+            "open_system_properties": "Opened System Properties.",
+            "open_power_options": "Opened Power Options.",
+            "open_firewall_cpl": "Opened Windows Firewall.",
+            "open_internet_options_cpl": "Opened Internet Options.",
+            "open_display_cpl": "Opened classic Display settings.",
+            "open_admin_tools_cpl": "Opened Administrative Tools.",
+            "open_schedtasks_cpl": "Opened Scheduled Tasks control panel.",
+            "open_mouse_cpl": "Opened Mouse properties.",
+            "open_keyboard_cpl": "Opened Keyboard settings.",
+            "open_fonts_cpl": "Opened Fonts control panel.",
+            "open_region_cpl": "Opened Region settings.",
+            "open_folder_options_cpl": "Opened Folder Options.",
+            "open_color_cpl": "Opened classic Color settings.",
+            "open_desktop_cpl": "Opened classic Desktop settings.",
+            "open_printers_cpl": "Opened Printers control panel.",
+            "open_user_accounts_cpl": "Opened classic User Accounts settings.",
+            "open_bluetooth_cpl": "Opened classic Bluetooth settings.",
+            "open_accessibility_cpl": "Opened classic Ease of Access settings.",
+        },
+    ),
+    "file_tools": (
+        {
+            "open_documents": "📁 تم فتح المستندات.",
+            "open_downloads": "📁 تم فتح التنزيلات.",
+            "open_pictures": "📁 تم فتح الصور.",
+            "open_videos": "📁 تم فتح الفيديوهات.",
+            "create_folder": "📁 تم إنشاء المجلد.",
+            "delete": "🗑️ تم حذف الملف.",
+            "empty_recycle_bin": "🧹 تم إفراغ سلة المهملات.",
+            "copy": "📄 تم نسخ الملف.",
+            "move": "📦 تم نقل الملف.",
+            "rename": "✏️ تم تغيير اسم الملف.",
+            "zip": "🗜️ تم ضغط الملف.",
+            "unzip": "📂 تم فك الضغط.",
+            "search_ext": "🔎 تم البحث حسب الامتداد.",
+            "show_hidden": "👁️ تم إظهار الملفات المخفية.",
+            "hide_hidden": "🙈 تم إخفاء الملفات المخفية.",
+            "folder_size": "📏 تم حساب حجم المجلد.",
+            "open_cmd_here": "🖥️ تم فتح CMD في المسار.",
+            "open_powershell_here": "🖥️ تم فتح PowerShell في المسار.",
+        },
+        {
+            "open_documents": "📁 Opened Documents.",
+            "open_downloads": "📁 Opened Downloads.",
+            "open_pictures": "📁 Opened Pictures.",
+            "open_videos": "📁 Opened Videos.",
+            "create_folder": "📁 Folder created.",
+            "delete": "🗑️ File deleted.",
+            "empty_recycle_bin": "🧹 Recycle Bin emptied.",
+            "copy": "📄 File copied.",
+            "move": "📦 File moved.",
+            "rename": "✏️ File renamed.",
+            "zip": "🗜️ File compressed.",
+            "unzip": "📂 Archive extracted.",
+            "search_ext": "🔎 Extension search completed.",
+            "show_hidden": "👁️ Hidden files are now visible.",
+            "hide_hidden": "🙈 Hidden files are now hidden.",
+            "folder_size": "📏 Folder size calculated.",
+            "open_cmd_here": "🖥️ Opened CMD in folder.",
+            "open_powershell_here": "🖥️ Opened PowerShell in folder.",
+        },
+    ),
+    "dev_tools": (
+        {
+            "open_services": "تم فتح نافذة الخدمات.",
+            "open_task_scheduler": "تم فتح جدول المهام.",
+            "open_computer_management": "تم فتح إدارة الكمبيوتر.",
+            "open_local_users_groups": "تم فتح المستخدمين والمجموعات المحلية.",
+            "open_local_security_policy": "تم فتح سياسة الأمان المحلية.",
+            "open_print_management": "تم فتح إدارة الطباعة.",
+            "event_errors": "تم جلب أحدث أخطاء سجل الأحداث.",
+            "analyze_bsod": "تم تحليل أحداث انهيار النظام (BSOD).",
+        },
+        {
+            "open_services": "Opened Services console.",
+            "open_task_scheduler": "Opened Task Scheduler.",
+            "open_computer_management": "Opened Computer Management.",
+            "open_local_users_groups": "Opened Local Users and Groups.",
+            "open_local_security_policy": "Opened Local Security Policy.",
+            "open_print_management": "Opened Print Management.",
+            "event_errors": "Fetched recent event log errors.",
+            "analyze_bsod": "Analyzed recent BSOD/system crash events.",
+        },
+    ),
+    "shell_tools": (
+        {
+            "quick_settings": "تم فتح الإعدادات السريعة.",
+            "notifications": "تم فتح مركز الإشعارات.",
+            "search": "تم فتح بحث ويندوز.",
+            "run": "تم فتح نافذة Run.",
+            "file_explorer": "تم فتح مستكشف الملفات.",
+            "quick_link_menu": "تم فتح قائمة الارتباط السريع (Win+X).",
+            "task_view": "تم فتح عرض المهام.",
+        },
+        {
+            "quick_settings": "Opened Quick Settings.",
+            "notifications": "Opened Notification Center.",
+            "search": "Opened Windows Search.",
+            "run": "Opened Run dialog.",
+            "file_explorer": "Opened File Explorer.",
+            "quick_link_menu": "Opened Quick Link menu (Win+X).",
+            "task_view": "Opened Task View.",
+        },
+    ),
+    "automation_tools": (
+        {
+            "popup": "🪟 ظهرت رسالة التنبيه.",
+            "tts": "🔊 تم نطق النص.",
+            "delay": "⏳ تم الانتظار.",
+            "repeat_key": "⌨️ تم تكرار المفتاح.",
+            "mouse_lock_window": "🖱️ تم حجز الماوس داخل النافذة.",
+            "mouse_lock_off": "🖱️ تم فك حجز الماوس.",
+        },
+        {
+            "popup": "🪟 Popup message shown.",
+            "tts": "🔊 Text spoken.",
+            "delay": "⏳ Wait completed.",
+            "repeat_key": "⌨️ Key repeated.",
+            "mouse_lock_window": "🖱️ Mouse locked to the active window.",
+            "mouse_lock_off": "🖱️ Mouse lock released.",
+        },
+    ),
+}
+# Follow-up offers appended to some acknowledgements, as (arabic, english).
+_ACTION_FOLLOWUPS: dict[tuple[str, str], tuple[str, str]] = {
+    ("network_tools", "wifi_off"): (
+        "تريد أفعّل وضع الطيران كمان؟",
+        "Want me to enable airplane mode too?",
+    ),
+    ("search_tools", "find_images"): (
+        "تريد أرتب النتائج بالأحدث؟",
+        "Want results sorted by newest first?",
+    ),
+    ("search_tools", "find_videos"): (
+        "تريد أرتب النتائج بالأحدث؟",
+        "Want results sorted by newest first?",
+    ),
+    ("search_tools", "search_text"): (
+        "تريد أرتب النتائج بالأحدث؟",
+        "Want results sorted by newest first?",
+    ),
+    ("window_control", "show_desktop_verified"): (
+        "إذا بدك برجعلك النوافذ.",
+        "I can restore all windows if you want.",
+    ),
+    ("window_control", "minimize"): ("إذا بدك بكبّرها مباشرة.", "I can maximize it back now."),
+    ("file_tools", "copy"): (
+        "تريد ألصقه بالمكان الحالي؟",
+        "Want me to paste it in the current folder?",
+    ),
+    ("file_tools", "move"): (
+        "تريد ألصقه بالمكان الحالي؟",
+        "Want me to paste it in the current folder?",
+    ),
+    ("file_tools", "delete"): ("إذا بدك برجع أتحقق من وجوده.", "I can verify it is gone."),
+    ("service_tools", "start"): ("تريد أتحقق من حالتها؟", "Want me to verify status now?"),
+    ("service_tools", "restart"): ("تريد أتحقق من حالتها؟", "Want me to verify status now?"),
+    ("service_tools", "stop"): ("إذا بدك برجع شغلها.", "I can start it again if you want."),
+    ("disk_tools", "disk_usage"): (
+        "تريد أطلع أكبر الملفات كمان؟",
+        "Want me to list the largest files too?",
+    ),
+    ("disk_tools", "chkdsk_scan"): (
+        "إذا بدك بعطيك ملخص النتيجة بعد ما يخلص.",
+        "I can summarize results when it finishes.",
+    ),
+}
+# Settings-page acknowledgements keyed by page, as (arabic, english).
+_SETTINGS_PAGE_MESSAGES: tuple[dict[str, str], dict[str, str]] = (
+    {
+            "network": "تم فتح إعدادات الشبكة.",
+            "privacy": "تم فتح إعدادات الخصوصية.",
+            "sound": "تم فتح إعدادات الصوت.",
+            "windowsupdate": "تم فتح إعدادات تحديثات ويندوز.",
+            "update": "تم فتح إعدادات تحديثات ويندوز.",
+            "appsfeatures": "تم فتح إعدادات التطبيقات.",
+    },
+    {
+            "network": "Opened network settings.",
+            "privacy": "Opened privacy settings.",
+            "sound": "Opened sound settings.",
+            "windowsupdate": "Opened Windows Update settings.",
+            "update": "Opened Windows Update settings.",
+            "appsfeatures": "Opened apps settings.",
+    },
+)
+# Acknowledgements that name the acted-on target, mode -> template as (arabic, english).
+# "{target}" is filled from the action's target param, falling back to the defaults below.
+_TARGET_MESSAGES: dict[str, tuple[dict[str, str], dict[str, str]]] = {
+    "service_tools": (
+        {
+            "start": "تم تشغيل الخدمة: {target}.",
+            "stop": "تم إيقاف الخدمة: {target}.",
+            "restart": "تمت إعادة تشغيل الخدمة: {target}.",
+            "list": "تم جلب قائمة الخدمات.",
+            "describe": "تم جلب وصف الخدمة: {target}.",
+            "dependencies": "تم جلب تبعيات الخدمة: {target}.",
+            "startup": "تم تعديل نوع تشغيل الخدمة: {target} إلى {startup}.",
+        },
+        {
+            "start": "Service started: {target}.",
+            "stop": "Service stopped: {target}.",
+            "restart": "Service restarted: {target}.",
+            "list": "Fetched services list.",
+            "describe": "Fetched service description: {target}.",
+            "dependencies": "Fetched service dependencies: {target}.",
+            "startup": "Updated service startup type: {target} -> {startup}.",
+        },
+    ),
+    "startup_tools": (
+        {
+            "startup_list": "تم جلب قائمة برامج بدء التشغيل.",
+            "startup_impact_time": "تم جلب وقت تأثير بدء التشغيل.",
+            "registry_startups": "تم جلب برامج بدء التشغيل من السجل.",
+            "folder_startups": "تم جلب برامج بدء التشغيل من مجلد Startup.",
+            "signature_check": "تم فحص أمان/توقيع برامج بدء التشغيل.",
+            "disable": "تم تعطيل برنامج بدء التشغيل: {target}.",
+            "enable": "تم تفعيل برنامج بدء التشغيل: {target}.",
+        },
+        {
+            "startup_list": "Fetched startup apps list.",
+            "startup_impact_time": "Fetched startup impact time.",
+            "registry_startups": "Fetched registry startup entries.",
+            "folder_startups": "Fetched startup folder entries.",
+            "signature_check": "Checked startup apps signatures/security.",
+            "disable": "Disabled startup app: {target}.",
+            "enable": "Enabled startup app: {target}.",
+        },
+    ),
+    "task_tools": (
+        {
+            "list": "تم جلب قائمة المهام المجدولة.",
+            "running": "تم جلب المهام المجدولة الجارية.",
+            "last_run": "تم جلب آخر وقت تشغيل للمهام المجدولة.",
+            "run": "تم تشغيل المهمة المجدولة: {target}.",
+            "end": "تم إنهاء المهمة المجدولة: {target}.",
+            "enable": "تم تمكين المهمة المجدولة: {target}.",
+            "disable": "تم تعطيل المهمة المجدولة: {target}.",
+            "delete": "تم حذف المهمة المجدولة: {target}.",
+            "create": "تم إنشاء مهمة مجدولة: {target}.",
+        },
+        {
+            "list": "Fetched scheduled tasks list.",
+            "running": "Fetched running scheduled tasks.",
+            "last_run": "Fetched scheduled tasks last run times.",
+            "run": "Ran scheduled task: {target}.",
+            "end": "Stopped scheduled task: {target}.",
+            "enable": "Enabled scheduled task: {target}.",
+            "disable": "Disabled scheduled task: {target}.",
+            "delete": "Deleted scheduled task: {target}.",
+            "create": "Created scheduled task: {target}.",
+        },
+    ),
+    "user_tools": (
+        {
+            "list": "تم جلب قائمة المستخدمين.",
+            "create": "تم إنشاء المستخدم: {target}.",
+            "delete": "تم حذف المستخدم: {target}.",
+            "set_password": "تم تغيير كلمة مرور المستخدم: {target}.",
+            "set_type": "تم تحديث نوع المستخدم: {target}.",
+        },
+        {
+            "list": "Fetched users list.",
+            "create": "Created user: {target}.",
+            "delete": "Deleted user: {target}.",
+            "set_password": "Updated password for user: {target}.",
+            "set_type": "Updated user type for: {target}.",
+        },
+    ),
+    "update_tools": (
+        {
+            "list_updates": "تم جلب قائمة تحديثات ويندوز.",
+            "last_update_time": "تم جلب وقت آخر تحديث للنظام.",
+            "check_updates": "تم بدء فحص تحديثات ويندوز.",
+            "winsxs_cleanup": "تم تشغيل تنظيف ملفات WinSxS.",
+            "stop_background_updates": "تم إيقاف خدمات تحديثات ويندوز في الخلفية.",
+            "install_kb": "تم إرسال طلب تثبيت التحديث: {target}.",
+        },
+        {
+            "list_updates": "Fetched Windows updates list.",
+            "last_update_time": "Fetched last system update time.",
+            "check_updates": "Started Windows Update scan.",
+            "winsxs_cleanup": "Started WinSxS cleanup.",
+            "stop_background_updates": "Stopped background Windows Update services.",
+            "install_kb": "Sent install request for update: {target}.",
+        },
+    ),
+    "remote_tools": (
+        {
+            "rdp_open": "تم فتح Remote Desktop.",
+            "vpn_connect": "تمت محاولة الاتصال بـ VPN: {target}.",
+            "vpn_disconnect": "تم تنفيذ قطع اتصال VPN.",
+        },
+        {
+            "rdp_open": "Opened Remote Desktop.",
+            "vpn_connect": "Attempted VPN connect: {target}.",
+            "vpn_disconnect": "Executed VPN disconnect.",
+        },
+    ),
+    "disk_tools": (
+        {
+            "smart_status": "تم جلب حالة صحة الأقراص (SMART).",
+            "temp_files_clean": "تم تنظيف الملفات المؤقتة.",
+            "prefetch_clean": "تم تنظيف ملفات Prefetch.",
+            "logs_clean": "تم تنظيف سجلات ويندوز.",
+            "disk_usage": "تم جلب استهلاك ومساحة الأقراص.",
+            "defrag": "تم بدء إلغاء التجزئة للقرص: {target}.",
+            "chkdsk_scan": "تم بدء فحص القرص: {target}.",
+            "safe_eject": "تم إخراج وسيط التخزين بأمان.",
+        },
+        {
+            "smart_status": "Fetched disk SMART/health status.",
+            "temp_files_clean": "Cleaned temp files.",
+            "prefetch_clean": "Cleaned Prefetch files.",
+            "logs_clean": "Cleaned Windows logs.",
+            "disk_usage": "Fetched disk usage and free space.",
+            "defrag": "Started defrag on drive: {target}.",
+            "chkdsk_scan": "Started disk check on drive: {target}.",
+            "safe_eject": "Safely ejected storage device.",
+        },
+    ),
+    "registry_tools": (
+        {
+            "query": "تم الاستعلام عن السجل: {target}.",
+            "add_key": "تمت إضافة مفتاح سجل: {target}.",
+            "delete_key": "تم حذف مفتاح سجل: {target}.",
+            "set_value": "تم تحديث قيمة في السجل: {target}.",
+            "backup": "تم إنشاء نسخة احتياطية للسجل.",
+            "restore": "تم تنفيذ استعادة نسخة السجل.",
+        },
+        {
+            "query": "Queried registry key: {target}.",
+            "add_key": "Added registry key: {target}.",
+            "delete_key": "Deleted registry key: {target}.",
+            "set_value": "Updated registry value under: {target}.",
+            "backup": "Created registry backup.",
+            "restore": "Executed registry restore.",
+        },
+    ),
+}
+# Target param and fallback wording per action, as (param, arabic default, english default).
+_TARGET_PARAMS: dict[str, tuple[str, str, str]] = {
+    "service_tools": ("name", "المحددة", "target service"),
+    "startup_tools": ("name", "المحدد", "target item"),
+    "task_tools": ("name", "المحددة", "target task"),
+    "user_tools": ("username", "المحدد", "target user"),
+    "update_tools": ("target", "KB المطلوب", "target KB"),
+    "remote_tools": ("host", "المحدد", "target connection"),
+    "disk_tools": ("drive", "C:", "C:"),
+    "registry_tools": ("key", "المفتاح المحدد", "target key"),
+}
+# Modes whose missing target reads as something new rather than "the selected one".
+_NEW_TARGET_DEFAULTS: dict[tuple[str, str], tuple[str, str]] = {
+    ("task_tools", "create"): ("جديدة", "new task"),
+    ("user_tools", "create"): ("الجديد", "new user"),
+}
+# Settings read only by the loop itself; changing them does not require a new AgentRouter.
+_LOOP_ONLY_SETTINGS = frozenset(
+    {
+        "ai_response_composer_enabled",
+        "ai_response_style",
+        "ai_response_max_tokens",
+        "assistant_display_name_ar",
+        "welcome_hint_enabled",
+    }
+)
+# Longest string kept per composer event field; the fallback text carries the full reply.
+_MAX_EVENT_FIELD = 512
+# Trailing events and fallback characters handed to the response composer.
+_COMPOSER_EVENT_WINDOW = 24
+_COMPOSER_FALLBACK_CHARS = 2200
+
+
+def _shrink_event(event: dict) -> dict:
+    """Clip oversized string fields of a composer event before it is serialized."""
+    if not any(isinstance(v, str) and len(v) > _MAX_EVENT_FIELD for v in event.values()):
+        return event
+    return {
+        k: (v[:_MAX_EVENT_FIELD] if isinstance(v, str) else v) for k, v in event.items()
+    }
+
+
+@lru_cache(maxsize=8)
+def _compose_system_prompt(style: str) -> str:
+    """System prompt for the response composer; only the style line varies."""
+    return (
+        "You are Mudabbir response composer.\n"
+        "Write a natural, elegant user-facing reply in the same language as the user.\n"
+        "Be factual. Keep concrete numbers/paths/status exactly when available.\n"
+        "Never output raw tool payload JSON, code, or markdown fences.\n"
+        "Do not invent actions that were not executed.\n"
+        f"Style mode: {style}."
+    )
+
+
+class _StreamCoalescer:
+    """Batch streamed text into fewer outbound chunks for one reply.
+
+    The first ``STREAM_PASSTHROUGH_CHUNKS`` writes are published as-is; after
+    that text is buffered and flushed once ``STREAM_COALESCE_CHARS`` are
+    pending or ``STREAM_COALESCE_INTERVAL_SECONDS`` after the first buffered
+    write, whichever comes first. Call ``close()`` before the stream end marker.
+    """
+
+    def __init__(self, bus: Any, channel: Channel, chat_id: str):
+        self._bus = bus
+        self._channel = channel
+        self._chat_id = chat_id
+        self._buffer: list[str] = []
+        self._buffered = 0
+        self._writes = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_flush: asyncio.Task | None = None
+        # Serializes flushes from the stream and the timer so chunks stay in order.
+        self._lock = asyncio.Lock()
+
+    async def write(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        self._writes += 1
+        if self._writes <= STREAM_PASSTHROUGH_CHUNKS or self._buffered >= STREAM_COALESCE_CHARS:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                STREAM_COALESCE_INTERVAL_SECONDS, self._on_timer
+            )
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_flush = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            await self._bus.publish_outbound(
+                OutboundMessage(
+                    channel=self._channel,
+                    chat_id=self._chat_id,
+                    content=text,
+                    is_stream_chunk=True,
+                )
+            )
+
+    async def close(self) -> None:
+        """Publish anything still buffered and wait for a pending timer flush."""
+        await self.flush()
+        if self._timer_flush is not None:
+            await self._timer_flush
+            self._timer_flush = None
+
+
+def _tool_name(metadata: dict) -> str:
+    """Tool name reported by a tool_use/tool_result chunk."""
+    return metadata.get("name") or metadata.get("tool", "unknown")
+
+
+@dataclass(slots=True)
+class _StreamTurn:
+    """Per-reply state shared by the stream chunk handlers."""
+
+    message: InboundMessage
+    session_key: str
+    use_ai_composer: bool
+    stream: _StreamCoalescer
+    # Only filled when use_ai_composer is set; the composer reads just the latest events
+    composition_events: deque[dict] = field(
+        default_factory=lambda: deque(maxlen=_COMPOSER_EVENT_WINDOW)
+    )
+    # Reply text pieces, joined once when the stream ends
+    response_parts: list[str] = field(default_factory=list)
+    # Thinking text held back until THINKING_COALESCE_CHARS are pending
+    thinking_parts: list[str] = field(default_factory=list)
+    thinking_chars: int = 0
+    thinking_started: bool = False
 
 
 class StreamTimeoutError(TimeoutError):
@@ -55,18 +1139,765 @@ async def _iter_with_timeout(
     quickly) and a longer timeout for subsequent items (to allow for tool
     execution, file operations, etc.).
     """
-    ait = aiter.__aiter__()
-    first = True
+    next_item = aiter.__aiter__().__anext__
+    # asyncio.timeout arms a loop timer instead of wrapping each __anext__
+    # in a helper task the way wait_for does.
+    try:
+        async with asyncio.timeout(first_timeout):
+            item = await next_item()
+    except TimeoutError:
+        raise StreamTimeoutError(phase="first", timeout_seconds=first_timeout) from None
+    except StopAsyncIteration:
+        return
+    yield item
+
     while True:
         try:
-            t = first_timeout if first else timeout
-            yield await asyncio.wait_for(ait.__anext__(), timeout=t)
-            first = False
+            async with asyncio.timeout(timeout):
+                item = await next_item()
         except TimeoutError:
-            phase = "first" if first else "stream"
-            raise StreamTimeoutError(phase=phase, timeout_seconds=t) from None
+            raise StreamTimeoutError(phase="stream", timeout_seconds=timeout) from None
         except StopAsyncIteration:
-            break
+            return
+        yield item
+
+
+# Fast-path reply formatters: each turns the parsed DesktopTool result for one action
+# into a user-facing sentence, or returns None to use the generic acknowledgement.
+def _reply_volume(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "get" and isinstance(parsed, dict):
+        level = parsed.get("level_percent")
+        muted = bool(parsed.get("muted", False))
+        if level is not None:
+            if arabic:
+                base = f"مستوى الصوت الحالي: {int(level)}% {'(مكتوم)' if muted else ''}".strip()
+                return f"{base} تريد أرفعه أو أخفضه؟"
+            return f"Current volume is {int(level)}%{' (muted)' if muted else ''}. Want it higher or lower?"
+    return None
+
+
+def _reply_brightness(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "get" and isinstance(parsed, dict):
+        level = parsed.get("brightness_percent")
+        if level is not None:
+            if arabic:
+                return f"مستوى السطوع الحالي: {int(level)}%. تريد أضبطه؟"
+            return f"Current brightness is {int(level)}%. Want me to tune it?"
+    return None
+
+
+def _reply_system_info(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "battery" and isinstance(parsed, dict):
+        available = bool(parsed.get("available", False))
+        percent = parsed.get("percent")
+        plugged = parsed.get("plugged")
+        if available and percent is not None:
+            if arabic:
+                state = "موصول بالشاحن" if plugged else "على البطارية"
+                return f"نسبة البطارية الحالية: {int(float(percent))}% ({state})."
+            state = "plugged in" if plugged else "on battery"
+            return f"Current battery is {int(float(percent))}% ({state})."
+        if arabic:
+            return "لا يمكن قراءة معلومات البطارية على هذا الجهاز حالياً."
+        return "Battery information is not available on this machine right now."
+    return None
+
+
+def _reply_clipboard_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"history", "clipboard_history"}:
+        return "تم فتح سجل الحافظة (Win+V)." if arabic else "Opened Clipboard History (Win+V)."
+    return None
+
+
+def _reply_network_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"open_network_settings", "settings"}:
+        return "تم فتح إعدادات الشبكة." if arabic else "Opened network settings."
+    if mode == "connect_wifi" and isinstance(parsed, dict):
+        requested = str(parsed.get("requested_ssid") or params.get("host") or "").strip()
+        connected = parsed.get("connected")
+        actual = str(parsed.get("connected_ssid") or "").strip()
+        if arabic:
+            if connected is True:
+                return f"📶 تم الاتصال بالشبكة: {actual or requested}. تريد أعمل فحص اتصال سريع؟"
+            if connected is False:
+                return f"⚠️ ما تم الاتصال بـ {requested}."
+            return f"📶 تم إرسال طلب الاتصال بـ {requested}."
+        if connected is True:
+            return f"📶 Connected to Wi-Fi: {actual or requested}. Want a quick connectivity check?"
+        if connected is False:
+            return f"⚠️ Could not connect to Wi-Fi: {requested}."
+        return f"📶 Sent Wi-Fi connect request: {requested}."
+    return None
+
+
+def _reply_open_settings_page(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    page = str(params.get("page", "")).strip().lower()
+    msg = _SETTINGS_PAGE_MESSAGES[0 if arabic else 1].get(page)
+    if msg:
+        return msg
+    return "تم فتح صفحة الإعدادات." if arabic else "Opened Settings page."
+
+
+def _reply_microphone_control(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    muted = bool(parsed.get("muted")) if isinstance(parsed, dict) else None
+    if arabic:
+        if mode in {"get", "status"}:
+            if muted is True:
+                return "🎤 حالة الميكروفون: مكتوم."
+            if muted is False:
+                return "🎤 حالة الميكروفون: غير مكتوم."
+            return "🎤 تم فحص حالة الميكروفون."
+        if muted is True:
+            return "🎤 تم كتم الميكروفون. إذا بدك بفك الكتم فورًا."
+        if muted is False:
+            return "🎤 تم إلغاء كتم الميكروفون. تريد أتأكد من الحالة؟"
+        return "🎤 تم تنفيذ أمر الميكروفون."
+    if mode in {"get", "status"}:
+        if muted is True:
+            return "🎤 Microphone status: muted."
+        if muted is False:
+            return "🎤 Microphone status: unmuted."
+        return "🎤 Checked microphone status."
+    if muted is True:
+        return "🎤 Microphone muted. I can unmute it right away."
+    if muted is False:
+        return "🎤 Microphone unmuted. Want me to verify status?"
+    return "🎤 Microphone command executed."
+
+
+def _reply_process_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"top_cpu", "top_ram"} and isinstance(parsed, dict):
+        items = parsed.get("items") if isinstance(parsed.get("items"), list) else []
+        top = items[0] if items else {}
+        name = str(top.get("name") or "").strip()
+        pid = top.get("pid")
+        value = top.get("cpu" if mode == "top_cpu" else "ram_mb")
+        if name and value is not None:
+            if arabic:
+                metric = "CPU" if mode == "top_cpu" else "RAM"
+                unit = "%" if mode == "top_cpu" else " MB"
+                return f"أعلى عملية حالياً: {name} (PID: {pid}) - {metric}: {value}{unit}."
+            metric = "CPU" if mode == "top_cpu" else "RAM"
+            unit = "%" if mode == "top_cpu" else " MB"
+            return f"Top process now: {name} (PID: {pid}) - {metric}: {value}{unit}."
+    if mode == "app_memory_total" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        process_count = int(parsed.get("process_count") or 0)
+        total_ram_mb = parsed.get("total_ram_mb")
+        if query and total_ram_mb is not None:
+            if arabic:
+                return f"{query}: {process_count} عملية، الإجمالي {total_ram_mb} MB."
+            return f"{query}: {process_count} processes, total {total_ram_mb} MB."
+    if mode == "app_process_count_total" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        process_count = int(parsed.get("process_count") or 0)
+        total_ram_mb = parsed.get("total_ram_mb")
+        if query and total_ram_mb is not None:
+            if arabic:
+                return f"{query}: عدد العمليات {process_count}، والمجموع {total_ram_mb} MB."
+            return f"{query}: {process_count} processes, combined memory {total_ram_mb} MB."
+    if mode == "app_cpu_total" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        process_count = int(parsed.get("process_count") or 0)
+        total_cpu = parsed.get("total_cpu_percent")
+        if query and total_cpu is not None:
+            if arabic:
+                return f"إجمالي CPU لتطبيق {query}: {total_cpu}% عبر {process_count} عملية."
+            return f"Total CPU for app {query}: {total_cpu}% across {process_count} processes."
+    if mode == "app_disk_total" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        process_count = int(parsed.get("process_count") or 0)
+        total_disk_mb = parsed.get("total_disk_mb")
+        if query and total_disk_mb is not None:
+            if arabic:
+                return f"إجمالي نشاط القرص لتطبيق {query}: {total_disk_mb} MB عبر {process_count} عملية."
+            return f"Total disk activity for app {query}: {total_disk_mb} MB across {process_count} processes."
+    if mode == "app_network_total" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        process_count = int(parsed.get("process_count") or 0)
+        total_connections = int(parsed.get("total_connections") or 0)
+        established_connections = int(parsed.get("established_connections") or 0)
+        unique_remote_ips = int(parsed.get("unique_remote_ips") or 0)
+        if query:
+            if arabic:
+                return (
+                    f"نشاط الشبكة لتطبيق {query}: {total_connections} اتصال "
+                    f"(منها {established_connections} نشط) عبر {process_count} عملية، "
+                    f"ومع {unique_remote_ips} عناوين IP بعيدة."
+                )
+            return (
+                f"Network activity for app {query}: {total_connections} connections "
+                f"({established_connections} established) across {process_count} processes, "
+                f"with {unique_remote_ips} unique remote IPs."
+            )
+    if mode == "app_resource_summary" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        if query:
+            process_count = int(parsed.get("process_count") or 0)
+            total_ram_mb = parsed.get("total_ram_mb")
+            total_cpu = parsed.get("total_cpu_percent")
+            total_disk_mb = parsed.get("total_disk_mb")
+            total_connections = int(parsed.get("total_connections") or 0)
+            if arabic:
+                return (
+                    f"ملخص {query}: RAM={total_ram_mb} MB، CPU={total_cpu}%، "
+                    f"Disk={total_disk_mb} MB، Network={total_connections} اتصال، "
+                    f"وعبر {process_count} عملية."
+                )
+            return (
+                f"Summary for {query}: RAM={total_ram_mb} MB, CPU={total_cpu}%, "
+                f"Disk={total_disk_mb} MB, Network={total_connections} connections, "
+                f"across {process_count} processes."
+            )
+    if mode == "app_compare" and isinstance(parsed, dict):
+        left = parsed.get("left") if isinstance(parsed.get("left"), dict) else {}
+        right = parsed.get("right") if isinstance(parsed.get("right"), dict) else {}
+        winners = parsed.get("winners") if isinstance(parsed.get("winners"), dict) else {}
+        recommendations = parsed.get("recommendations") if isinstance(parsed.get("recommendations"), list) else []
+        lq = str(left.get("query") or params.get("name") or "").strip()
+        rq = str(right.get("query") or params.get("target") or "").strip()
+        if lq and rq:
+            lram = left.get("total_ram_mb")
+            rram = right.get("total_ram_mb")
+            lcpu = left.get("total_cpu_percent")
+            rcpu = right.get("total_cpu_percent")
+            ldisk = left.get("total_disk_mb")
+            rdisk = right.get("total_disk_mb")
+            lnet = left.get("total_connections")
+            rnet = right.get("total_connections")
+            ram_w = str(winners.get("ram") or "equal")
+            cpu_w = str(winners.get("cpu") or "equal")
+            disk_w = str(winners.get("disk") or "equal")
+            net_w = str(winners.get("network") or "equal")
+            rec_line = ", ".join(str(r) for r in recommendations[:4]) if recommendations else ""
+            practical_tips: list[str] = []
+            for rec in recommendations:
+                token = str(rec or "").strip().lower()
+                if token.startswith("ram_hotspot="):
+                    appn = rec.split("=", 1)[1] if "=" in rec else "this app"
+                    practical_tips.append(
+                        f"خفّف RAM بإغلاق نوافذ/تبويبات {appn} غير الضرورية"
+                        if arabic
+                        else f"Reduce RAM first by closing unnecessary {appn} windows/tabs"
+                    )
+                elif token.startswith("cpu_hotspot="):
+                    appn = rec.split("=", 1)[1] if "=" in rec else "this app"
+                    practical_tips.append(
+                        f"خفّف CPU بإيقاف مهام الخلفية داخل {appn}"
+                        if arabic
+                        else f"Reduce CPU by stopping heavy background tasks in {appn}"
+                    )
+                elif token.startswith("disk_hotspot="):
+                    appn = rec.split("=", 1)[1] if "=" in rec else "this app"
+                    practical_tips.append(
+                        f"خفّف Disk بإيقاف تنزيلات/فهرسة {appn} مؤقتاً"
+                        if arabic
+                        else f"Reduce Disk by pausing downloads/indexing in {appn}"
+                    )
+                elif token.startswith("network_hotspot="):
+                    appn = rec.split("=", 1)[1] if "=" in rec else "this app"
+                    practical_tips.append(
+                        f"خفّف Network بتقليل مزامنة أو اتصالات {appn}"
+                        if arabic
+                        else f"Reduce Network by limiting sync/connections in {appn}"
+                    )
+            practical = " | ".join(practical_tips[:2])
+            if arabic:
+                return (
+                    f"مقارنة {lq} vs {rq}: RAM {lram}/{rram} MB، CPU {lcpu}/{rcpu}%، "
+                    f"Disk {ldisk}/{rdisk} MB، Network {lnet}/{rnet}. "
+                    f"الأثقل: RAM={ram_w}، CPU={cpu_w}، Disk={disk_w}، Network={net_w}."
+                    + (f" التوصية: {rec_line}." if rec_line else "")
+                    + (f" إجراء عملي: {practical}." if practical else "")
+                )
+            return (
+                f"Comparison {lq} vs {rq}: RAM {lram}/{rram} MB, CPU {lcpu}/{rcpu}%, "
+                f"Disk {ldisk}/{rdisk} MB, Network {lnet}/{rnet}. "
+                f"Heavier: RAM={ram_w}, CPU={cpu_w}, Disk={disk_w}, Network={net_w}."
+                + (f" Recommendation: {rec_line}." if rec_line else "")
+                + (f" Practical action: {practical}." if practical else "")
+            )
+    if mode == "app_reduce_ram_plan" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        total_ram_mb = parsed.get("total_ram_mb")
+        process_count = int(parsed.get("process_count") or 0)
+        reclaimable = parsed.get("reclaimable_mb_estimate")
+        top = parsed.get("top_processes") if isinstance(parsed.get("top_processes"), list) else []
+        top_hint = ""
+        if top:
+            p0 = top[0] if isinstance(top[0], dict) else {}
+            p1 = top[1] if len(top) > 1 and isinstance(top[1], dict) else {}
+            n0 = str(p0.get("name") or "")
+            m0 = p0.get("ram_mb")
+            n1 = str(p1.get("name") or "")
+            m1 = p1.get("ram_mb")
+            if n0 and m0 is not None:
+                top_hint = f" أكبر عملية: {n0} ({m0} MB)." if arabic else f" Top process: {n0} ({m0} MB)."
+            if n1 and m1 is not None:
+                top_hint += (
+                    f" ثاني أكبر: {n1} ({m1} MB)."
+                    if arabic
+                    else f" Second largest: {n1} ({m1} MB)."
+                )
+        if query and total_ram_mb is not None:
+            if arabic:
+                return (
+                    f"خطة تخفيف RAM لتطبيق {query}: الإجمالي {total_ram_mb} MB عبر {process_count} عملية. "
+                    f"تقدير الاسترجاع السريع: {reclaimable} MB."
+                    f"{top_hint} الإجراءات: اغلاق النوافذ/التبويبات الزائدة ثم إعادة تشغيل التطبيق إذا لزم."
+                )
+            return (
+                f"RAM reduction plan for {query}: total {total_ram_mb} MB across {process_count} processes. "
+                f"Quick reclaim estimate: {reclaimable} MB."
+                f"{top_hint} Actions: close extra windows/tabs, then restart app if needed."
+            )
+    if mode == "app_reduce_ram_execute" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        killed_count = int(parsed.get("killed_count") or 0)
+        protected_name = str(parsed.get("protected_name") or "")
+        protected_pid = parsed.get("protected_pid")
+        dry_run = bool(parsed.get("dry_run"))
+        max_kill = parsed.get("max_kill")
+        if query:
+            if arabic:
+                return (
+                    (f"معاينة تخفيف RAM لتطبيق {query}. " if dry_run else f"تم تنفيذ تخفيف RAM لتطبيق {query}. ")
+                    + f"تم {'تحديد' if dry_run else 'إغلاق'} {killed_count} عملية ثانوية"
+                    + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
+                    + f"، مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
+                )
+            return (
+                (f"Previewed RAM reduction for {query}. " if dry_run else f"Executed RAM reduction for {query}. ")
+                + f"{'Selected' if dry_run else 'Closed'} {killed_count} secondary processes"
+                + (f" (max_kill={max_kill})" if max_kill is not None else "")
+                + f", while keeping main process {protected_name} (PID: {protected_pid})."
+            )
+    if mode == "app_reduce_cpu_plan" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        total_cpu = parsed.get("total_cpu_percent")
+        process_count = int(parsed.get("process_count") or 0)
+        reclaimable = parsed.get("reclaimable_cpu_estimate")
+        if query and total_cpu is not None:
+            if arabic:
+                return (
+                    f"خطة تخفيف CPU لتطبيق {query}: الإجمالي {total_cpu}% عبر {process_count} عملية. "
+                    f"تقدير التخفيض السريع: {reclaimable}%."
+                )
+            return (
+                f"CPU reduction plan for {query}: total {total_cpu}% across {process_count} processes. "
+                f"Quick reduction estimate: {reclaimable}%."
+            )
+    if mode == "app_reduce_cpu_execute" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        killed_count = int(parsed.get("killed_count") or 0)
+        protected_name = str(parsed.get("protected_name") or "")
+        protected_pid = parsed.get("protected_pid")
+        threshold = parsed.get("threshold")
+        dry_run = bool(parsed.get("dry_run"))
+        if query:
+            if arabic:
+                return (
+                    (f"معاينة تخفيف CPU لتطبيق {query} (عتبة {threshold}%): " if dry_run else f"تم تنفيذ تخفيف CPU لتطبيق {query} (عتبة {threshold}%): ")
+                    + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
+                    + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
+                )
+            return (
+                (f"Previewed CPU reduction for {query} (threshold {threshold}%): " if dry_run else f"Executed CPU reduction for {query} (threshold {threshold}%): ")
+                + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
+                + f"while keeping main process {protected_name} (PID: {protected_pid})."
+            )
+    if mode == "app_reduce_disk_plan" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        total_disk = parsed.get("total_disk_mb")
+        process_count = int(parsed.get("process_count") or 0)
+        reclaimable = parsed.get("reclaimable_disk_estimate")
+        if query and total_disk is not None:
+            if arabic:
+                return (
+                    f"خطة تخفيف Disk لتطبيق {query}: الإجمالي {total_disk} MB عبر {process_count} عملية. "
+                    f"تقدير التخفيض السريع: {reclaimable} MB."
+                )
+            return (
+                f"Disk reduction plan for {query}: total {total_disk} MB across {process_count} processes. "
+                f"Quick reduction estimate: {reclaimable} MB."
+            )
+    if mode == "app_reduce_disk_execute" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        killed_count = int(parsed.get("killed_count") or 0)
+        protected_name = str(parsed.get("protected_name") or "")
+        protected_pid = parsed.get("protected_pid")
+        threshold = parsed.get("threshold")
+        dry_run = bool(parsed.get("dry_run"))
+        if query:
+            if arabic:
+                return (
+                    (f"معاينة تخفيف Disk لتطبيق {query} (عتبة {threshold} MB): " if dry_run else f"تم تنفيذ تخفيف Disk لتطبيق {query} (عتبة {threshold} MB): ")
+                    + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
+                    + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
+                )
+            return (
+                (f"Previewed Disk reduction for {query} (threshold {threshold} MB): " if dry_run else f"Executed Disk reduction for {query} (threshold {threshold} MB): ")
+                + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
+                + f"while keeping main process {protected_name} (PID: {protected_pid})."
+            )
+    if mode == "app_reduce_network_plan" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        total_conn = int(parsed.get("total_connections") or 0)
+        process_count = int(parsed.get("process_count") or 0)
+        reclaimable = int(parsed.get("reclaimable_network_estimate") or 0)
+        if query:
+            if arabic:
+                return (
+                    f"خطة تخفيف Network لتطبيق {query}: الإجمالي {total_conn} اتصال عبر {process_count} عملية. "
+                    f"تقدير التخفيض السريع: {reclaimable} اتصال."
+                )
+            return (
+                f"Network reduction plan for {query}: total {total_conn} connections across {process_count} processes. "
+                f"Quick reduction estimate: {reclaimable} connections."
+            )
+    if mode == "app_reduce_network_execute" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        killed_count = int(parsed.get("killed_count") or 0)
+        protected_name = str(parsed.get("protected_name") or "")
+        protected_pid = parsed.get("protected_pid")
+        threshold = parsed.get("threshold")
+        dry_run = bool(parsed.get("dry_run"))
+        if query:
+            if arabic:
+                return (
+                    (f"معاينة تخفيف Network لتطبيق {query} (عتبة {threshold} اتصالات): " if dry_run else f"تم تنفيذ تخفيف Network لتطبيق {query} (عتبة {threshold} اتصالات): ")
+                    + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
+                    + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
+                )
+            return (
+                (f"Previewed Network reduction for {query} (threshold {threshold} connections): " if dry_run else f"Executed Network reduction for {query} (threshold {threshold} connections): ")
+                + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
+                + f"while keeping main process {protected_name} (PID: {protected_pid})."
+            )
+    if mode == "kill_high_cpu" and isinstance(parsed, dict):
+        count = int(parsed.get("count") or 0)
+        threshold = parsed.get("threshold")
+        dry_run = bool(parsed.get("dry_run"))
+        max_kill = parsed.get("max_kill")
+        if arabic:
+            return (
+                (f"معاينة kill_high_cpu عند عتبة {threshold}%: " if dry_run else f"تم تنفيذ kill_high_cpu عند عتبة {threshold}%: ")
+                + f"{'سيتم' if dry_run else 'تم'} التعامل مع {count} عملية"
+                + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
+                + "."
+            )
+        return (
+            (f"Previewed kill_high_cpu at threshold {threshold}%: " if dry_run else f"Executed kill_high_cpu at threshold {threshold}%: ")
+            + f"{'would handle' if dry_run else 'handled'} {count} process(es)"
+            + (f" (max_kill={max_kill})" if max_kill is not None else "")
+            + "."
+        )
+    if mode == "monitor_until_exit" and isinstance(parsed, dict):
+        app_name = str(parsed.get("name") or params.get("name") or "").strip()
+        exited = bool(parsed.get("exited"))
+        elapsed = parsed.get("elapsed_seconds")
+        timeout = parsed.get("timeout_seconds")
+        notified = bool(parsed.get("notified"))
+        if arabic:
+            if exited:
+                if notified:
+                    return f"تمت مراقبة {app_name or 'العملية'} وانغلقت بعد {elapsed} ثانية. أرسلت تنبيه."
+                return f"تمت مراقبة {app_name or 'العملية'} وانغلقت بعد {elapsed} ثانية."
+            return f"راقبت {app_name or 'العملية'} لمدة {timeout} ثانية ولسا شغالة."
+        if exited:
+            if notified:
+                return f"Monitored {app_name or 'process'} and it exited after {elapsed}s. Alert sent."
+            return f"Monitored {app_name or 'process'} and it exited after {elapsed}s."
+        return f"Monitored {app_name or 'process'} for {timeout}s and it is still running."
+    if mode == "path_by_name" and isinstance(parsed, dict):
+        query = str(parsed.get("query") or params.get("name") or "").strip()
+        items = parsed.get("items") if isinstance(parsed.get("items"), list) else []
+        first = items[0] if items else {}
+        ppath = str(first.get("path") or "").strip()
+        if ppath:
+            if arabic:
+                return f"مسار تشغيل {query or 'العملية'}: {ppath}"
+            return f"Executable path for {query or 'process'}: {ppath}"
+    if mode == "app_reduce" and isinstance(parsed, dict):
+        stage = str(parsed.get("stage") or params.get("stage") or "").strip().lower()
+        resource = str(parsed.get("resource") or params.get("resource") or "resource").strip().lower()
+        if arabic:
+            if stage == "plan":
+                return f"🧠 خطة تخفيف {resource} جاهزة."
+            return f"✅ تم تنفيذ تخفيف {resource}."
+        if stage == "plan":
+            return f"🧠 {resource} reduction plan is ready."
+        return f"✅ {resource} reduction executed."
+    return None
+
+
+def _target_message(action: str, mode: str, params: dict, arabic: bool, **extra: str) -> str | None:
+    """Fill the action's acknowledgement template for ``mode`` with its target param."""
+    template = _TARGET_MESSAGES[action][0 if arabic else 1].get(mode)
+    if template is None:
+        return None
+    param, default_ar, default_en = _TARGET_PARAMS[action]
+    defaults = _NEW_TARGET_DEFAULTS.get((action, mode))
+    if defaults is not None:
+        default_ar, default_en = defaults
+    target = str(params.get(param, "") or "").strip()
+    msg = template.format(target=target or (default_ar if arabic else default_en), **extra)
+    followup = _ACTION_FOLLOWUPS.get((action, mode))
+    if followup:
+        return f"{msg} {followup[0 if arabic else 1]}"
+    return msg
+
+
+def _make_mode_handler(action: str) -> Callable[[str, dict, Any, bool], str | None]:
+    """Build a fast-path reply for an action answered purely from ``_TARGET_MESSAGES``."""
+
+    def _reply(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+        return _target_message(action, mode, params, arabic)
+
+    return _reply
+
+
+def _reply_service_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    startup = str(params.get("startup", "") or "").strip()
+    return _target_message(
+        "service_tools",
+        mode,
+        params,
+        arabic,
+        startup=startup or ("المطلوب" if arabic else "target mode"),
+    )
+
+
+def _reply_performance_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"total_cpu_percent", "total_ram_percent"} and isinstance(parsed, dict):
+        percent = parsed.get("percent")
+        if percent is not None:
+            if arabic:
+                label = "المعالج" if mode == "total_cpu_percent" else "الرام"
+                return f"نسبة الاستهلاك الحالية ({label}): {percent}%."
+            label = "CPU" if mode == "total_cpu_percent" else "RAM"
+            return f"Current {label} usage: {percent}%."
+    return None
+
+
+def _reply_vision_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "describe_screen":
+        preview = ""
+        summary = ""
+        top_app = ""
+        if isinstance(parsed, dict):
+            preview = str(parsed.get("ocr_text_preview") or "").strip()
+            summary = str(parsed.get("ui_summary") or "").strip()
+            top_app = str(parsed.get("top_app") or "").strip()
+        if arabic:
+            if summary or top_app:
+                msg = f"تحليل الشاشة جاهز{f'، الأعلى: {top_app}' if top_app else ''}."
+                if summary:
+                    msg += f" {summary[:180]}"
+                return msg
+            if preview:
+                return f"تحليل الشاشة جاهز. مقتطف: {preview[:180]}"
+            return "تحليل الشاشة جاهز."
+        if summary or top_app:
+            msg = f"Screen analyzed{f', top app: {top_app}' if top_app else ''}."
+            if summary:
+                msg += f" {summary[:180]}"
+            return msg
+        if preview:
+            return f"Screen analyzed. Preview: {preview[:180]}"
+        return "Screen analyzed."
+    if mode in {"locate_ui_target", "locate_element"} and isinstance(parsed, dict):
+        ok_locate = bool(parsed.get("ok", False))
+        target = str(parsed.get("matched_label") or params.get("target") or "").strip()
+        action_done = str(parsed.get("action_done") or params.get("interaction") or "").strip().lower()
+        if arabic:
+            if ok_locate:
+                if action_done == "click":
+                    return f"🖱️ تم العثور على {target or 'العنصر'} والنقر عليه."
+                if action_done == "double_click":
+                    return f"🖱️ تم العثور على {target or 'العنصر'} وعمل دبل كليك."
+                if action_done == "right_click":
+                    return f"🖱️ تم العثور على {target or 'العنصر'} وعمل كليك يمين."
+                return f"🖱️ تم العثور على {target or 'العنصر'} وتحريك الماوس إليه."
+            return f"ما لقيت {target or 'العنصر'} على الشاشة حالياً."
+        if ok_locate:
+            if action_done == "click":
+                return f"🖱️ Found {target or 'target'} and clicked it."
+            if action_done == "double_click":
+                return f"🖱️ Found {target or 'target'} and double-clicked it."
+            if action_done == "right_click":
+                return f"🖱️ Found {target or 'target'} and right-clicked it."
+            return f"🖱️ Found {target or 'target'} and moved the mouse to it."
+        return f"Couldn't find {target or 'the target'} on screen right now."
+    return None
+
+
+def _reply_screenshot_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    out_path = str(parsed.get("path") or "").strip() if isinstance(parsed, dict) else ""
+    if arabic:
+        if mode == "window_active":
+            return "📸 تم أخذ لقطة للنافذة الحالية." + (f"\n{out_path}" if out_path else "")
+        if mode == "full":
+            return "📸 تم أخذ لقطة للشاشة." + (f"\n{out_path}" if out_path else "")
+        if mode == "region":
+            return "📸 تم أخذ لقطة للمنطقة المحددة." + (f"\n{out_path}" if out_path else "")
+        if mode == "snipping_tool":
+            return "✂️ تم فتح أداة القص."
+    else:
+        if mode == "window_active":
+            return "📸 Captured the active window." + (f"\n{out_path}" if out_path else "")
+        if mode == "full":
+            return "📸 Captured the screen." + (f"\n{out_path}" if out_path else "")
+        if mode == "region":
+            return "📸 Captured the selected region." + (f"\n{out_path}" if out_path else "")
+        if mode == "snipping_tool":
+            return "✂️ Opened Snipping Tool."
+    return None
+
+
+def _reply_media_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"screen_record", "screen_record_short"} and isinstance(parsed, dict):
+        path = str(parsed.get("path") or "").strip()
+        if arabic:
+            return "🎥 تم تسجيل الشاشة." + (f"\n{path}" if path else "")
+        return "🎥 Screen recording completed." + (f"\n{path}" if path else "")
+    if mode == "camera_snapshot" and isinstance(parsed, dict):
+        path = str(parsed.get("path") or "").strip()
+        if arabic:
+            return "📸 تم التقاط صورة بالكاميرا." + (f"\n{path}" if path else "")
+        return "📸 Camera photo captured." + (f"\n{path}" if path else "")
+    if mode in {"mute_browser_only", "unmute_browser_only"} and isinstance(parsed, dict):
+        count = int(parsed.get("changed_sessions") or 0)
+        if arabic:
+            if mode == "mute_browser_only":
+                return f"🔇 تم كتم صوت المتصفح فقط ({count})."
+            return f"🔊 تم إلغاء كتم صوت المتصفح ({count})."
+        if mode == "mute_browser_only":
+            return f"🔇 Browser audio muted only ({count})."
+        return f"🔊 Browser audio unmuted ({count})."
+    if mode == "app_volume_set" and isinstance(parsed, dict):
+        app_name = str(parsed.get("name") or params.get("name") or "").strip()
+        level_value = parsed.get("level", params.get("level"))
+        count = int(parsed.get("changed_sessions") or 0)
+        if arabic:
+            return f"🔉 تم ضبط صوت {app_name or 'التطبيق'} على {level_value}% ({count})."
+        return f"🔉 Set {app_name or 'app'} volume to {level_value}% ({count})."
+    if mode in {"app_volume_up", "app_volume_down"} and isinstance(parsed, dict):
+        app_name = str(parsed.get("name") or params.get("name") or "").strip()
+        delta_value = int(parsed.get("delta") or params.get("level") or 10)
+        level_value = parsed.get("level")
+        count = int(parsed.get("changed_sessions") or 0)
+        if arabic:
+            direction = "رفع" if mode == "app_volume_up" else "خفض"
+            suffix = f" (صار {level_value}%)." if level_value is not None else "."
+            return f"🔉 تم {direction} صوت {app_name or 'التطبيق'} بمقدار {delta_value}% ({count}){suffix}"
+        direction = "Raised" if mode == "app_volume_up" else "Lowered"
+        suffix = f" (now {level_value}%)." if level_value is not None else "."
+        return f"🔉 {direction} {app_name or 'app'} by {delta_value}% ({count}){suffix}"
+    if mode in {"app_volume_mute", "app_volume_unmute"} and isinstance(parsed, dict):
+        app_name = str(parsed.get("name") or params.get("name") or "").strip()
+        count = int(parsed.get("changed_sessions") or 0)
+        if arabic:
+            if mode == "app_volume_mute":
+                return f"🔇 تم كتم {app_name or 'التطبيق'} ({count})."
+            return f"🔊 تم إلغاء كتم {app_name or 'التطبيق'} ({count})."
+        if mode == "app_volume_mute":
+            return f"🔇 Muted {app_name or 'app'} ({count})."
+        return f"🔊 Unmuted {app_name or 'app'} ({count})."
+    if mode == "now_playing_info" and isinstance(parsed, dict):
+        title = str(parsed.get("title") or "").strip()
+        artist = str(parsed.get("artist") or "").strip()
+        playback_status = str(parsed.get("playback_status") or "").strip()
+        app = str(parsed.get("app") or "").strip()
+        if arabic:
+            base = f"🎵 الآن: {title or 'غير معروف'}"
+            if artist:
+                base += f" - {artist}"
+            if playback_status:
+                base += f" ({playback_status})"
+            if app:
+                base += f"\nمن: {app}"
+            return base
+        base = f"🎵 Now playing: {title or 'Unknown title'}"
+        if artist:
+            base += f" - {artist}"
+        if playback_status:
+            base += f" ({playback_status})"
+        if app:
+            base += f"\nSource: {app}"
+        return base
+    return None
+
+
+def _reply_app_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "close_all_apps" and isinstance(parsed, dict):
+        count = int(parsed.get("count") or 0)
+        dry_run = bool(parsed.get("dry_run"))
+        max_kill = parsed.get("max_kill")
+        if arabic:
+            return (
+                ("معاينة إغلاق كل البرامج: " if dry_run else "تم تنفيذ إغلاق البرامج: ")
+                + f"{'سيتم' if dry_run else 'تم'} التأثير على {count} تطبيق"
+                + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
+                + "."
+            )
+        return (
+            ("Preview close-all-apps: " if dry_run else "Executed close-all-apps: ")
+            + f"{'would affect' if dry_run else 'affected'} {count} app(s)"
+            + (f" (max_kill={max_kill})" if max_kill is not None else "")
+            + "."
+        )
+    return None
+
+
+def _reply_shell_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode in {"list_shortcuts", "shortcuts", "hotkeys"} and isinstance(parsed, dict):
+        shortcuts = parsed.get("shortcuts") if isinstance(parsed.get("shortcuts"), dict) else {}
+        keys = list(shortcuts.keys())[:5]
+        if arabic:
+            if keys:
+                return f"⌨️ عندك {len(shortcuts)} اختصار. أهمها: {', '.join(keys)}."
+            return "⌨️ تم جلب قائمة الاختصارات."
+        if keys:
+            return f"⌨️ Found {len(shortcuts)} shortcuts. Top ones: {', '.join(keys)}."
+        return "⌨️ Shortcuts list fetched."
+    return None
+
+
+def _reply_automation_tools(mode: str, params: dict, parsed: Any, arabic: bool) -> str | None:
+    if mode == "tts_to_file" and isinstance(parsed, dict):
+        out_path = str(parsed.get("path") or "").strip()
+        if arabic:
+            return "🔊 تم إنشاء ملف صوتي." + (f"\n{out_path}" if out_path else "")
+        return "🔊 Audio file created." + (f"\n{out_path}" if out_path else "")
+    return None
+
+
+_FASTPATH_REPLIES: dict[str, Callable[[str, dict, Any, bool], str | None]] = {
+    "volume": _reply_volume,
+    "brightness": _reply_brightness,
+    "system_info": _reply_system_info,
+    "clipboard_tools": _reply_clipboard_tools,
+    "network_tools": _reply_network_tools,
+    "open_settings_page": _reply_open_settings_page,
+    "microphone_control": _reply_microphone_control,
+    "process_tools": _reply_process_tools,
+    "service_tools": _reply_service_tools,
+    "startup_tools": _make_mode_handler("startup_tools"),
+    "performance_tools": _reply_performance_tools,
+    "vision_tools": _reply_vision_tools,
+    "screenshot_tools": _reply_screenshot_tools,
+    "task_tools": _make_mode_handler("task_tools"),
+    "user_tools": _make_mode_handler("user_tools"),
+    "update_tools": _make_mode_handler("update_tools"),
+    "remote_tools": _make_mode_handler("remote_tools"),
+    "disk_tools": _make_mode_handler("disk_tools"),
+    "registry_tools": _make_mode_handler("registry_tools"),
+    "media_tools": _reply_media_tools,
+    "app_tools": _reply_app_tools,
+    "shell_tools": _reply_shell_tools,
+    "automation_tools": _reply_automation_tools,
+}
 
 
 class AgentLoop:
@@ -81,22 +1912,78 @@ class AgentLoop:
     def __init__(self):
         self.settings = get_settings()
         self.bus = get_message_bus()
-        self.memory = get_memory_manager()
-        self.context_builder = AgentContextBuilder(memory_manager=self.memory)
+        self._memory = get_memory_manager()
+        self.context_builder = AgentContextBuilder(memory_manager=self._memory)
 
         # Agent Router handles backend selection
         self._router: AgentRouter | None = None
+        # Router-relevant settings the current router was built from
+        self._router_signature: dict[str, Any] | None = None
+        self._provider_models: dict[str, str] | None = None
+        self._llm_client: LLMClient | None = None
+        # OpenAI/Anthropic SDK client for one-shot completions, built from _llm_client
+        self._sdk_client: Any = None
+        # (provider, model, prompts, max_tokens, temperature) -> completion, LRU order
+        self._one_shot_cache: OrderedDict[tuple, str] = OrderedDict()
+        self._one_shot_slots = asyncio.Semaphore(ONE_SHOT_CONCURRENCY)
+        # Pooled HTTP client for one-shot Ollama completions (created lazily)
+        self._ollama_http: httpx.AsyncClient | None = None
+        # Shared DesktopTool for the Windows fast path (created lazily)
+        self._desktop_tool: Any = None
 
         # Concurrency controls
-        self._session_locks: dict[str, asyncio.Lock] = {}
+        # Per-session serialization: sessions with a message in flight, guarded by one condition
+        self._session_cond = asyncio.Condition()
+        self._session_inflight: set[str] = set()
         self._session_tasks: dict[str, asyncio.Task] = {}
+        # Raw → resolved session key for in-flight tasks (lets cancel skip the store)
+        self._resolved_keys: dict[str, str] = {}
         self._global_semaphore = asyncio.Semaphore(self.settings.max_concurrent_conversations)
         self._background_tasks: set[asyncio.Task] = set()
+        # (user_msg, assistant_msg, session_key, sender_id); workers start on first use
+        self._auto_learn_queue: asyncio.Queue[tuple[str, str, str, str | None]] | None = None
+        self._auto_learn_workers: list[asyncio.Task] = []
 
         self._running = False
-        self._pending_windows_dangerous: dict[str, dict[str, Any]] = {}
-        self._windows_session_state: dict[str, dict[str, Any]] = {}
-        get_command_handler().set_on_settings_changed(self._on_settings_changed)
+        # True while start() is inside _loop; shutdown then waits for it to exit
+        self._loop_active = False
+        # session -> (proposed_at, resolution); bounded and oldest-first for eviction
+        self._pending_windows_dangerous: OrderedDict[str, tuple[float, dict[str, Any]]] = (
+            OrderedDict()
+        )
+        self._pending_dangerous_cap = max(1, self.settings.max_concurrent_conversations) * 4
+        # session -> desktop follow-up context; least recently used evicted first
+        self._windows_session_state: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # Sessions already known to have history (or already welcomed) skip the store
+        # lookup; least recently used evicted first
+        self._seen_sessions: OrderedDict[str, None] = OrderedDict()
+        # Stream chunk type -> handler; one dict lookup per chunk instead of an elif ladder
+        self._chunk_handlers: dict[
+            str, Callable[[_StreamTurn, Any, dict], Awaitable[None]]
+        ] = {
+            "message": self._on_message_chunk,
+            "code": self._on_code_chunk,
+            "output": self._on_output_chunk,
+            "thinking": self._on_thinking_chunk,
+            "thinking_done": self._on_thinking_done_chunk,
+            "tool_use": self._on_tool_use_chunk,
+            "tool_result": self._on_tool_result_chunk,
+            "result": self._on_result_chunk,
+            "error": self._on_error_chunk,
+            "status": self._on_status_chunk,
+        }
+        self._cmd_handler = get_command_handler()
+        self._cmd_handler.set_on_settings_changed(self._on_settings_changed)
+
+    @property
+    def memory(self) -> MemoryManager:
+        return self._memory
+
+    @memory.setter
+    def memory(self, manager: MemoryManager) -> None:
+        # Hot reloads swap the manager; the context builder must read from the same one.
+        self._memory = manager
+        self.context_builder.memory = manager
 
     async def _llm_one_shot_text(
         self,
@@ -106,105 +1993,164 @@ class AgentLoop:
         max_tokens: int = 300,
         temperature: float = 0.2,
     ) -> str | None:
-        """Run a single non-streaming completion using current provider settings."""
+        """Run a single non-streaming completion using current provider settings.
+
+        Best effort: failures and completions slower than
+        ``COMPOSER_TIMEOUT_SECONDS`` return ``None`` so callers fall back.
+        Successful completions are reused for identical requests, and at most
+        ``ONE_SHOT_CONCURRENCY`` requests run at once; waiting for a slot counts
+        toward the timeout. For reuse, ``temperature`` is compared in 0.05 steps
+        and ``max_tokens`` in 64-token steps, so near-identical settings share a
+        completion; the provider always receives the exact values.
+        """
         try:
-            from Mudabbir.llm.client import resolve_llm_client
-
-            llm = resolve_llm_client(self.settings)
-
-            if llm.is_ollama:
-                import httpx
-
-                payload = {
-                    "model": llm.model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    "stream": False,
-                    "options": {
-                        "temperature": max(0.0, min(1.0, float(temperature))),
-                    },
-                }
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    resp = await client.post(f"{llm.ollama_host}/api/chat", json=payload)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    content = (
-                        (data.get("message") or {}).get("content", "")
-                        if isinstance(data, dict)
-                        else ""
-                    )
-                    return str(content or "").strip() or None
+            llm = self._get_llm_client()
+            key = (
+                llm.provider,
+                llm.model,
+                system_prompt,
+                user_prompt,
+                (int(max_tokens) + 63) // 64,
+                round(float(temperature) * 20),
+            )
+            cached = self._one_shot_cache.get(key)
+            if cached is not None:
+                self._one_shot_cache.move_to_end(key)
+                return cached
+            async with asyncio.timeout(COMPOSER_TIMEOUT_SECONDS), self._one_shot_slots:
+                text = await self._llm_one_shot_request(
+                    system_prompt=system_prompt,
+                    user_prompt=user_prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+            if text:
+                self._one_shot_cache[key] = text
+                if len(self._one_shot_cache) > ONE_SHOT_CACHE_SIZE:
+                    self._one_shot_cache.popitem(last=False)
+            return text
+        except TimeoutError:
+            logger.debug("Response composer timed out after %ss", COMPOSER_TIMEOUT_SECONDS)
+            return None
+        except Exception as exc:
+            logger.debug("Response composer completion failed: %s", exc)
+            return None
 
-            if llm.provider in {"openai", "openai_compatible", "gemini"}:
-                if llm.provider == "openai":
-                    from openai import AsyncOpenAI
+    async def _llm_one_shot_request(
+        self,
+        *,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        temperature: float,
+    ) -> str | None:
+        """Send one completion request to the configured provider."""
+        llm = self._get_llm_client()
+
+        if llm.is_ollama:
+            payload = {
+                "model": llm.model,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                "stream": False,
+                "options": {
+                    "temperature": max(0.0, min(1.0, float(temperature))),
+                    # Stop generating at the token budget like the SDK providers do.
+                    "num_predict": int(max_tokens),
+                },
+            }
+            resp = await self._get_ollama_client().post(
+                f"{llm.ollama_host}/api/chat", json=payload
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            content = (
+                (data.get("message") or {}).get("content", "")
+                if isinstance(data, dict)
+                else ""
+            )
+            return str(content or "").strip() or None
 
-                    client = AsyncOpenAI(
-                        api_key=llm.api_key,
-                        timeout=30.0,
-                        max_retries=1,
-                    )
-                else:
-                    client = llm.create_openai_client(timeout=30.0, max_retries=1)
-
-                request_temperature = max(0.0, min(1.0, float(temperature)))
-                if llm.is_gemini and str(llm.model).lower().startswith("gemini-3"):
-                    request_temperature = 1.0
-
-                response = await client.chat.completions.create(
-                    model=llm.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=request_temperature,
-                    max_tokens=int(max(80, min(1200, max_tokens))),
-                )
-                message = response.choices[0].message if response and response.choices else None
-                return str(getattr(message, "content", "") or "").strip() or None
+        client = self._get_sdk_client(llm)
+        if llm.provider in _OPENAI_SDK_PROVIDERS:
+            request_temperature = max(0.0, min(1.0, float(temperature)))
+            if llm.is_gemini and str(llm.model).lower().startswith("gemini-3"):
+                request_temperature = 1.0
 
-            client = llm.create_anthropic_client(timeout=30.0, max_retries=1)
-            response = await client.messages.create(
+            response = await client.chat.completions.create(
                 model=llm.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=request_temperature,
                 max_tokens=int(max(80, min(1200, max_tokens))),
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_prompt}],
             )
-            parts: list[str] = []
-            for block in getattr(response, "content", []) or []:
-                if getattr(block, "type", "") == "text":
-                    parts.append(str(getattr(block, "text", "") or ""))
-            text = "".join(parts).strip()
-            return text or None
-        except Exception as exc:
-            logger.debug("Response composer completion failed: %s", exc)
-            return None
+            message = response.choices[0].message if response and response.choices else None
+            return str(getattr(message, "content", "") or "").strip() or None
+
+        response = await client.messages.create(
+            model=llm.model,
+            max_tokens=int(max(80, min(1200, max_tokens))),
+            system=system_prompt,
+            messages=[{"role": "user", "content": user_prompt}],
+        )
+        parts: list[str] = []
+        for block in getattr(response, "content", []) or []:
+            if getattr(block, "type", "") == "text":
+                parts.append(str(getattr(block, "text", "") or ""))
+        text = "".join(parts).strip()
+        return text or None
+
+    def _get_sdk_client(self, llm: LLMClient) -> Any:
+        """Provider SDK client for one-shot completions, kept until settings change."""
+        if self._sdk_client is None:
+            if llm.provider == "openai":
+                from openai import AsyncOpenAI
+
+                self._sdk_client = AsyncOpenAI(
+                    api_key=llm.api_key,
+                    timeout=30.0,
+                    max_retries=1,
+                )
+            elif llm.provider in _OPENAI_SDK_PROVIDERS:
+                self._sdk_client = llm.create_openai_client(timeout=30.0, max_retries=1)
+            else:
+                self._sdk_client = llm.create_anthropic_client(timeout=30.0, max_retries=1)
+        return self._sdk_client
+
+    def _get_ollama_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client so composer calls reuse Ollama connections."""
+        if self._ollama_http is None or self._ollama_http.is_closed:
+            self._ollama_http = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            )
+        return self._ollama_http
 
     async def _compose_response(
         self,
         *,
         user_query: str,
-        events: list[dict],
+        events: Sequence[dict],
         fallback_text: str,
     ) -> str:
         """Compose a flexible factual response from execution events."""
-        style = str(getattr(self.settings, "ai_response_style", "flex_factual") or "flex_factual")
-        max_tokens = int(getattr(self.settings, "ai_response_max_tokens", 320) or 320)
-
-        system_prompt = (
-            "You are Mudabbir response composer.\n"
-            "Write a natural, elegant user-facing reply in the same language as the user.\n"
-            "Be factual. Keep concrete numbers/paths/status exactly when available.\n"
-            "Never output raw tool payload JSON, code, or markdown fences.\n"
-            "Do not invent actions that were not executed.\n"
-            f"Style mode: {style}."
+        style = str(self.settings.ai_response_style or "flex_factual")
+        max_tokens = int(self.settings.ai_response_max_tokens or 320)
+
+        system_prompt = _compose_system_prompt(style)
+        # islice walks the tail in place; only the shrunk list is materialized.
+        recent = islice(events, max(0, len(events) - _COMPOSER_EVENT_WINDOW), None)
+        events_json = json.dumps(
+            [_shrink_event(e) for e in recent], ensure_ascii=False, separators=(",", ":")
         )
         user_prompt = (
             f"User request:\n{user_query}\n\n"
-            f"Execution events (JSON):\n{json.dumps(events[-24:], ensure_ascii=False)}\n\n"
-            f"Fallback plain text:\n{fallback_text[:2200]}\n\n"
+            f"Execution events (JSON):\n{events_json}\n\n"
+            f"Fallback plain text:\n{fallback_text[:_COMPOSER_FALLBACK_CHARS]}\n\n"
             "Now produce the final answer."
         )
         composed = await self._llm_one_shot_text(
@@ -220,13 +2166,28 @@ class AgentLoop:
     def _on_settings_changed(self) -> None:
         """Reload settings-sensitive runtime pieces after slash command updates."""
         self.settings = Settings.load()
+        if (
+            self._router is not None
+            and self._router_signature == self._router_settings_signature(self.settings)
+        ):
+            # Only loop-side settings changed; keep the warm backend.
+            self._provider_models = None
+            self._llm_client = None
+            self._sdk_client = None
+            return
         self.reset_router()
 
+    @staticmethod
+    def _router_settings_signature(settings: Settings) -> dict[str, Any]:
+        return settings.model_dump(exclude=_LOOP_ONLY_SETTINGS)
+
     def _get_router(self) -> AgentRouter:
         """Get or create the agent router (lazy initialization)."""
         if self._router is None:
             # Reload settings to pick up any changes
             settings = Settings.load()
+            # Taken before AgentRouter normalizes fields such as agent_backend in place
+            self._router_signature = self._router_settings_signature(settings)
             self._router = AgentRouter(settings)
         return self._router
 
@@ -240,82 +2201,113 @@ class AgentLoop:
 
         compact = stripped.strip("`").strip()
         lowered = compact.lower()
+        if _RE_SANITIZE_TRIGGER.search(lowered) is None:
+            return text
         if "mcp_sequential-thinking" in lowered:
             return ""
-        markers = (
-            "execute",
-            "arguments",
-            "language",
-            "code",
-            "start-process",
-            "get-process",
-            "stop-process",
-            "set-volume",
-            "set-volumelevel",
-            "set-culture",
-            "set-win",
-            "set-bluetoothstate",
-            "write-output",
-            "ms-settings:",
-            "telegram:",
-            "shell:appsfolder",
-            "http://",
-            "https://",
-            "explorer.exe",
-            "pyautogui",
-            "powershell",
-            "powers ",
-            "python",
-            "mcp_sequential-thinking",
-            "tool▁sep",
-            "tool_call_end",
-        )
-        broken = ("namepowers", "argumentspowers", "namepython", "argumentspython")
-
-        if re.search(r'^\s*(?:powers|powershell)\b', lowered) and any(
-            t in lowered for t in ("-volume", "start-process", "get-process", "set-", "pyautogui", "}}")
-        ):
+        if _RE_POWERSHELL_LEAD.search(lowered) and any(t in lowered for t in _POWERSHELL_NOISE):
             return ""
         if (lowered.startswith("import pyautogui") or lowered.startswith("\\nimport pyautogui")) and (
             "\\n" in compact or "pyautogui." in lowered
         ):
             return ""
 
+        has_marker = _RE_SANITIZE_MARKER.search(lowered) is not None
         looks_jsonish = (
             compact.startswith("{")
             or compact.startswith("[")
-            or bool(re.search(r'^\s*"?\s*(name|arguments|language|code)\s*"?\s*:', lowered))
+            or bool(_RE_JSONISH_KEY.search(lowered))
         )
-        if looks_jsonish and any(m in lowered for m in markers):
+        if looks_jsonish and has_marker:
             return ""
-        if any(b in lowered for b in broken) and any(m in lowered for m in markers):
+        if has_marker and any(b in lowered for b in _BROKEN_TOOL_KEYS):
             return ""
-        if re.search(r'^\s*"?\s*:\s*"(powershell|python|pwsh)"', lowered):
+        if _RE_LANGUAGE_VALUE.search(lowered):
             return ""
-        if re.search(r'^\s*"?\s*(name|arguments|language|code)\s*"?\s*,\s*"\s*:\s*', lowered):
+        if _RE_KEY_COMMA.search(lowered):
             return ""
-        if '"language"' in lowered and '"code"' in lowered and any(m in lowered for m in markers):
+        if has_marker and '"language"' in lowered and '"code"' in lowered:
             return ""
-        if compact in {"{", "}", "[", "]", "```", "`"}:
+        if compact in _BARE_PUNCTUATION:
             return ""
         return text
 
     @staticmethod
     def _contains_arabic(text: str) -> bool:
-        return bool(re.search(r"[\u0600-\u06FF]", str(text or "")))
+        text = str(text or "")
+        # isascii() reads a flag CPython keeps on every str, so English text never hits the regex.
+        if text.isascii():
+            return False
+        return _RE_ARABIC.search(text) is not None
 
     @staticmethod
     def _normalize_intent_text(text: str) -> str:
-        normalized = str(text or "").strip().lower()
-        normalized = normalized.replace("أ", "ا").replace("إ", "ا").replace("آ", "ا")
-        normalized = normalized.replace("ة", "ه").replace("ى", "ي")
-        normalized = re.sub(r"\s+", " ", normalized)
-        return normalized
+        # split/join trims and collapses whitespace in one pass, like strip() + sub(r"\s+")
+        normalized = " ".join(str(text or "").lower().split())
+        return (
+            normalized.replace("أ", "ا")
+            .replace("إ", "ا")
+            .replace("آ", "ا")
+            .replace("ة", "ه")
+            .replace("ى", "ي")
+        )
 
     @staticmethod
     def _is_confirmation_message(text: str) -> bool:
         normalized = AgentLoop._normalize_intent_text(text)
-        return normalized in {"yes", "y", "ok", "confirm", "نعم", "اي", "أجل", "اجل"}
+        return normalized in _CONFIRMATION_WORDS
+
+    def _get_pending_dangerous(self, session_key: str) -> dict[str, Any] | None:
+        """Return the session's unconfirmed destructive action, dropping it once expired."""
+        entry = self._pending_windows_dangerous.get(session_key)
+        if entry is None:
+            return None
+        proposed_at, resolution = entry
+        if time.monotonic() - proposed_at > PENDING_DANGEROUS_TTL_SECONDS:
+            del self._pending_windows_dangerous[session_key]
+            return None
+        return resolution
+
+    def _set_pending_dangerous(self, session_key: str, resolution: dict[str, Any]) -> None:
+        """Remember a destructive action awaiting confirmation, evicting the oldest when full."""
+        pending = self._pending_windows_dangerous
+        pending.pop(session_key, None)
+        while len(pending) >= self._pending_dangerous_cap:
+            pending.popitem(last=False)
+        pending[session_key] = (time.monotonic(), resolution)
+
+    def _get_windows_session_state(self, session_key: str) -> dict[str, Any]:
+        """Return the session's desktop follow-up context, evicting the stalest when full."""
+        states = self._windows_session_state
+        state = states.get(session_key)
+        if state is not None:
+            states.move_to_end(session_key)
+            return state
+        while len(states) >= WINDOWS_SESSION_STATE_CAP:
+            states.popitem(last=False)
+        state = states[session_key] = {}
+        return state
+
+    def _is_seen_session(self, session_key: str) -> bool:
+        """Whether the session is known to have history, refreshing its recency."""
+        if session_key in self._seen_sessions:
+            self._seen_sessions.move_to_end(session_key)
+            return True
+        return False
+
+    def _mark_session_seen(self, session_key: str) -> None:
+        """Remember the session as seen, evicting the stalest when full."""
+        seen = self._seen_sessions
+        seen[session_key] = None
+        seen.move_to_end(session_key)
+        while len(seen) > SEEN_SESSIONS_CAP:
+            seen.popitem(last=False)
+
+    def _get_desktop_tool(self, tool_cls: type) -> Any:
+        """Reuse one stateless DesktopTool instead of constructing it per fast-path call."""
+        if type(self._desktop_tool) is not tool_cls:
+            self._desktop_tool = tool_cls()
+        return self._desktop_tool
 
     async def _try_global_windows_fastpath(
         self, *, text: str, session_key: str
@@ -323,15 +2315,13 @@ class AgentLoop:
         """Deterministic Windows desktop execution path before any backend call."""
         try:
             from Mudabbir.tools.builtin.desktop import DesktopTool
-            from Mudabbir.tools.capabilities.windows_intent_map import resolve_windows_intent
         except Exception:
             return False, None
 
         arabic = self._contains_arabic(text)
         normalized = self._normalize_intent_text(text)
-        cancel_tokens = ("cancel", "stop", "no", "لا", "الغاء", "إلغاء", "وقف")
 
-        session_state = self._windows_session_state.setdefault(session_key, {})
+        session_state = self._get_windows_session_state(session_key)
         resolved_initial = resolve_windows_intent(text)
         repeat_count = 1
         repeat_interval_seconds = 0
@@ -379,12 +2369,12 @@ class AgentLoop:
         else:
             resolution = None
 
-        pending = self._pending_windows_dangerous.get(session_key)
+        pending = self._get_pending_dangerous(session_key)
         if pending is not None:
             if self._is_confirmation_message(text):
                 resolution = pending
                 self._pending_windows_dangerous.pop(session_key, None)
-            elif any(tok in normalized for tok in cancel_tokens):
+            elif _RE_CANCEL.search(normalized):
                 self._pending_windows_dangerous.pop(session_key, None)
                 return True, ("تم إلغاء العملية الخطرة." if arabic else "Canceled the pending dangerous operation.")
             else:
@@ -571,7 +2561,7 @@ class AgentLoop:
 
         risk_level = str(resolution.get("risk_level", "safe"))
         if risk_level == "destructive" and not self._is_confirmation_message(text):
-            self._pending_windows_dangerous[session_key] = resolution
+            self._set_pending_dangerous(session_key, resolution)
             return True, (
                 "هذا أمر خطِر. للتأكيد اكتب: نعم. للإلغاء اكتب: إلغاء."
                 if arabic
@@ -583,45 +2573,38 @@ class AgentLoop:
         if not action:
             return False, None
         mode = str(params.get("mode", "")).lower()
-        if (
-            action == "process_tools"
-            and mode.startswith("app_")
-            and not str(params.get("name", "")).strip()
-            and str(session_state.get("last_app", "")).strip()
-        ):
-            params["name"] = str(session_state.get("last_app", "")).strip()
-        if (
-            action == "service_tools"
-            and mode in {"start", "stop", "restart", "describe", "dependencies", "startup"}
-            and not str(params.get("name", "")).strip()
-            and str(session_state.get("last_service", "")).strip()
-        ):
-            params["name"] = str(session_state.get("last_service", "")).strip()
-        if action == "app_tools":
+        # Follow-ups ("close it", "restart that service") reuse the last target
+        # when the resolver left the name/query empty.
+        last_app = str(session_state.get("last_app", "")).strip()
+        last_window = str(session_state.get("last_window", "")).strip()
+        if action == "process_tools":
+            if mode.startswith("app_") and last_app and not str(params.get("name", "")).strip():
+                params["name"] = last_app
+        elif action == "service_tools":
+            last_service = str(session_state.get("last_service", "")).strip()
+            if (
+                mode in {"start", "stop", "restart", "describe", "dependencies", "startup"}
+                and last_service
+                and not str(params.get("name", "")).strip()
+            ):
+                params["name"] = last_service
+        elif action == "app_tools":
             # Follow-up phrasing like "سكره/افتحه" should reuse last app when name/query is omitted.
-            if not str(params.get("process_name", "")).strip() and str(session_state.get("last_app", "")).strip():
-                params["process_name"] = str(session_state.get("last_app", "")).strip()
-            if not str(params.get("query", "")).strip() and str(session_state.get("last_app", "")).strip():
-                params["query"] = str(session_state.get("last_app", "")).strip()
-        if (
-            action == "window_control"
-            and mode in {"bring_to_front", "hide", "show"}
-            and not str(params.get("query", "")).strip()
-            and str(session_state.get("last_window", "")).strip()
-        ):
-            params["query"] = str(session_state.get("last_window", "")).strip()
-        if (
-            action == "window_control"
-            and mode in {"rename_title"}
-            and not str(params.get("text", "")).strip()
-            and str(session_state.get("last_window", "")).strip()
-        ):
-            params["text"] = str(session_state.get("last_window", "")).strip()
+            if last_app and not str(params.get("process_name", "")).strip():
+                params["process_name"] = last_app
+            if last_app and not str(params.get("query", "")).strip():
+                params["query"] = last_app
+        elif action == "window_control" and last_window:
+            if mode in {"bring_to_front", "hide", "show"} and not str(params.get("query", "")).strip():
+                params["query"] = last_window
+            elif mode == "rename_title" and not str(params.get("text", "")).strip():
+                params["text"] = last_window
 
         parsed: Any = None
         raw: Any = None
+        desktop_tool = self._get_desktop_tool(DesktopTool)
         for i in range(repeat_count):
-            raw = await DesktopTool().execute(action=action, **params)
+            raw = await desktop_tool.execute(action=action, **params)
             raw_text = str(raw or "")
             if raw_text.lower().startswith("error:"):
                 return True, raw_text
@@ -639,7 +2622,8 @@ class AgentLoop:
                 return True, (f"Execution failed: {err}" if err else "Execution failed.")
             if repeat_interval_seconds > 0 and i < (repeat_count - 1):
                 await asyncio.sleep(repeat_interval_seconds)
-        if isinstance(parsed, dict):
+        parsed_is_dict = isinstance(parsed, dict)
+        if parsed_is_dict:
             remembered_app = str(parsed.get("query") or params.get("name") or "").strip()
             if remembered_app:
                 session_state["last_app"] = remembered_app
@@ -669,1726 +2653,204 @@ class AgentLoop:
                 return True, f"🔁 تم تكرار آخر أمر {repeat_count} مرات كل {repeat_interval_seconds} ثواني."
             return True, f"🔁 Repeated the last command {repeat_count} times every {repeat_interval_seconds} seconds."
 
-        if action == "volume" and str(params.get("mode", "")).lower() == "get" and isinstance(parsed, dict):
-            level = parsed.get("level_percent")
-            muted = bool(parsed.get("muted", False))
-            if level is not None:
-                if arabic:
-                    base = f"مستوى الصوت الحالي: {int(level)}% {'(مكتوم)' if muted else ''}".strip()
-                    return True, f"{base} تريد أرفعه أو أخفضه؟"
-                return True, f"Current volume is {int(level)}%{' (muted)' if muted else ''}. Want it higher or lower?"
-        if action == "brightness" and str(params.get("mode", "")).lower() == "get" and isinstance(parsed, dict):
-            level = parsed.get("brightness_percent")
-            if level is not None:
-                if arabic:
-                    return True, f"مستوى السطوع الحالي: {int(level)}%. تريد أضبطه؟"
-                return True, f"Current brightness is {int(level)}%. Want me to tune it?"
-
-        if action == "system_info" and str(params.get("mode", "")).lower() == "battery" and isinstance(parsed, dict):
-            available = bool(parsed.get("available", False))
-            percent = parsed.get("percent")
-            plugged = parsed.get("plugged")
-            if available and percent is not None:
-                if arabic:
-                    state = "موصول بالشاحن" if plugged else "على البطارية"
-                    return True, f"نسبة البطارية الحالية: {int(float(percent))}% ({state})."
-                state = "plugged in" if plugged else "on battery"
-                return True, f"Current battery is {int(float(percent))}% ({state})."
-            if arabic:
-                return True, "لا يمكن قراءة معلومات البطارية على هذا الجهاز حالياً."
-            return True, "Battery information is not available on this machine right now."
-
-        if action == "clipboard_tools" and str(params.get("mode", "")).lower() in {"history", "clipboard_history"}:
-            return True, ("تم فتح سجل الحافظة (Win+V)." if arabic else "Opened Clipboard History (Win+V).")
-
-        if action == "network_tools" and str(params.get("mode", "")).lower() in {"open_network_settings", "settings"}:
-            return True, ("تم فتح إعدادات الشبكة." if arabic else "Opened network settings.")
-        if action == "open_settings_page":
-            page = str(params.get("page", "")).strip().lower()
-            page_msgs_ar = {
-                "network": "تم فتح إعدادات الشبكة.",
-                "privacy": "تم فتح إعدادات الخصوصية.",
-                "sound": "تم فتح إعدادات الصوت.",
-                "windowsupdate": "تم فتح إعدادات تحديثات ويندوز.",
-                "update": "تم فتح إعدادات تحديثات ويندوز.",
-                "appsfeatures": "تم فتح إعدادات التطبيقات.",
-            }
-            page_msgs_en = {
-                "network": "Opened network settings.",
-                "privacy": "Opened privacy settings.",
-                "sound": "Opened sound settings.",
-                "windowsupdate": "Opened Windows Update settings.",
-                "update": "Opened Windows Update settings.",
-                "appsfeatures": "Opened apps settings.",
-            }
-            msg = page_msgs_ar.get(page) if arabic else page_msgs_en.get(page)
-            if msg:
-                return True, msg
-            return True, ("تم فتح صفحة الإعدادات." if arabic else "Opened Settings page.")
-        if action == "network_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode == "connect_wifi" and isinstance(parsed, dict):
-                requested = str(parsed.get("requested_ssid") or params.get("host") or "").strip()
-                connected = parsed.get("connected")
-                actual = str(parsed.get("connected_ssid") or "").strip()
-                if arabic:
-                    if connected is True:
-                        return True, f"📶 تم الاتصال بالشبكة: {actual or requested}. تريد أعمل فحص اتصال سريع؟"
-                    if connected is False:
-                        return True, f"⚠️ ما تم الاتصال بـ {requested}."
-                    return True, f"📶 تم إرسال طلب الاتصال بـ {requested}."
-                if connected is True:
-                    return True, f"📶 Connected to Wi-Fi: {actual or requested}. Want a quick connectivity check?"
-                if connected is False:
-                    return True, f"⚠️ Could not connect to Wi-Fi: {requested}."
-                return True, f"📶 Sent Wi-Fi connect request: {requested}."
-            network_msgs_ar = {
-                "wifi_on": "تم تشغيل الواي فاي.",
-                "wifi_off": "تم إيقاف الواي فاي.",
-                "flush_dns": "تم مسح ذاكرة DNS.",
-                "display_dns": "تم عرض ذاكرة DNS الحالية.",
-                "renew_ip": "تم تجديد عنوان IP.",
-                "disconnect_current_network": "تم قطع الاتصال بالشبكة الحالية.",
-                "connect_wifi": "تم إرسال طلب الاتصال بالشبكة.",
-                "ip_internal": "تم جلب عنوان IP الداخلي.",
-                "ip_external": "تم جلب عنوان IP الخارجي.",
-                "ipconfig_all": "تم جلب معلومات الشبكة التفصيلية.",
-                "ping": "تم تنفيذ اختبار الاتصال (Ping).",
-                "open_ports": "تم جلب المنافذ المفتوحة.",
-                "port_owner": "تم جلب البرنامج الذي يستخدم المنفذ.",
-                "block_app_network": "تم حظر الإنترنت عن البرنامج.",
-                "unblock_app_network": "تمت إعادة الإنترنت للبرنامج.",
-                "limit_app_bandwidth": "تم تطبيق تحديد سرعة النت للبرنامج.",
-                "unlimit_app_bandwidth": "تم إلغاء تحديد سرعة النت للبرنامج.",
-                "route_table": "تم جلب جدول التوجيه.",
-                "tracert": "تم تنفيذ تتبع المسار.",
-                "pathping": "تم تنفيذ فحص المسار وفقدان الحزم.",
-                "nslookup": "تم تنفيذ استعلام DNS.",
-                "netstat_active": "تم جلب الاتصالات النشطة.",
-                "getmac": "تم جلب عناوين MAC للأجهزة.",
-                "arp_table": "تم جلب جدول ARP.",
-                "nbtstat_cache": "تم جلب كاش NetBIOS.",
-                "nbtstat_host": "تم تنفيذ استعلام NetBIOS للجهاز.",
-                "net_view": "تم جلب قائمة أجهزة الشبكة.",
-                "netstat_binary": "تم جلب الاتصالات مع البرامج المرتبطة بها.",
-                "wifi_profiles": "تم جلب قائمة شبكات الواي فاي المحفوظة.",
-                "net_scan": "تم جلب الأجهزة المتصلة على الشبكة المحلية.",
-                "file_sharing_on": "تم تشغيل مشاركة الملفات.",
-                "file_sharing_off": "تم إيقاف مشاركة الملفات.",
-                "shared_folders": "تم جلب قائمة المجلدات المشاركة.",
-                "server_online": "تم فحص توافر الخادم.",
-                "last_login_events": "تم جلب سجل آخر محاولات الدخول.",
-            }
-            network_msgs_en = {
-                "wifi_on": "Wi-Fi turned on.",
-                "wifi_off": "Wi-Fi turned off.",
-                "flush_dns": "DNS cache flushed.",
-                "display_dns": "Displayed DNS cache.",
-                "renew_ip": "IP renewed.",
-                "disconnect_current_network": "Disconnected from current network.",
-                "connect_wifi": "Sent Wi-Fi connection request.",
-                "ip_internal": "Fetched internal IP.",
-                "ip_external": "Fetched external IP.",
-                "ipconfig_all": "Fetched detailed network configuration.",
-                "ping": "Ping test executed.",
-                "open_ports": "Fetched open ports.",
-                "port_owner": "Fetched process using the selected port.",
-                "block_app_network": "Blocked internet access for the app.",
-                "unblock_app_network": "Restored internet access for the app.",
-                "limit_app_bandwidth": "Applied bandwidth limit for the app.",
-                "unlimit_app_bandwidth": "Removed app bandwidth limit.",
-                "route_table": "Fetched route table.",
-                "tracert": "Ran trace route.",
-                "pathping": "Ran path ping/packet-loss diagnostics.",
-                "nslookup": "Ran DNS lookup.",
-                "netstat_active": "Fetched active network connections.",
-                "getmac": "Fetched MAC addresses.",
-                "arp_table": "Fetched ARP table.",
-                "nbtstat_cache": "Fetched NetBIOS cache.",
-                "nbtstat_host": "Ran NetBIOS host query.",
-                "net_view": "Fetched visible network computers.",
-                "netstat_binary": "Fetched network connections with executable names.",
-                "wifi_profiles": "Fetched saved Wi-Fi profiles.",
-                "net_scan": "Fetched local network scan results.",
-                "file_sharing_on": "Enabled file sharing.",
-                "file_sharing_off": "Disabled file sharing.",
-                "shared_folders": "Fetched shared folders.",
-                "server_online": "Checked server availability.",
-                "last_login_events": "Fetched latest login attempt events.",
-            }
-            msg = network_msgs_ar.get(mode) if arabic else network_msgs_en.get(mode)
-            if msg:
-                if arabic and mode == "wifi_off":
-                    return True, f"{msg} تريد أفعّل وضع الطيران كمان؟"
-                if (not arabic) and mode == "wifi_off":
-                    return True, f"{msg} Want me to enable airplane mode too?"
+        reply = _FASTPATH_REPLIES.get(action)
+        if reply is not None:
+            msg = reply(mode, params, parsed, arabic)
+            if msg is not None:
                 return True, msg
 
-        if action == "power_user_tools":
-            mode = str(params.get("mode", "")).lower()
-            power_msgs_ar = {
-                "airplane_on": "✈️ تم تفعيل وضع الطيران.",
-                "airplane_off": "✈️ تم تعطيل وضع الطيران.",
-                "airplane_toggle": "✈️ تم تبديل وضع الطيران.",
-                "god_mode": "🧩 تم إنشاء مجلد God Mode على سطح المكتب.",
-                "invert_colors": "🎨 تم تبديل عكس الألوان.",
-            }
-            power_msgs_en = {
-                "airplane_on": "✈️ Airplane mode enabled.",
-                "airplane_off": "✈️ Airplane mode disabled.",
-                "airplane_toggle": "✈️ Airplane mode toggled.",
-                "god_mode": "🧩 God Mode folder created on desktop.",
-                "invert_colors": "🎨 Color inversion toggled.",
-            }
-            msg = power_msgs_ar.get(mode) if arabic else power_msgs_en.get(mode)
+        messages = _ACTION_MESSAGES.get(action)
+        if messages is not None:
+            msg = messages[0 if arabic else 1].get(mode)
             if msg:
+                followup = _ACTION_FOLLOWUPS.get((action, mode))
+                if followup:
+                    return True, f"{msg} {followup[0 if arabic else 1]}"
                 return True, msg
 
-        if action == "system_power":
-            mode = str(params.get("mode", "")).lower()
-            sys_msgs_ar = {
-                "hibernate_on": "🌙 تم تفعيل السبات.",
-                "hibernate_off": "🌙 تم تعطيل السبات.",
-            }
-            sys_msgs_en = {
-                "hibernate_on": "🌙 Hibernate enabled.",
-                "hibernate_off": "🌙 Hibernate disabled.",
-            }
-            msg = sys_msgs_ar.get(mode) if arabic else sys_msgs_en.get(mode)
-            if msg:
-                return True, msg
+        if parsed_is_dict and "ok" in parsed and "message" in parsed:
+            return True, str(parsed.get("message") or "")
 
-        if action == "media_control":
-            mode = str(params.get("mode", "")).lower()
-            media_msgs_ar = {
-                "play_pause": "تم تنفيذ تشغيل/إيقاف مؤقت.",
-                "next": "تم الانتقال للمقطع التالي.",
-                "previous": "تم الرجوع للمقطع السابق.",
-                "stop": "تم إيقاف الوسائط.",
-            }
-            media_msgs_en = {
-                "play_pause": "Play/Pause executed.",
-                "next": "Skipped to next track.",
-                "previous": "Went back to previous track.",
-                "stop": "Stopped media playback.",
-            }
-            msg = media_msgs_ar.get(mode) if arabic else media_msgs_en.get(mode)
-            if msg:
-                return True, msg
+        ack_ar = (
+            "✅ تم.",
+            "✨ جاهز.",
+            "👍 تم التنفيذ.",
+            "🚀 خلصت.",
+        )
+        ack_en = (
+            "✅ Done.",
+            "✨ All set.",
+            "👍 Executed.",
+            "🚀 Finished.",
+        )
+        basis = f"{session_key}|{action}|{mode.strip()}"
+        idx = (sum(ord(ch) for ch in basis) % 4) if basis else 0
+        return True, (ack_ar[idx] if arabic else ack_en[idx])
 
-        if action == "microphone_control":
-            mode = str(params.get("mode", "")).lower()
-            muted = bool(parsed.get("muted")) if isinstance(parsed, dict) else None
-            if arabic:
-                if mode in {"get", "status"}:
-                    if muted is True:
-                        return True, "🎤 حالة الميكروفون: مكتوم."
-                    if muted is False:
-                        return True, "🎤 حالة الميكروفون: غير مكتوم."
-                    return True, "🎤 تم فحص حالة الميكروفون."
-                if muted is True:
-                    return True, "🎤 تم كتم الميكروفون. إذا بدك بفك الكتم فورًا."
-                if muted is False:
-                    return True, "🎤 تم إلغاء كتم الميكروفون. تريد أتأكد من الحالة؟"
-                return True, "🎤 تم تنفيذ أمر الميكروفون."
-            if mode in {"get", "status"}:
-                if muted is True:
-                    return True, "🎤 Microphone status: muted."
-                if muted is False:
-                    return True, "🎤 Microphone status: unmuted."
-                return True, "🎤 Checked microphone status."
-            if muted is True:
-                return True, "🎤 Microphone muted. I can unmute it right away."
-            if muted is False:
-                return True, "🎤 Microphone unmuted. Want me to verify status?"
-            return True, "🎤 Microphone command executed."
+    def _timeout_message(self, *, backend: str, provider: str) -> str:
+        backend_n = str(backend or "").strip().lower()
+        provider_n = str(provider or "").strip().lower()
+        hints: list[str] = []
+        if backend_n == "claude_agent_sdk":
+            hints.append("- Claude Code CLI may be missing (`npm install -g @anthropic-ai/claude-code`).")
+        if provider_n == "gemini":
+            hints.append("- Gemini quota/key may be exhausted or invalid in Settings -> API Keys.")
+        if provider_n == "ollama":
+            hints.append("- Ensure Ollama is running and the selected model is available locally.")
+        if provider_n in _API_KEY_PROVIDERS:
+            hints.append("- Check API key and model name in Settings -> API Keys.")
+        hints.append("- You can switch backend in Settings -> General.")
+        return "Request timed out — backend didn't respond.\n\nPossible causes:\n" + "\n".join(hints)
 
-        if action == "process_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode in {"top_cpu", "top_ram"} and isinstance(parsed, dict):
-                items = parsed.get("items") if isinstance(parsed.get("items"), list) else []
-                top = items[0] if items else {}
-                name = str(top.get("name") or "").strip()
-                pid = top.get("pid")
-                value = top.get("cpu" if mode == "top_cpu" else "ram_mb")
-                if name and value is not None:
-                    if arabic:
-                        metric = "CPU" if mode == "top_cpu" else "RAM"
-                        unit = "%" if mode == "top_cpu" else " MB"
-                        return True, f"أعلى عملية حالياً: {name} (PID: {pid}) - {metric}: {value}{unit}."
-                    metric = "CPU" if mode == "top_cpu" else "RAM"
-                    unit = "%" if mode == "top_cpu" else " MB"
-                    return True, f"Top process now: {name} (PID: {pid}) - {metric}: {value}{unit}."
-            if mode == "app_memory_total" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                process_count = int(parsed.get("process_count") or 0)
-                total_ram_mb = parsed.get("total_ram_mb")
-                if query and total_ram_mb is not None:
-                    if arabic:
-                        return True, f"{query}: {process_count} عملية، الإجمالي {total_ram_mb} MB."
-                    return True, f"{query}: {process_count} processes, total {total_ram_mb} MB."
-            if mode == "app_process_count_total" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                process_count = int(parsed.get("process_count") or 0)
-                total_ram_mb = parsed.get("total_ram_mb")
-                if query and total_ram_mb is not None:
-                    if arabic:
-                        return True, f"{query}: عدد العمليات {process_count}، والمجموع {total_ram_mb} MB."
-                    return True, f"{query}: {process_count} processes, combined memory {total_ram_mb} MB."
-            if mode == "app_cpu_total" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                process_count = int(parsed.get("process_count") or 0)
-                total_cpu = parsed.get("total_cpu_percent")
-                if query and total_cpu is not None:
-                    if arabic:
-                        return True, f"إجمالي CPU لتطبيق {query}: {total_cpu}% عبر {process_count} عملية."
-                    return True, f"Total CPU for app {query}: {total_cpu}% across {process_count} processes."
-            if mode == "app_disk_total" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                process_count = int(parsed.get("process_count") or 0)
-                total_disk_mb = parsed.get("total_disk_mb")
-                if query and total_disk_mb is not None:
-                    if arabic:
-                        return True, f"إجمالي نشاط القرص لتطبيق {query}: {total_disk_mb} MB عبر {process_count} عملية."
-                    return True, f"Total disk activity for app {query}: {total_disk_mb} MB across {process_count} processes."
-            if mode == "app_network_total" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                process_count = int(parsed.get("process_count") or 0)
-                total_connections = int(parsed.get("total_connections") or 0)
-                established_connections = int(parsed.get("established_connections") or 0)
-                unique_remote_ips = int(parsed.get("unique_remote_ips") or 0)
-                if query:
-                    if arabic:
-                        return True, (
-                            f"نشاط الشبكة لتطبيق {query}: {total_connections} اتصال "
-                            f"(منها {established_connections} نشط) عبر {process_count} عملية، "
-                            f"ومع {unique_remote_ips} عناوين IP بعيدة."
-                        )
-                    return True, (
-                        f"Network activity for app {query}: {total_connections} connections "
-                        f"({established_connections} established) across {process_count} processes, "
-                        f"with {unique_remote_ips} unique remote IPs."
-                    )
-            if mode == "app_resource_summary" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                if query:
-                    process_count = int(parsed.get("process_count") or 0)
-                    total_ram_mb = parsed.get("total_ram_mb")
-                    total_cpu = parsed.get("total_cpu_percent")
-                    total_disk_mb = parsed.get("total_disk_mb")
-                    total_connections = int(parsed.get("total_connections") or 0)
-                    if arabic:
-                        return True, (
-                            f"ملخص {query}: RAM={total_ram_mb} MB، CPU={total_cpu}%، "
-                            f"Disk={total_disk_mb} MB، Network={total_connections} اتصال، "
-                            f"وعبر {process_count} عملية."
-                        )
-                    return True, (
-                        f"Summary for {query}: RAM={total_ram_mb} MB, CPU={total_cpu}%, "
-                        f"Disk={total_disk_mb} MB, Network={total_connections} connections, "
-                        f"across {process_count} processes."
-                    )
-            if mode == "app_compare" and isinstance(parsed, dict):
-                left = parsed.get("left") if isinstance(parsed.get("left"), dict) else {}
-                right = parsed.get("right") if isinstance(parsed.get("right"), dict) else {}
-                winners = parsed.get("winners") if isinstance(parsed.get("winners"), dict) else {}
-                recommendations = parsed.get("recommendations") if isinstance(parsed.get("recommendations"), list) else []
-                lq = str(left.get("query") or params.get("name") or "").strip()
-                rq = str(right.get("query") or params.get("target") or "").strip()
-                if lq and rq:
-                    lram = left.get("total_ram_mb")
-                    rram = right.get("total_ram_mb")
-                    lcpu = left.get("total_cpu_percent")
-                    rcpu = right.get("total_cpu_percent")
-                    ldisk = left.get("total_disk_mb")
-                    rdisk = right.get("total_disk_mb")
-                    lnet = left.get("total_connections")
-                    rnet = right.get("total_connections")
-                    ram_w = str(winners.get("ram") or "equal")
-                    cpu_w = str(winners.get("cpu") or "equal")
-                    disk_w = str(winners.get("disk") or "equal")
-                    net_w = str(winners.get("network") or "equal")
-                    rec_line = ", ".join(str(r) for r in recommendations[:4]) if recommendations else ""
-                    practical_tips: list[str] = []
-                    for rec in recommendations:
-                        token = str(rec or "").strip().lower()
-                        if token.startswith("ram_hotspot="):
-                            appn = rec.split("=", 1)[1] if "=" in rec else "this app"
-                            practical_tips.append(
-                                f"خفّف RAM بإغلاق نوافذ/تبويبات {appn} غير الضرورية"
-                                if arabic
-                                else f"Reduce RAM first by closing unnecessary {appn} windows/tabs"
-                            )
-                        elif token.startswith("cpu_hotspot="):
-                            appn = rec.split("=", 1)[1] if "=" in rec else "this app"
-                            practical_tips.append(
-                                f"خفّف CPU بإيقاف مهام الخلفية داخل {appn}"
-                                if arabic
-                                else f"Reduce CPU by stopping heavy background tasks in {appn}"
-                            )
-                        elif token.startswith("disk_hotspot="):
-                            appn = rec.split("=", 1)[1] if "=" in rec else "this app"
-                            practical_tips.append(
-                                f"خفّف Disk بإيقاف تنزيلات/فهرسة {appn} مؤقتاً"
-                                if arabic
-                                else f"Reduce Disk by pausing downloads/indexing in {appn}"
-                            )
-                        elif token.startswith("network_hotspot="):
-                            appn = rec.split("=", 1)[1] if "=" in rec else "this app"
-                            practical_tips.append(
-                                f"خفّف Network بتقليل مزامنة أو اتصالات {appn}"
-                                if arabic
-                                else f"Reduce Network by limiting sync/connections in {appn}"
-                            )
-                    practical = " | ".join(practical_tips[:2])
-                    if arabic:
-                        return True, (
-                            f"مقارنة {lq} vs {rq}: RAM {lram}/{rram} MB، CPU {lcpu}/{rcpu}%، "
-                            f"Disk {ldisk}/{rdisk} MB، Network {lnet}/{rnet}. "
-                            f"الأثقل: RAM={ram_w}، CPU={cpu_w}، Disk={disk_w}، Network={net_w}."
-                            + (f" التوصية: {rec_line}." if rec_line else "")
-                            + (f" إجراء عملي: {practical}." if practical else "")
-                        )
-                    return True, (
-                        f"Comparison {lq} vs {rq}: RAM {lram}/{rram} MB, CPU {lcpu}/{rcpu}%, "
-                        f"Disk {ldisk}/{rdisk} MB, Network {lnet}/{rnet}. "
-                        f"Heavier: RAM={ram_w}, CPU={cpu_w}, Disk={disk_w}, Network={net_w}."
-                        + (f" Recommendation: {rec_line}." if rec_line else "")
-                        + (f" Practical action: {practical}." if practical else "")
-                    )
-            if mode == "app_reduce_ram_plan" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                total_ram_mb = parsed.get("total_ram_mb")
-                process_count = int(parsed.get("process_count") or 0)
-                reclaimable = parsed.get("reclaimable_mb_estimate")
-                top = parsed.get("top_processes") if isinstance(parsed.get("top_processes"), list) else []
-                top_hint = ""
-                if top:
-                    p0 = top[0] if isinstance(top[0], dict) else {}
-                    p1 = top[1] if len(top) > 1 and isinstance(top[1], dict) else {}
-                    n0 = str(p0.get("name") or "")
-                    m0 = p0.get("ram_mb")
-                    n1 = str(p1.get("name") or "")
-                    m1 = p1.get("ram_mb")
-                    if n0 and m0 is not None:
-                        top_hint = f" أكبر عملية: {n0} ({m0} MB)." if arabic else f" Top process: {n0} ({m0} MB)."
-                    if n1 and m1 is not None:
-                        top_hint += (
-                            f" ثاني أكبر: {n1} ({m1} MB)."
-                            if arabic
-                            else f" Second largest: {n1} ({m1} MB)."
-                        )
-                if query and total_ram_mb is not None:
-                    if arabic:
-                        return True, (
-                            f"خطة تخفيف RAM لتطبيق {query}: الإجمالي {total_ram_mb} MB عبر {process_count} عملية. "
-                            f"تقدير الاسترجاع السريع: {reclaimable} MB."
-                            f"{top_hint} الإجراءات: اغلاق النوافذ/التبويبات الزائدة ثم إعادة تشغيل التطبيق إذا لزم."
-                        )
-                    return True, (
-                        f"RAM reduction plan for {query}: total {total_ram_mb} MB across {process_count} processes. "
-                        f"Quick reclaim estimate: {reclaimable} MB."
-                        f"{top_hint} Actions: close extra windows/tabs, then restart app if needed."
-                    )
-            if mode == "app_reduce_ram_execute" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                killed_count = int(parsed.get("killed_count") or 0)
-                protected_name = str(parsed.get("protected_name") or "")
-                protected_pid = parsed.get("protected_pid")
-                dry_run = bool(parsed.get("dry_run"))
-                max_kill = parsed.get("max_kill")
-                if query:
-                    if arabic:
-                        return True, (
-                            (f"معاينة تخفيف RAM لتطبيق {query}. " if dry_run else f"تم تنفيذ تخفيف RAM لتطبيق {query}. ")
-                            + f"تم {'تحديد' if dry_run else 'إغلاق'} {killed_count} عملية ثانوية"
-                            + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
-                            + f"، مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
-                        )
-                    return True, (
-                        (f"Previewed RAM reduction for {query}. " if dry_run else f"Executed RAM reduction for {query}. ")
-                        + f"{'Selected' if dry_run else 'Closed'} {killed_count} secondary processes"
-                        + (f" (max_kill={max_kill})" if max_kill is not None else "")
-                        + f", while keeping main process {protected_name} (PID: {protected_pid})."
-                    )
-            if mode == "app_reduce_cpu_plan" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                total_cpu = parsed.get("total_cpu_percent")
-                process_count = int(parsed.get("process_count") or 0)
-                reclaimable = parsed.get("reclaimable_cpu_estimate")
-                if query and total_cpu is not None:
-                    if arabic:
-                        return True, (
-                            f"خطة تخفيف CPU لتطبيق {query}: الإجمالي {total_cpu}% عبر {process_count} عملية. "
-                            f"تقدير التخفيض السريع: {reclaimable}%."
-                        )
-                    return True, (
-                        f"CPU reduction plan for {query}: total {total_cpu}% across {process_count} processes. "
-                        f"Quick reduction estimate: {reclaimable}%."
-                    )
-            if mode == "app_reduce_cpu_execute" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                killed_count = int(parsed.get("killed_count") or 0)
-                protected_name = str(parsed.get("protected_name") or "")
-                protected_pid = parsed.get("protected_pid")
-                threshold = parsed.get("threshold")
-                dry_run = bool(parsed.get("dry_run"))
-                if query:
-                    if arabic:
-                        return True, (
-                            (f"معاينة تخفيف CPU لتطبيق {query} (عتبة {threshold}%): " if dry_run else f"تم تنفيذ تخفيف CPU لتطبيق {query} (عتبة {threshold}%): ")
-                            + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
-                            + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
-                        )
-                    return True, (
-                        (f"Previewed CPU reduction for {query} (threshold {threshold}%): " if dry_run else f"Executed CPU reduction for {query} (threshold {threshold}%): ")
-                        + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
-                        + f"while keeping main process {protected_name} (PID: {protected_pid})."
-                    )
-            if mode == "app_reduce_disk_plan" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                total_disk = parsed.get("total_disk_mb")
-                process_count = int(parsed.get("process_count") or 0)
-                reclaimable = parsed.get("reclaimable_disk_estimate")
-                if query and total_disk is not None:
-                    if arabic:
-                        return True, (
-                            f"خطة تخفيف Disk لتطبيق {query}: الإجمالي {total_disk} MB عبر {process_count} عملية. "
-                            f"تقدير التخفيض السريع: {reclaimable} MB."
-                        )
-                    return True, (
-                        f"Disk reduction plan for {query}: total {total_disk} MB across {process_count} processes. "
-                        f"Quick reduction estimate: {reclaimable} MB."
-                    )
-            if mode == "app_reduce_disk_execute" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                killed_count = int(parsed.get("killed_count") or 0)
-                protected_name = str(parsed.get("protected_name") or "")
-                protected_pid = parsed.get("protected_pid")
-                threshold = parsed.get("threshold")
-                dry_run = bool(parsed.get("dry_run"))
-                if query:
-                    if arabic:
-                        return True, (
-                            (f"معاينة تخفيف Disk لتطبيق {query} (عتبة {threshold} MB): " if dry_run else f"تم تنفيذ تخفيف Disk لتطبيق {query} (عتبة {threshold} MB): ")
-                            + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
-                            + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
-                        )
-                    return True, (
-                        (f"Previewed Disk reduction for {query} (threshold {threshold} MB): " if dry_run else f"Executed Disk reduction for {query} (threshold {threshold} MB): ")
-                        + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
-                        + f"while keeping main process {protected_name} (PID: {protected_pid})."
-                    )
-            if mode == "app_reduce_network_plan" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                total_conn = int(parsed.get("total_connections") or 0)
-                process_count = int(parsed.get("process_count") or 0)
-                reclaimable = int(parsed.get("reclaimable_network_estimate") or 0)
-                if query:
-                    if arabic:
-                        return True, (
-                            f"خطة تخفيف Network لتطبيق {query}: الإجمالي {total_conn} اتصال عبر {process_count} عملية. "
-                            f"تقدير التخفيض السريع: {reclaimable} اتصال."
-                        )
-                    return True, (
-                        f"Network reduction plan for {query}: total {total_conn} connections across {process_count} processes. "
-                        f"Quick reduction estimate: {reclaimable} connections."
-                    )
-            if mode == "app_reduce_network_execute" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                killed_count = int(parsed.get("killed_count") or 0)
-                protected_name = str(parsed.get("protected_name") or "")
-                protected_pid = parsed.get("protected_pid")
-                threshold = parsed.get("threshold")
-                dry_run = bool(parsed.get("dry_run"))
-                if query:
-                    if arabic:
-                        return True, (
-                            (f"معاينة تخفيف Network لتطبيق {query} (عتبة {threshold} اتصالات): " if dry_run else f"تم تنفيذ تخفيف Network لتطبيق {query} (عتبة {threshold} اتصالات): ")
-                            + f"{'سيتم' if dry_run else 'تم'} التعامل مع {killed_count} عملية ثانوية "
-                            + f"مع إبقاء العملية الرئيسية {protected_name} (PID: {protected_pid})."
-                        )
-                    return True, (
-                        (f"Previewed Network reduction for {query} (threshold {threshold} connections): " if dry_run else f"Executed Network reduction for {query} (threshold {threshold} connections): ")
-                        + f"{'would handle' if dry_run else 'handled'} {killed_count} secondary processes, "
-                        + f"while keeping main process {protected_name} (PID: {protected_pid})."
-                    )
-            if mode == "kill_high_cpu" and isinstance(parsed, dict):
-                count = int(parsed.get("count") or 0)
-                threshold = parsed.get("threshold")
-                dry_run = bool(parsed.get("dry_run"))
-                max_kill = parsed.get("max_kill")
-                if arabic:
-                    return True, (
-                        (f"معاينة kill_high_cpu عند عتبة {threshold}%: " if dry_run else f"تم تنفيذ kill_high_cpu عند عتبة {threshold}%: ")
-                        + f"{'سيتم' if dry_run else 'تم'} التعامل مع {count} عملية"
-                        + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
-                        + "."
-                    )
-                return True, (
-                    (f"Previewed kill_high_cpu at threshold {threshold}%: " if dry_run else f"Executed kill_high_cpu at threshold {threshold}%: ")
-                    + f"{'would handle' if dry_run else 'handled'} {count} process(es)"
-                    + (f" (max_kill={max_kill})" if max_kill is not None else "")
-                    + "."
-                )
-            if mode == "monitor_until_exit" and isinstance(parsed, dict):
-                app_name = str(parsed.get("name") or params.get("name") or "").strip()
-                exited = bool(parsed.get("exited"))
-                elapsed = parsed.get("elapsed_seconds")
-                timeout = parsed.get("timeout_seconds")
-                notified = bool(parsed.get("notified"))
-                if arabic:
-                    if exited:
-                        if notified:
-                            return True, f"تمت مراقبة {app_name or 'العملية'} وانغلقت بعد {elapsed} ثانية. أرسلت تنبيه."
-                        return True, f"تمت مراقبة {app_name or 'العملية'} وانغلقت بعد {elapsed} ثانية."
-                    return True, f"راقبت {app_name or 'العملية'} لمدة {timeout} ثانية ولسا شغالة."
-                if exited:
-                    if notified:
-                        return True, f"Monitored {app_name or 'process'} and it exited after {elapsed}s. Alert sent."
-                    return True, f"Monitored {app_name or 'process'} and it exited after {elapsed}s."
-                return True, f"Monitored {app_name or 'process'} for {timeout}s and it is still running."
-            if mode == "path_by_name" and isinstance(parsed, dict):
-                query = str(parsed.get("query") or params.get("name") or "").strip()
-                items = parsed.get("items") if isinstance(parsed.get("items"), list) else []
-                first = items[0] if items else {}
-                ppath = str(first.get("path") or "").strip()
-                if ppath:
-                    if arabic:
-                        return True, f"مسار تشغيل {query or 'العملية'}: {ppath}"
-                    return True, f"Executable path for {query or 'process'}: {ppath}"
-            if mode == "app_reduce" and isinstance(parsed, dict):
-                stage = str(parsed.get("stage") or params.get("stage") or "").strip().lower()
-                resource = str(parsed.get("resource") or params.get("resource") or "resource").strip().lower()
-                if arabic:
-                    if stage == "plan":
-                        return True, f"🧠 خطة تخفيف {resource} جاهزة."
-                    return True, f"✅ تم تنفيذ تخفيف {resource}."
-                if stage == "plan":
-                    return True, f"🧠 {resource} reduction plan is ready."
-                return True, f"✅ {resource} reduction executed."
-            process_msgs_ar = {
-                "restart_explorer": "تمت إعادة تشغيل واجهة ويندوز (Explorer).",
-                "kill_pid": "تم إنهاء العملية عبر PID.",
-                "kill_name": "تم إنهاء العملية بالاسم.",
-                "kill_unresponsive": "تم إنهاء العمليات غير المستجيبة.",
-                "blacklist_app": "تمت إضافة البرنامج لقائمة الحظر.",
-                "whitelist_app": "تمت إزالة البرنامج من قائمة الحظر.",
-                "list_blacklist_apps": "هذه قائمة البرامج المحظورة حالياً.",
-                "monitor_until_exit": "تمت مراقبة العملية المطلوبة.",
-                "path_by_name": "تم جلب مسار تشغيل العملية.",
-                "path_by_pid": "تم جلب مسار العملية.",
-                "cpu_by_pid": "تم جلب استهلاك CPU للعملية.",
-                "ram_by_pid": "تم جلب استهلاك RAM للعملية.",
-                "threads_by_pid": "تم جلب عدد الخيوط للعملية.",
-                "start_time_by_pid": "تم جلب وقت بدء العملية.",
-                "suspend_pid": "تم تعليق العملية.",
-                "resume_pid": "تم استئناف العملية.",
-                "set_priority": "تم تغيير أولوية العملية.",
-            }
-            process_msgs_en = {
-                "restart_explorer": "Windows Explorer has been restarted.",
-                "kill_pid": "Process terminated by PID.",
-                "kill_name": "Process terminated by name.",
-                "kill_unresponsive": "Unresponsive processes were terminated.",
-                "blacklist_app": "App added to launch blacklist.",
-                "whitelist_app": "App removed from launch blacklist.",
-                "list_blacklist_apps": "Here is the current launch blacklist.",
-                "monitor_until_exit": "Process monitoring completed.",
-                "path_by_name": "Fetched process executable path.",
-                "path_by_pid": "Fetched process path.",
-                "cpu_by_pid": "Fetched process CPU usage.",
-                "ram_by_pid": "Fetched process RAM usage.",
-                "threads_by_pid": "Fetched process thread count.",
-                "start_time_by_pid": "Fetched process start time.",
-                "suspend_pid": "Process suspended.",
-                "resume_pid": "Process resumed.",
-                "set_priority": "Process priority updated.",
-            }
-            msg = process_msgs_ar.get(mode) if arabic else process_msgs_en.get(mode)
-            if msg:
-                return True, msg
+    async def start(self) -> None:
+        """Start the agent loop."""
+        self._running = True
+        settings = Settings.load()
+        logger.info("🤖 Agent Loop started (Backend: %s)", settings.agent_backend)
+        # Build the backend up front so the first message does not pay for it.
+        self._get_router()
+        self._loop_active = True
+        try:
+            await self._loop()
+        finally:
+            self._loop_active = False
+            # In-flight turns have finished, so none can queue auto-learn work
+            # or reopen a client after this.
+            await self._close_resources()
 
-        if action == "service_tools":
-            mode = str(params.get("mode", "")).lower()
-            svc = str(params.get("name", "") or "").strip()
-            startup = str(params.get("startup", "") or "").strip()
-            service_msgs_ar = {
-                "start": f"تم تشغيل الخدمة: {svc or 'المحددة'}.",
-                "stop": f"تم إيقاف الخدمة: {svc or 'المحددة'}.",
-                "restart": f"تمت إعادة تشغيل الخدمة: {svc or 'المحددة'}.",
-                "list": "تم جلب قائمة الخدمات.",
-                "describe": f"تم جلب وصف الخدمة: {svc or 'المحددة'}.",
-                "dependencies": f"تم جلب تبعيات الخدمة: {svc or 'المحددة'}.",
-                "startup": f"تم تعديل نوع تشغيل الخدمة: {svc or 'المحددة'} إلى {startup or 'المطلوب'}.",
-            }
-            service_msgs_en = {
-                "start": f"Service started: {svc or 'target service'}.",
-                "stop": f"Service stopped: {svc or 'target service'}.",
-                "restart": f"Service restarted: {svc or 'target service'}.",
-                "list": "Fetched services list.",
-                "describe": f"Fetched service description: {svc or 'target service'}.",
-                "dependencies": f"Fetched service dependencies: {svc or 'target service'}.",
-                "startup": f"Updated service startup type: {svc or 'target service'} -> {startup or 'target mode'}.",
-            }
-            msg = service_msgs_ar.get(mode) if arabic else service_msgs_en.get(mode)
-            if msg:
-                if arabic and mode in {"start", "restart"}:
-                    return True, f"{msg} تريد أتحقق من حالتها؟"
-                if arabic and mode == "stop":
-                    return True, f"{msg} إذا بدك برجع شغلها."
-                if (not arabic) and mode in {"start", "restart"}:
-                    return True, f"{msg} Want me to verify status now?"
-                if (not arabic) and mode == "stop":
-                    return True, f"{msg} I can start it again if you want."
-                return True, msg
+    async def stop(self) -> None:
+        """Stop the agent loop."""
+        self._running = False
+        if not self._loop_active:
+            await self._close_resources()
+        logger.info("🛑 Agent Loop stopped")
 
-        if action == "security_tools":
-            mode = str(params.get("mode", "")).lower()
-            security_msgs_ar = {
-                "firewall_status": "تم جلب حالة جدار الحماية.",
-                "firewall_enable": "تم تفعيل جدار الحماية.",
-                "firewall_disable": "تم تعطيل جدار الحماية.",
-                "block_port": "تم إضافة قاعدة حظر منفذ في الجدار الناري.",
-                "unblock_rule": "تم حذف قاعدة من الجدار الناري.",
-                "disable_usb": "تم تعطيل منافذ USB.",
-                "enable_usb": "تم تفعيل منافذ USB.",
-                "disable_camera": "تم تعطيل الكاميرا.",
-                "enable_camera": "تم تفعيل الكاميرا.",
-                "recent_files_list": "تم جلب قائمة الملفات المفتوحة مؤخراً.",
-                "recent_files_clear": "تم مسح قائمة الملفات المفتوحة مؤخراً.",
-                "close_remote_sessions": "تم تنفيذ إغلاق الجلسات البعيدة.",
-                "intrusion_summary": "تم تجهيز ملخص محاولات الدخول الفاشلة.",
-            }
-            security_msgs_en = {
-                "firewall_status": "Fetched firewall status.",
-                "firewall_enable": "Firewall enabled.",
-                "firewall_disable": "Firewall disabled.",
-                "block_port": "Added firewall block-port rule.",
-                "unblock_rule": "Removed firewall rule.",
-                "disable_usb": "USB ports disabled.",
-                "enable_usb": "USB ports enabled.",
-                "disable_camera": "Camera disabled.",
-                "enable_camera": "Camera enabled.",
-                "recent_files_list": "Fetched recent files list.",
-                "recent_files_clear": "Cleared recent files list.",
-                "close_remote_sessions": "Executed remote sessions close.",
-                "intrusion_summary": "Prepared failed-login intrusion summary.",
-            }
-            msg = security_msgs_ar.get(mode) if arabic else security_msgs_en.get(mode)
-            if msg:
-                return True, msg
+    async def _close_resources(self) -> None:
+        """Drain auto-learn work and close the shared LLM clients."""
+        await self._stop_auto_learn()
+        client, self._ollama_http = self._ollama_http, None
+        if client is not None:
+            await client.aclose()
+        sdk_client, self._sdk_client = self._sdk_client, None
+        if sdk_client is not None:
+            await sdk_client.close()
 
-        if action == "background_tools":
-            mode = str(params.get("mode", "")).lower()
-            background_msgs_ar = {
-                "count_background": "تم جلب عدد تطبيقات الخلفية.",
-                "list_visible_windows": "تم جلب قائمة التطبيقات المرئية.",
-                "list_minimized_windows": "تم جلب قائمة التطبيقات المصغرة.",
-                "ghost_apps": "تم جلب التطبيقات الخلفية الثقيلة.",
-                "network_usage_per_app": "تم جلب التطبيقات التي تستخدم الشبكة الآن.",
-                "camera_usage_now": "تم فحص التطبيقات التي تستخدم الكاميرا.",
-                "mic_usage_now": "تم فحص التطبيقات التي تستخدم الميكروفون.",
-                "wake_lock_apps": "تم جلب التطبيقات التي تمنع السكون.",
-                "process_paths": "تم جلب مسارات التطبيقات الشغالة.",
-            }
-            background_msgs_en = {
-                "count_background": "Fetched background processes count.",
-                "list_visible_windows": "Fetched visible windows list.",
-                "list_minimized_windows": "Fetched minimized windows list.",
-                "ghost_apps": "Fetched heavy headless/background apps.",
-                "network_usage_per_app": "Fetched apps currently using network.",
-                "camera_usage_now": "Checked apps currently using camera.",
-                "mic_usage_now": "Checked apps currently using microphone.",
-                "wake_lock_apps": "Fetched apps blocking sleep.",
-                "process_paths": "Fetched running app paths.",
-            }
-            msg = background_msgs_ar.get(mode) if arabic else background_msgs_en.get(mode)
-            if msg:
-                return True, msg
+    async def _loop(self) -> None:
+        """Main processing loop."""
+        # The task group owns in-flight messages: it keeps strong references
+        # without per-message bookkeeping and cancels them if the loop is cancelled.
+        async with asyncio.TaskGroup() as tg:
+            while self._running:
+                # 1. Consume a burst of messages from Bus with one wait
+                batch = await self.bus.consume_inbound_batch(max_items=16, timeout=1.0)
+
+                # 2. Process each message in a background task (to not block loop)
+                for message in batch:
+                    tg.create_task(self._process_message(message))
+
+    def _track_session_task(
+        self, resolved_key: str, task: asyncio.Task, session_key: str | None = None
+    ) -> None:
+        """Register the in-flight task for a session so it can be cancelled.
 
-        if action == "startup_tools":
-            mode = str(params.get("mode", "")).lower()
-            item = str(params.get("name", "") or "").strip()
-            startup_msgs_ar = {
-                "startup_list": "تم جلب قائمة برامج بدء التشغيل.",
-                "startup_impact_time": "تم جلب وقت تأثير بدء التشغيل.",
-                "registry_startups": "تم جلب برامج بدء التشغيل من السجل.",
-                "folder_startups": "تم جلب برامج بدء التشغيل من مجلد Startup.",
-                "signature_check": "تم فحص أمان/توقيع برامج بدء التشغيل.",
-                "disable": f"تم تعطيل برنامج بدء التشغيل: {item or 'المحدد'}.",
-                "enable": f"تم تفعيل برنامج بدء التشغيل: {item or 'المحدد'}.",
-            }
-            startup_msgs_en = {
-                "startup_list": "Fetched startup apps list.",
-                "startup_impact_time": "Fetched startup impact time.",
-                "registry_startups": "Fetched registry startup entries.",
-                "folder_startups": "Fetched startup folder entries.",
-                "signature_check": "Checked startup apps signatures/security.",
-                "disable": f"Disabled startup app: {item or 'target item'}.",
-                "enable": f"Enabled startup app: {item or 'target item'}.",
-            }
-            msg = startup_msgs_ar.get(mode) if arabic else startup_msgs_en.get(mode)
-            if msg:
-                return True, msg
+        The entries are dropped from a done-callback so they are cleaned up even
+        when the task is cancelled before its body ever runs.
+        """
 
-        if action == "performance_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode in {"total_cpu_percent", "total_ram_percent"} and isinstance(parsed, dict):
-                percent = parsed.get("percent")
-                if percent is not None:
-                    if arabic:
-                        label = "المعالج" if mode == "total_cpu_percent" else "الرام"
-                        return True, f"نسبة الاستهلاك الحالية ({label}): {percent}%."
-                    label = "CPU" if mode == "total_cpu_percent" else "RAM"
-                    return True, f"Current {label} usage: {percent}%."
-            perf_msgs_ar = {
-                "top_cpu": "تم جلب أعلى 5 عمليات استهلاكاً للمعالج.",
-                "top_ram": "تم جلب أعلى 5 عمليات استهلاكاً للرام.",
-                "top_disk": "تم جلب أعلى 5 عمليات استهلاكاً للقرص.",
-                "cpu_clock": "تم جلب سرعة المعالج الحالية.",
-                "available_ram": "تم جلب حجم الذاكرة المتاحة.",
-                "pagefile_used": "تم جلب استهلاك ملف التبادل (Page File).",
-            }
-            perf_msgs_en = {
-                "top_cpu": "Fetched top 5 CPU-consuming processes.",
-                "top_ram": "Fetched top 5 RAM-consuming processes.",
-                "top_disk": "Fetched top 5 disk-consuming processes.",
-                "cpu_clock": "Fetched current CPU clock speed.",
-                "available_ram": "Fetched available RAM.",
-                "pagefile_used": "Fetched page file usage.",
-            }
-            msg = perf_msgs_ar.get(mode) if arabic else perf_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "vision_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode == "describe_screen":
-                preview = ""
-                summary = ""
-                top_app = ""
-                if isinstance(parsed, dict):
-                    preview = str(parsed.get("ocr_text_preview") or "").strip()
-                    summary = str(parsed.get("ui_summary") or "").strip()
-                    top_app = str(parsed.get("top_app") or "").strip()
-                if arabic:
-                    if summary or top_app:
-                        msg = f"تحليل الشاشة جاهز{f'، الأعلى: {top_app}' if top_app else ''}."
-                        if summary:
-                            msg += f" {summary[:180]}"
-                        return True, msg
-                    if preview:
-                        return True, f"تحليل الشاشة جاهز. مقتطف: {preview[:180]}"
-                    return True, "تحليل الشاشة جاهز."
-                if summary or top_app:
-                    msg = f"Screen analyzed{f', top app: {top_app}' if top_app else ''}."
-                    if summary:
-                        msg += f" {summary[:180]}"
-                    return True, msg
-                if preview:
-                    return True, f"Screen analyzed. Preview: {preview[:180]}"
-                return True, "Screen analyzed."
-            if mode in {"locate_ui_target", "locate_element"} and isinstance(parsed, dict):
-                ok_locate = bool(parsed.get("ok", False))
-                target = str(parsed.get("matched_label") or params.get("target") or "").strip()
-                action_done = str(parsed.get("action_done") or params.get("interaction") or "").strip().lower()
-                if arabic:
-                    if ok_locate:
-                        if action_done == "click":
-                            return True, f"🖱️ تم العثور على {target or 'العنصر'} والنقر عليه."
-                        if action_done == "double_click":
-                            return True, f"🖱️ تم العثور على {target or 'العنصر'} وعمل دبل كليك."
-                        if action_done == "right_click":
-                            return True, f"🖱️ تم العثور على {target or 'العنصر'} وعمل كليك يمين."
-                        return True, f"🖱️ تم العثور على {target or 'العنصر'} وتحريك الماوس إليه."
-                    return True, f"ما لقيت {target or 'العنصر'} على الشاشة حالياً."
-                if ok_locate:
-                    if action_done == "click":
-                        return True, f"🖱️ Found {target or 'target'} and clicked it."
-                    if action_done == "double_click":
-                        return True, f"🖱️ Found {target or 'target'} and double-clicked it."
-                    if action_done == "right_click":
-                        return True, f"🖱️ Found {target or 'target'} and right-clicked it."
-                    return True, f"🖱️ Found {target or 'target'} and moved the mouse to it."
-                return True, f"Couldn't find {target or 'the target'} on screen right now."
-
-        if action == "screenshot_tools":
-            mode = str(params.get("mode", "")).lower()
-            out_path = str(parsed.get("path") or "").strip() if isinstance(parsed, dict) else ""
-            if arabic:
-                if mode == "window_active":
-                    return True, ("📸 تم أخذ لقطة للنافذة الحالية." + (f"\n{out_path}" if out_path else ""))
-                if mode == "full":
-                    return True, ("📸 تم أخذ لقطة للشاشة." + (f"\n{out_path}" if out_path else ""))
-                if mode == "region":
-                    return True, ("📸 تم أخذ لقطة للمنطقة المحددة." + (f"\n{out_path}" if out_path else ""))
-                if mode == "snipping_tool":
-                    return True, "✂️ تم فتح أداة القص."
-            else:
-                if mode == "window_active":
-                    return True, ("📸 Captured the active window." + (f"\n{out_path}" if out_path else ""))
-                if mode == "full":
-                    return True, ("📸 Captured the screen." + (f"\n{out_path}" if out_path else ""))
-                if mode == "region":
-                    return True, ("📸 Captured the selected region." + (f"\n{out_path}" if out_path else ""))
-                if mode == "snipping_tool":
-                    return True, "✂️ Opened Snipping Tool."
-
-        if action == "ui_tools":
-            mode = str(params.get("mode", "")).lower()
-            ui_msgs_ar = {
-                "night_light_on": "تم تفعيل الوضع الليلي.",
-                "night_light_off": "تم تعطيل الوضع الليلي.",
-                "desktop_icons_show": "تم إظهار أيقونات سطح المكتب.",
-                "desktop_icons_hide": "تم إخفاء أيقونات سطح المكتب.",
-                "open_display_resolution": "تم فتح إعدادات دقة الشاشة.",
-                "open_display_rotation": "تم فتح إعدادات تدوير الشاشة.",
-            }
-            ui_msgs_en = {
-                "night_light_on": "Night light enabled.",
-                "night_light_off": "Night light disabled.",
-                "desktop_icons_show": "Desktop icons shown.",
-                "desktop_icons_hide": "Desktop icons hidden.",
-                "open_display_resolution": "Opened display resolution settings.",
-                "open_display_rotation": "Opened display rotation settings.",
-            }
-            msg = ui_msgs_ar.get(mode) if arabic else ui_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "browser_control":
-            mode = str(params.get("mode", "")).lower()
-            browser_msgs_ar = {
-                "new_tab": "تم فتح تبويب جديد.",
-                "close_tab": "تم إغلاق التبويب الحالي.",
-                "reopen_tab": "تمت إعادة فتح آخر تبويب مغلق.",
-                "next_tab": "تم الانتقال للتبويب التالي.",
-                "prev_tab": "تم الانتقال للتبويب السابق.",
-                "reload": "تم تحديث الصفحة.",
-                "incognito": "تم فتح نافذة التصفح الخفي.",
-                "home": "تم الذهاب إلى صفحة البداية.",
-                "history": "تم فتح سجل التصفح.",
-                "downloads": "تم فتح تنزيلات المتصفح.",
-                "find": "تم فتح البحث داخل الصفحة.",
-                "zoom_in": "تم تكبير الصفحة.",
-                "zoom_out": "تم تصغير الصفحة.",
-                "zoom_reset": "تمت إعادة الزوم إلى 100%.",
-                "save_pdf": "تم فتح نافذة حفظ الصفحة PDF.",
-            }
-            browser_msgs_en = {
-                "new_tab": "Opened a new browser tab.",
-                "close_tab": "Closed current browser tab.",
-                "reopen_tab": "Reopened last closed tab.",
-                "next_tab": "Moved to next tab.",
-                "prev_tab": "Moved to previous tab.",
-                "reload": "Reloaded page.",
-                "incognito": "Opened incognito/private window.",
-                "home": "Opened browser home page.",
-                "history": "Opened browser history.",
-                "downloads": "Opened browser downloads.",
-                "find": "Opened Find in page.",
-                "zoom_in": "Zoomed in.",
-                "zoom_out": "Zoomed out.",
-                "zoom_reset": "Reset zoom to 100%.",
-                "save_pdf": "Opened save as PDF flow.",
-            }
-            msg = browser_msgs_ar.get(mode) if arabic else browser_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "task_tools":
-            mode = str(params.get("mode", "")).lower()
-            name = str(params.get("name", "") or "").strip()
-            task_msgs_ar = {
-                "list": "تم جلب قائمة المهام المجدولة.",
-                "running": "تم جلب المهام المجدولة الجارية.",
-                "last_run": "تم جلب آخر وقت تشغيل للمهام المجدولة.",
-                "run": f"تم تشغيل المهمة المجدولة: {name or 'المحددة'}.",
-                "end": f"تم إنهاء المهمة المجدولة: {name or 'المحددة'}.",
-                "enable": f"تم تمكين المهمة المجدولة: {name or 'المحددة'}.",
-                "disable": f"تم تعطيل المهمة المجدولة: {name or 'المحددة'}.",
-                "delete": f"تم حذف المهمة المجدولة: {name or 'المحددة'}.",
-                "create": f"تم إنشاء مهمة مجدولة: {name or 'جديدة'}.",
-            }
-            task_msgs_en = {
-                "list": "Fetched scheduled tasks list.",
-                "running": "Fetched running scheduled tasks.",
-                "last_run": "Fetched scheduled tasks last run times.",
-                "run": f"Ran scheduled task: {name or 'target task'}.",
-                "end": f"Stopped scheduled task: {name or 'target task'}.",
-                "enable": f"Enabled scheduled task: {name or 'target task'}.",
-                "disable": f"Disabled scheduled task: {name or 'target task'}.",
-                "delete": f"Deleted scheduled task: {name or 'target task'}.",
-                "create": f"Created scheduled task: {name or 'new task'}.",
-            }
-            msg = task_msgs_ar.get(mode) if arabic else task_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "user_tools":
-            mode = str(params.get("mode", "")).lower()
-            uname = str(params.get("username", "") or "").strip()
-            user_msgs_ar = {
-                "list": "تم جلب قائمة المستخدمين.",
-                "create": f"تم إنشاء المستخدم: {uname or 'الجديد'}.",
-                "delete": f"تم حذف المستخدم: {uname or 'المحدد'}.",
-                "set_password": f"تم تغيير كلمة مرور المستخدم: {uname or 'المحدد'}.",
-                "set_type": f"تم تحديث نوع المستخدم: {uname or 'المحدد'}.",
-            }
-            user_msgs_en = {
-                "list": "Fetched users list.",
-                "create": f"Created user: {uname or 'new user'}.",
-                "delete": f"Deleted user: {uname or 'target user'}.",
-                "set_password": f"Updated password for user: {uname or 'target user'}.",
-                "set_type": f"Updated user type for: {uname or 'target user'}.",
-            }
-            msg = user_msgs_ar.get(mode) if arabic else user_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "update_tools":
-            mode = str(params.get("mode", "")).lower()
-            kb = str(params.get("target", "") or "").strip()
-            update_msgs_ar = {
-                "list_updates": "تم جلب قائمة تحديثات ويندوز.",
-                "last_update_time": "تم جلب وقت آخر تحديث للنظام.",
-                "check_updates": "تم بدء فحص تحديثات ويندوز.",
-                "winsxs_cleanup": "تم تشغيل تنظيف ملفات WinSxS.",
-                "stop_background_updates": "تم إيقاف خدمات تحديثات ويندوز في الخلفية.",
-                "install_kb": f"تم إرسال طلب تثبيت التحديث: {kb or 'KB المطلوب'}.",
-            }
-            update_msgs_en = {
-                "list_updates": "Fetched Windows updates list.",
-                "last_update_time": "Fetched last system update time.",
-                "check_updates": "Started Windows Update scan.",
-                "winsxs_cleanup": "Started WinSxS cleanup.",
-                "stop_background_updates": "Stopped background Windows Update services.",
-                "install_kb": f"Sent install request for update: {kb or 'target KB'}.",
-            }
-            msg = update_msgs_ar.get(mode) if arabic else update_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "remote_tools":
-            mode = str(params.get("mode", "")).lower()
-            host = str(params.get("host", "") or "").strip()
-            remote_msgs_ar = {
-                "rdp_open": "تم فتح Remote Desktop.",
-                "vpn_connect": f"تمت محاولة الاتصال بـ VPN: {host or 'المحدد'}.",
-                "vpn_disconnect": "تم تنفيذ قطع اتصال VPN.",
-            }
-            remote_msgs_en = {
-                "rdp_open": "Opened Remote Desktop.",
-                "vpn_connect": f"Attempted VPN connect: {host or 'target connection'}.",
-                "vpn_disconnect": "Executed VPN disconnect.",
-            }
-            msg = remote_msgs_ar.get(mode) if arabic else remote_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "disk_tools":
-            mode = str(params.get("mode", "")).lower()
-            drv = str(params.get("drive", "") or "").strip()
-            disk_msgs_ar = {
-                "smart_status": "تم جلب حالة صحة الأقراص (SMART).",
-                "temp_files_clean": "تم تنظيف الملفات المؤقتة.",
-                "prefetch_clean": "تم تنظيف ملفات Prefetch.",
-                "logs_clean": "تم تنظيف سجلات ويندوز.",
-                "disk_usage": "تم جلب استهلاك ومساحة الأقراص.",
-                "defrag": f"تم بدء إلغاء التجزئة للقرص: {drv or 'C:'}.",
-                "chkdsk_scan": f"تم بدء فحص القرص: {drv or 'C:'}.",
-                "safe_eject": "تم إخراج وسيط التخزين بأمان.",
-            }
-            disk_msgs_en = {
-                "smart_status": "Fetched disk SMART/health status.",
-                "temp_files_clean": "Cleaned temp files.",
-                "prefetch_clean": "Cleaned Prefetch files.",
-                "logs_clean": "Cleaned Windows logs.",
-                "disk_usage": "Fetched disk usage and free space.",
-                "defrag": f"Started defrag on drive: {drv or 'C:'}.",
-                "chkdsk_scan": f"Started disk check on drive: {drv or 'C:'}.",
-                "safe_eject": "Safely ejected storage device.",
-            }
-            msg = disk_msgs_ar.get(mode) if arabic else disk_msgs_en.get(mode)
-            if msg:
-                if arabic and mode == "disk_usage":
-                    return True, f"{msg} تريد أطلع أكبر الملفات كمان؟"
-                if arabic and mode == "chkdsk_scan":
-                    return True, f"{msg} إذا بدك بعطيك ملخص النتيجة بعد ما يخلص."
-                if (not arabic) and mode == "disk_usage":
-                    return True, f"{msg} Want me to list the largest files too?"
-                if (not arabic) and mode == "chkdsk_scan":
-                    return True, f"{msg} I can summarize results when it finishes."
-                return True, msg
-
-        if action == "registry_tools":
-            mode = str(params.get("mode", "")).lower()
-            key = str(params.get("key", "") or "").strip()
-            reg_msgs_ar = {
-                "query": f"تم الاستعلام عن السجل: {key or 'المفتاح المحدد'}.",
-                "add_key": f"تمت إضافة مفتاح سجل: {key or 'المفتاح المحدد'}.",
-                "delete_key": f"تم حذف مفتاح سجل: {key or 'المفتاح المحدد'}.",
-                "set_value": f"تم تحديث قيمة في السجل: {key or 'المفتاح المحدد'}.",
-                "backup": "تم إنشاء نسخة احتياطية للسجل.",
-                "restore": "تم تنفيذ استعادة نسخة السجل.",
-            }
-            reg_msgs_en = {
-                "query": f"Queried registry key: {key or 'target key'}.",
-                "add_key": f"Added registry key: {key or 'target key'}.",
-                "delete_key": f"Deleted registry key: {key or 'target key'}.",
-                "set_value": f"Updated registry value under: {key or 'target key'}.",
-                "backup": "Created registry backup.",
-                "restore": "Executed registry restore.",
-            }
-            msg = reg_msgs_ar.get(mode) if arabic else reg_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "search_tools":
-            mode = str(params.get("mode", "")).lower()
-            search_msgs_ar = {
-                "search_text": "تم البحث عن النص داخل الملفات.",
-                "files_larger_than": "تم جلب الملفات الأكبر من الحجم المطلوب.",
-                "modified_today": "تم جلب الملفات المعدلة اليوم.",
-                "find_images": "تم جلب الصور الموجودة في المسار.",
-                "find_videos": "تم جلب الفيديوهات الموجودة في المسار.",
-                "count_files": "تم حساب عدد الملفات.",
-                "search_windows_content": "تم البحث في محتوى النوافذ المفتوحة.",
-            }
-            search_msgs_en = {
-                "search_text": "Searched text inside files.",
-                "files_larger_than": "Fetched files larger than requested size.",
-                "modified_today": "Fetched files modified today.",
-                "find_images": "Fetched image files in target path.",
-                "find_videos": "Fetched video files in target path.",
-                "count_files": "Counted files in target path.",
-                "search_windows_content": "Searched in open windows content.",
-            }
-            msg = search_msgs_ar.get(mode) if arabic else search_msgs_en.get(mode)
-            if msg:
-                if arabic and mode in {"find_images", "find_videos", "search_text"}:
-                    return True, f"{msg} تريد أرتب النتائج بالأحدث؟"
-                if (not arabic) and mode in {"find_images", "find_videos", "search_text"}:
-                    return True, f"{msg} Want results sorted by newest first?"
-                return True, msg
-
-        if action == "web_tools":
-            mode = str(params.get("mode", "")).lower()
-            web_msgs_ar = {
-                "open_url": "تم فتح الرابط.",
-                "download_file": "تم بدء تنزيل الملف.",
-                "weather": "تم جلب حالة الطقس.",
-            }
-            web_msgs_en = {
-                "open_url": "Opened URL.",
-                "download_file": "Started file download.",
-                "weather": "Fetched weather information.",
-            }
-            msg = web_msgs_ar.get(mode) if arabic else web_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "media_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode in {"screen_record", "screen_record_short"} and isinstance(parsed, dict):
-                path = str(parsed.get("path") or "").strip()
-                if arabic:
-                    return True, ("🎥 تم تسجيل الشاشة." + (f"\n{path}" if path else ""))
-                return True, ("🎥 Screen recording completed." + (f"\n{path}" if path else ""))
-            if mode == "camera_snapshot" and isinstance(parsed, dict):
-                path = str(parsed.get("path") or "").strip()
-                if arabic:
-                    return True, ("📸 تم التقاط صورة بالكاميرا." + (f"\n{path}" if path else ""))
-                return True, ("📸 Camera photo captured." + (f"\n{path}" if path else ""))
-            if mode in {"mute_browser_only", "unmute_browser_only"} and isinstance(parsed, dict):
-                count = int(parsed.get("changed_sessions") or 0)
-                if arabic:
-                    if mode == "mute_browser_only":
-                        return True, f"🔇 تم كتم صوت المتصفح فقط ({count})."
-                    return True, f"🔊 تم إلغاء كتم صوت المتصفح ({count})."
-                if mode == "mute_browser_only":
-                    return True, f"🔇 Browser audio muted only ({count})."
-                return True, f"🔊 Browser audio unmuted ({count})."
-            if mode == "app_volume_set" and isinstance(parsed, dict):
-                app_name = str(parsed.get("name") or params.get("name") or "").strip()
-                level_value = parsed.get("level", params.get("level"))
-                count = int(parsed.get("changed_sessions") or 0)
-                if arabic:
-                    return True, f"🔉 تم ضبط صوت {app_name or 'التطبيق'} على {level_value}% ({count})."
-                return True, f"🔉 Set {app_name or 'app'} volume to {level_value}% ({count})."
-            if mode in {"app_volume_up", "app_volume_down"} and isinstance(parsed, dict):
-                app_name = str(parsed.get("name") or params.get("name") or "").strip()
-                delta_value = int(parsed.get("delta") or params.get("level") or 10)
-                level_value = parsed.get("level")
-                count = int(parsed.get("changed_sessions") or 0)
-                if arabic:
-                    direction = "رفع" if mode == "app_volume_up" else "خفض"
-                    suffix = f" (صار {level_value}%)." if level_value is not None else "."
-                    return True, f"🔉 تم {direction} صوت {app_name or 'التطبيق'} بمقدار {delta_value}% ({count}){suffix}"
-                direction = "Raised" if mode == "app_volume_up" else "Lowered"
-                suffix = f" (now {level_value}%)." if level_value is not None else "."
-                return True, f"🔉 {direction} {app_name or 'app'} by {delta_value}% ({count}){suffix}"
-            if mode in {"app_volume_mute", "app_volume_unmute"} and isinstance(parsed, dict):
-                app_name = str(parsed.get("name") or params.get("name") or "").strip()
-                count = int(parsed.get("changed_sessions") or 0)
-                if arabic:
-                    if mode == "app_volume_mute":
-                        return True, f"🔇 تم كتم {app_name or 'التطبيق'} ({count})."
-                    return True, f"🔊 تم إلغاء كتم {app_name or 'التطبيق'} ({count})."
-                if mode == "app_volume_mute":
-                    return True, f"🔇 Muted {app_name or 'app'} ({count})."
-                return True, f"🔊 Unmuted {app_name or 'app'} ({count})."
-            if mode == "now_playing_info" and isinstance(parsed, dict):
-                title = str(parsed.get("title") or "").strip()
-                artist = str(parsed.get("artist") or "").strip()
-                playback_status = str(parsed.get("playback_status") or "").strip()
-                app = str(parsed.get("app") or "").strip()
-                if arabic:
-                    base = f"🎵 الآن: {title or 'غير معروف'}"
-                    if artist:
-                        base += f" - {artist}"
-                    if playback_status:
-                        base += f" ({playback_status})"
-                    if app:
-                        base += f"\nمن: {app}"
-                    return True, base
-                base = f"🎵 Now playing: {title or 'Unknown title'}"
-                if artist:
-                    base += f" - {artist}"
-                if playback_status:
-                    base += f" ({playback_status})"
-                if app:
-                    base += f"\nSource: {app}"
-                return True, base
-            media_msgs_ar = {
-                "stop_all_media": "⏸️ تم إيقاف الوسائط.",
-                "youtube_open": "▶️ تم فتح الفيديو.",
-                "media_next": "⏭️ تم تشغيل المقطع التالي.",
-                "media_prev": "⏮️ تم الرجوع للمقطع السابق.",
-                "play_pause": "⏯️ تم تبديل التشغيل/الإيقاف.",
-            }
-            media_msgs_en = {
-                "stop_all_media": "⏸️ Media paused.",
-                "youtube_open": "▶️ Video opened.",
-                "media_next": "⏭️ Skipped to next track.",
-                "media_prev": "⏮️ Went to previous track.",
-                "play_pause": "⏯️ Toggled play/pause.",
-            }
-            msg = media_msgs_ar.get(mode) if arabic else media_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "api_tools":
-            mode = str(params.get("mode", "")).lower()
-            api_msgs_ar = {
-                "currency": "تم جلب أسعار العملات.",
-                "weather_city": "تم جلب حالة الطقس للمدينة.",
-                "translate_quick": "تم تنفيذ الترجمة السريعة.",
-            }
-            api_msgs_en = {
-                "currency": "Fetched currency prices.",
-                "weather_city": "Fetched city weather.",
-                "translate_quick": "Executed quick translation.",
-            }
-            msg = api_msgs_ar.get(mode) if arabic else api_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "browser_deep_tools":
-            mode = str(params.get("mode", "")).lower()
-            deep_msgs_ar = {
-                "multi_open": "تم فتح مجموعة الروابط.",
-                "clear_chrome_cache": "تم مسح كاش Chrome.",
-                "clear_edge_cache": "تم مسح كاش Edge.",
-            }
-            deep_msgs_en = {
-                "multi_open": "Opened multiple URLs.",
-                "clear_chrome_cache": "Cleared Chrome cache.",
-                "clear_edge_cache": "Cleared Edge cache.",
-            }
-            msg = deep_msgs_ar.get(mode) if arabic else deep_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "office_tools":
-            mode = str(params.get("mode", "")).lower()
-            office_msgs_ar = {
-                "open_word_new": "تم فتح ملف Word جديد.",
-                "docx_to_pdf": "تم تنفيذ تحويل DOCX إلى PDF.",
-                "silent_print": "تم إرسال الملف للطباعة.",
-            }
-            office_msgs_en = {
-                "open_word_new": "Opened a new Word document.",
-                "docx_to_pdf": "Executed DOCX to PDF conversion.",
-                "silent_print": "Sent file to printer.",
-            }
-            msg = office_msgs_ar.get(mode) if arabic else office_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "driver_tools":
-            mode = str(params.get("mode", "")).lower()
-            driver_msgs_ar = {
-                "drivers_list": "تم جلب قائمة التعريفات المثبتة.",
-                "drivers_backup": "تم بدء أخذ نسخة احتياطية للتعريفات.",
-                "updates_pending": "تم جلب التحديثات المعلقة.",
-                "drivers_issues": "تم جلب التعريفات التي فيها مشاكل.",
-            }
-            driver_msgs_en = {
-                "drivers_list": "Fetched installed drivers list.",
-                "drivers_backup": "Started drivers backup.",
-                "updates_pending": "Fetched pending updates.",
-                "drivers_issues": "Fetched problematic drivers.",
-            }
-            msg = driver_msgs_ar.get(mode) if arabic else driver_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "info_tools":
-            mode = str(params.get("mode", "")).lower()
-            info_msgs_ar = {
-                "windows_product_key": "تم جلب مفتاح تفعيل ويندوز.",
-                "model_info": "تم جلب موديل الجهاز والشركة المصنعة.",
-                "system_language": "تم جلب لغة النظام الحالية.",
-                "timezone_get": "تم جلب المنطقة الزمنية الحالية.",
-                "timezone_set": "تم تعديل المنطقة الزمنية.",
-                "windows_install_date": "تم جلب تاريخ تثبيت ويندوز.",
-                "refresh_rate": "تم جلب معدل تحديث الشاشة.",
-            }
-            info_msgs_en = {
-                "windows_product_key": "Fetched Windows product key.",
-                "model_info": "Fetched device model/manufacturer.",
-                "system_language": "Fetched current system language.",
-                "timezone_get": "Fetched current timezone.",
-                "timezone_set": "Updated timezone.",
-                "windows_install_date": "Fetched Windows install date.",
-                "refresh_rate": "Fetched display refresh rate.",
-            }
-            msg = info_msgs_ar.get(mode) if arabic else info_msgs_en.get(mode)
-            if msg:
-                return True, msg
-
-        if action == "window_control":
-            mode = str(params.get("mode", "")).lower()
-            window_msgs_ar = {
-                "minimize": "تم تصغير النافذة.",
-                "maximize": "تم تكبير النافذة.",
-                "restore": "تمت استعادة حجم النافذة.",
-                "close_current": "تم إغلاق النافذة الحالية.",
-                "show_desktop": "تم تصغير كل النوافذ وإظهار سطح المكتب.",
-                "show_desktop_verified": "تم عرض سطح المكتب.",
-                "undo_show_desktop": "تمت إعادة إظهار النوافذ المصغرة.",
-                "desktop_icons_show": "🖼️ تم إظهار أيقونات سطح المكتب.",
-                "desktop_icons_hide": "🖼️ تم إخفاء أيقونات سطح المكتب.",
-                "desktop_icons_toggle": "🖼️ تم تبديل حالة أيقونات سطح المكتب.",
-                "split_left": "تم نقل النافذة لليسار.",
-                "split_right": "تم نقل النافذة لليمين.",
-                "task_view": "تم فتح عرض المهام.",
-                "alt_tab": "تم تبديل النافذة.",
-            }
-            window_msgs_en = {
-                "minimize": "Window minimized.",
-                "maximize": "Window maximized.",
-                "restore": "Window restored.",
-                "close_current": "Current window closed.",
-                "show_desktop": "Minimized all windows (Show Desktop).",
-                "show_desktop_verified": "Show Desktop executed.",
-                "undo_show_desktop": "Restored minimized windows.",
-                "desktop_icons_show": "Desktop icons shown.",
-                "desktop_icons_hide": "Desktop icons hidden.",
-                "desktop_icons_toggle": "Desktop icons visibility toggled.",
-                "split_left": "Moved window to the left side.",
-                "split_right": "Moved window to the right side.",
-                "task_view": "Opened Task View.",
-                "alt_tab": "Switched window.",
-            }
-            msg = window_msgs_ar.get(mode) if arabic else window_msgs_en.get(mode)
-            if msg:
-                if arabic and mode == "show_desktop_verified":
-                    return True, f"{msg} إذا بدك برجعلك النوافذ."
-                if arabic and mode == "minimize":
-                    return True, f"{msg} إذا بدك بكبّرها مباشرة."
-                if (not arabic) and mode == "show_desktop_verified":
-                    return True, f"{msg} I can restore all windows if you want."
-                if (not arabic) and mode == "minimize":
-                    return True, f"{msg} I can maximize it back now."
-                return True, msg
-
-        if action == "app_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode == "close_all_apps" and isinstance(parsed, dict):
-                count = int(parsed.get("count") or 0)
-                dry_run = bool(parsed.get("dry_run"))
-                max_kill = parsed.get("max_kill")
-                if arabic:
-                    return True, (
-                        ("معاينة إغلاق كل البرامج: " if dry_run else "تم تنفيذ إغلاق البرامج: ")
-                        + f"{'سيتم' if dry_run else 'تم'} التأثير على {count} تطبيق"
-                        + (f" (حد أقصى {max_kill})" if max_kill is not None else "")
-                        + "."
-                    )
-                return True, (
-                    ("Preview close-all-apps: " if dry_run else "Executed close-all-apps: ")
-                    + f"{'would affect' if dry_run else 'affected'} {count} app(s)"
-                    + (f" (max_kill={max_kill})" if max_kill is not None else "")
-                    + "."
-                )
-            app_msgs_ar = {
-                "open_task_manager": "تم فتح مدير المهام.",
-                "open_notepad": "تم فتح المفكرة.",
-                "open_calc": "تم فتح الآلة الحاسبة.",
-                "open_paint": "تم فتح الرسام.",
-                "open_default_browser": "تم فتح المتصفح الافتراضي.",
-                "open_chrome": "تم فتح Chrome.",
-                "open_control_panel": "تم فتح لوحة التحكم.",
-                "open_add_remove_programs": "تم فتح نافذة إضافة أو إزالة البرامج.",
-                "open_store": "تم فتح متجر Microsoft.",
-                "open_camera": "تم فتح الكاميرا.",
-                "open_calendar": "تم فتح التقويم.",
-                "open_mail": "تم فتح البريد.",
-                "open_music_player": "تم فتح مشغل الموسيقى.",
-                "open_volume_mixer": "تم فتح خالط الصوت.",
-                "open_mic_settings": "تم فتح إعدادات الميكروفون.",
-                "open_sound_output": "تم فتح إعدادات مخرج الصوت.",
-                "open_spatial_sound": "تم فتح إعدادات الصوت المكاني.",
-                "open_sound_cpl": "تم فتح إعدادات الصوت الكلاسيكية.",
-                "open_network_connections": "تم فتح اتصالات الشبكة.",
-                "open_netconnections_cpl": "تم فتح لوحة اتصالات الشبكة.",
-                "open_time_date": "تم فتح إعدادات الوقت والتاريخ.",
-                "open_system_properties": "تم فتح خصائص النظام.",
-                "open_power_options": "تم فتح خيارات الطاقة.",
-                "open_firewall_cpl": "تم فتح جدار الحماية.",
-                "open_internet_options_cpl": "تم فتح خصائص الإنترنت.",
-                "open_display_cpl": "تم فتح إعدادات العرض الكلاسيكية.",
-                "open_admin_tools_cpl": "تم فتح الأدوات الإدارية.",
-                "open_schedtasks_cpl": "تم فتح لوحة المهام المجدولة.",
-                "open_mouse_cpl": "تم فتح خصائص الفأرة.",
-                "open_keyboard_cpl": "تم فتح إعدادات لوحة المفاتيح.",
-                "open_fonts_cpl": "تم فتح لوحة الخطوط.",
-                "open_region_cpl": "تم فتح إعدادات الإقليم.",
-                "open_folder_options_cpl": "تم فتح خيارات المجلدات.",
-                "open_color_cpl": "تم فتح إعدادات الألوان.",
-                "open_desktop_cpl": "تم فتح إعدادات سطح المكتب.",
-                "open_printers_cpl": "تم فتح لوحة الطابعات.",
-                "open_user_accounts_cpl": "تم فتح إدارة حسابات المستخدمين.",
-                "open_bluetooth_cpl": "تم فتح إعدادات البلوتوث الكلاسيكية.",
-                "open_accessibility_cpl": "تم فتح خيارات سهولة الوصول.",
-            }
-            app_msgs_en = {
-                "open_task_manager": "Opened Task Manager.",
-                "open_notepad": "Opened Notepad.",
-                "open_calc": "Opened Calculator.",
-                "open_paint": "Opened Paint.",
-                "open_default_browser": "Opened default browser.",
-                "open_chrome": "Opened Chrome.",
-                "open_control_panel": "Opened Control Panel.",
-                "open_add_remove_programs": "Opened Programs and Features.",
-                "open_store": "Opened Microsoft Store.",
-                "open_camera": "Opened Camera.",
-                "open_calendar": "Opened Calendar.",
-                "open_mail": "Opened Mail.",
-                "open_music_player": "Opened default music player.",
-                "open_volume_mixer": "Opened Volume Mixer.",
-                "open_mic_settings": "Opened Microphone settings.",
-                "open_sound_output": "Opened audio output settings.",
-                "open_spatial_sound": "Opened spatial sound settings.",
-                "open_sound_cpl": "Opened classic Sound settings.",
-                "open_network_connections": "Opened Network Connections.",
-                "open_netconnections_cpl": "Opened Network Connections control panel.",
-                "open_time_date": "Opened Date and Time settings.",
-                "open_system_properties": "Opened System Properties.",
-                "open_power_options": "Opened Power Options.",
-                "open_firewall_cpl": "Opened Windows Firewall.",
-                "open_internet_options_cpl": "Opened Internet Options.",
-                "open_display_cpl": "Opened classic Display settings.",
-                "open_admin_tools_cpl": "Opened Administrative Tools.",
-                "open_schedtasks_cpl": "Opened Scheduled Tasks control panel.",
-                "open_mouse_cpl": "Opened Mouse properties.",
-                "open_keyboard_cpl": "Opened Keyboard settings.",
-                "open_fonts_cpl": "Opened Fonts control panel.",
-                "open_region_cpl": "Opened Region settings.",
-                "open_folder_options_cpl": "Opened Folder Options.",
-                "open_color_cpl": "Opened classic Color settings.",
-                "open_desktop_cpl": "Opened classic Desktop settings.",
-                "open_printers_cpl": "Opened Printers control panel.",
-                "open_user_accounts_cpl": "Opened classic User Accounts settings.",
-                "open_bluetooth_cpl": "Opened classic Bluetooth settings.",
-                "open_accessibility_cpl": "Opened classic Ease of Access settings.",
-            }
-            if mode:
-                msg = app_msgs_ar.get(mode) if arabic else app_msgs_en.get(mode)
-                if msg:
-                    return True, msg
-
-        if action == "file_tools":
-            mode = str(params.get("mode", "")).lower()
-            file_msgs_ar = {
-                "open_documents": "📁 تم فتح المستندات.",
-                "open_downloads": "📁 تم فتح التنزيلات.",
-                "open_pictures": "📁 تم فتح الصور.",
-                "open_videos": "📁 تم فتح الفيديوهات.",
-                "create_folder": "📁 تم إنشاء المجلد.",
-                "delete": "🗑️ تم حذف الملف.",
-                "empty_recycle_bin": "🧹 تم إفراغ سلة المهملات.",
-                "copy": "📄 تم نسخ الملف.",
-                "move": "📦 تم نقل الملف.",
-                "rename": "✏️ تم تغيير اسم الملف.",
-                "zip": "🗜️ تم ضغط الملف.",
-                "unzip": "📂 تم فك الضغط.",
-                "search_ext": "🔎 تم البحث حسب الامتداد.",
-                "show_hidden": "👁️ تم إظهار الملفات المخفية.",
-                "hide_hidden": "🙈 تم إخفاء الملفات المخفية.",
-                "folder_size": "📏 تم حساب حجم المجلد.",
-                "open_cmd_here": "🖥️ تم فتح CMD في المسار.",
-                "open_powershell_here": "🖥️ تم فتح PowerShell في المسار.",
-            }
-            file_msgs_en = {
-                "open_documents": "📁 Opened Documents.",
-                "open_downloads": "📁 Opened Downloads.",
-                "open_pictures": "📁 Opened Pictures.",
-                "open_videos": "📁 Opened Videos.",
-                "create_folder": "📁 Folder created.",
-                "delete": "🗑️ File deleted.",
-                "empty_recycle_bin": "🧹 Recycle Bin emptied.",
-                "copy": "📄 File copied.",
-                "move": "📦 File moved.",
-                "rename": "✏️ File renamed.",
-                "zip": "🗜️ File compressed.",
-                "unzip": "📂 Archive extracted.",
-                "search_ext": "🔎 Extension search completed.",
-                "show_hidden": "👁️ Hidden files are now visible.",
-                "hide_hidden": "🙈 Hidden files are now hidden.",
-                "folder_size": "📏 Folder size calculated.",
-                "open_cmd_here": "🖥️ Opened CMD in folder.",
-                "open_powershell_here": "🖥️ Opened PowerShell in folder.",
-            }
-            msg = file_msgs_ar.get(mode) if arabic else file_msgs_en.get(mode)
-            if msg:
-                if arabic and mode in {"copy", "move"}:
-                    return True, f"{msg} تريد ألصقه بالمكان الحالي؟"
-                if arabic and mode == "delete":
-                    return True, f"{msg} إذا بدك برجع أتحقق من وجوده."
-                if (not arabic) and mode in {"copy", "move"}:
-                    return True, f"{msg} Want me to paste it in the current folder?"
-                if (not arabic) and mode == "delete":
-                    return True, f"{msg} I can verify it is gone."
-                return True, msg
-
-        if action == "dev_tools":
-            mode = str(params.get("mode", "")).lower()
-            dev_msgs_ar = {
-                "open_services": "تم فتح نافذة الخدمات.",
-                "open_task_scheduler": "تم فتح جدول المهام.",
-                "open_computer_management": "تم فتح إدارة الكمبيوتر.",
-                "open_local_users_groups": "تم فتح المستخدمين والمجموعات المحلية.",
-                "open_local_security_policy": "تم فتح سياسة الأمان المحلية.",
-                "open_print_management": "تم فتح إدارة الطباعة.",
-                "event_errors": "تم جلب أحدث أخطاء سجل الأحداث.",
-                "analyze_bsod": "تم تحليل أحداث انهيار النظام (BSOD).",
-            }
-            dev_msgs_en = {
-                "open_services": "Opened Services console.",
-                "open_task_scheduler": "Opened Task Scheduler.",
-                "open_computer_management": "Opened Computer Management.",
-                "open_local_users_groups": "Opened Local Users and Groups.",
-                "open_local_security_policy": "Opened Local Security Policy.",
-                "open_print_management": "Opened Print Management.",
-                "event_errors": "Fetched recent event log errors.",
-                "analyze_bsod": "Analyzed recent BSOD/system crash events.",
-            }
-            if mode:
-                msg = dev_msgs_ar.get(mode) if arabic else dev_msgs_en.get(mode)
-                if msg:
-                    return True, msg
-
-        if action == "shell_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode in {"list_shortcuts", "shortcuts", "hotkeys"} and isinstance(parsed, dict):
-                shortcuts = parsed.get("shortcuts") if isinstance(parsed.get("shortcuts"), dict) else {}
-                keys = list(shortcuts.keys())[:5]
-                if arabic:
-                    if keys:
-                        return True, f"⌨️ عندك {len(shortcuts)} اختصار. أهمها: {', '.join(keys)}."
-                    return True, "⌨️ تم جلب قائمة الاختصارات."
-                if keys:
-                    return True, f"⌨️ Found {len(shortcuts)} shortcuts. Top ones: {', '.join(keys)}."
-                return True, "⌨️ Shortcuts list fetched."
-            shell_msgs_ar = {
-                "quick_settings": "تم فتح الإعدادات السريعة.",
-                "notifications": "تم فتح مركز الإشعارات.",
-                "search": "تم فتح بحث ويندوز.",
-                "run": "تم فتح نافذة Run.",
-                "file_explorer": "تم فتح مستكشف الملفات.",
-                "quick_link_menu": "تم فتح قائمة الارتباط السريع (Win+X).",
-                "task_view": "تم فتح عرض المهام.",
-            }
-            shell_msgs_en = {
-                "quick_settings": "Opened Quick Settings.",
-                "notifications": "Opened Notification Center.",
-                "search": "Opened Windows Search.",
-                "run": "Opened Run dialog.",
-                "file_explorer": "Opened File Explorer.",
-                "quick_link_menu": "Opened Quick Link menu (Win+X).",
-                "task_view": "Opened Task View.",
-            }
-            if mode:
-                msg = shell_msgs_ar.get(mode) if arabic else shell_msgs_en.get(mode)
-                if msg:
-                    return True, msg
-
-        if action == "automation_tools":
-            mode = str(params.get("mode", "")).lower()
-            if mode == "tts_to_file" and isinstance(parsed, dict):
-                out_path = str(parsed.get("path") or "").strip()
-                if arabic:
-                    return True, ("🔊 تم إنشاء ملف صوتي." + (f"\n{out_path}" if out_path else ""))
-                return True, ("🔊 Audio file created." + (f"\n{out_path}" if out_path else ""))
-            auto_msgs_ar = {
-                "popup": "🪟 ظهرت رسالة التنبيه.",
-                "tts": "🔊 تم نطق النص.",
-                "delay": "⏳ تم الانتظار.",
-                "repeat_key": "⌨️ تم تكرار المفتاح.",
-                "mouse_lock_window": "🖱️ تم حجز الماوس داخل النافذة.",
-                "mouse_lock_off": "🖱️ تم فك حجز الماوس.",
-            }
-            auto_msgs_en = {
-                "popup": "🪟 Popup message shown.",
-                "tts": "🔊 Text spoken.",
-                "delay": "⏳ Wait completed.",
-                "repeat_key": "⌨️ Key repeated.",
-                "mouse_lock_window": "🖱️ Mouse locked to the active window.",
-                "mouse_lock_off": "🖱️ Mouse lock released.",
-            }
-            if mode:
-                msg = auto_msgs_ar.get(mode) if arabic else auto_msgs_en.get(mode)
-                if msg:
-                    return True, msg
-
-        if isinstance(parsed, dict) and "ok" in parsed and "message" in parsed:
-            return True, str(parsed.get("message") or "")
-
-        ack_ar = (
-            "✅ تم.",
-            "✨ جاهز.",
-            "👍 تم التنفيذ.",
-            "🚀 خلصت.",
-        )
-        ack_en = (
-            "✅ Done.",
-            "✨ All set.",
-            "👍 Executed.",
-            "🚀 Finished.",
-        )
-        mode_for_ack = str(params.get("mode", "")).strip().lower()
-        basis = f"{session_key}|{action}|{mode_for_ack}"
-        idx = (sum(ord(ch) for ch in basis) % 4) if basis else 0
-        return True, (ack_ar[idx] if arabic else ack_en[idx])
-
-    def _timeout_message(self, *, backend: str, provider: str) -> str:
-        backend_n = str(backend or "").strip().lower()
-        provider_n = str(provider or "").strip().lower()
-        hints: list[str] = []
-        if backend_n == "claude_agent_sdk":
-            hints.append("- Claude Code CLI may be missing (`npm install -g @anthropic-ai/claude-code`).")
-        if provider_n == "gemini":
-            hints.append("- Gemini quota/key may be exhausted or invalid in Settings -> API Keys.")
-        if provider_n == "ollama":
-            hints.append("- Ensure Ollama is running and the selected model is available locally.")
-        if provider_n in {"openai", "openai_compatible", "anthropic"}:
-            hints.append("- Check API key and model name in Settings -> API Keys.")
-        hints.append("- You can switch backend in Settings -> General.")
-        return "Request timed out — backend didn't respond.\n\nPossible causes:\n" + "\n".join(hints)
-
-    async def start(self) -> None:
-        """Start the agent loop."""
-        self._running = True
-        settings = Settings.load()
-        logger.info(f"🤖 Agent Loop started (Backend: {settings.agent_backend})")
-        await self._loop()
+        def _on_done(finished: asyncio.Task) -> None:
+            if self._session_tasks.get(resolved_key) is finished:
+                del self._session_tasks[resolved_key]
+                if session_key is not None and self._resolved_keys.get(session_key) == resolved_key:
+                    del self._resolved_keys[session_key]
 
-    async def stop(self) -> None:
-        """Stop the agent loop."""
-        self._running = False
-        logger.info("🛑 Agent Loop stopped")
-
-    async def _loop(self) -> None:
-        """Main processing loop."""
-        while self._running:
-            # 1. Consume message from Bus
-            message = await self.bus.consume_inbound(timeout=1.0)
-            if not message:
-                continue
-
-            # 2. Process message in background task (to not block loop)
-            task = asyncio.create_task(self._process_message(message))
-            self._background_tasks.add(task)
-            task.add_done_callback(self._background_tasks.discard)
+        task.add_done_callback(_on_done)
+        self._session_tasks[resolved_key] = task
+        if session_key is not None:
+            self._resolved_keys[session_key] = resolved_key
 
     async def _process_message(self, message: InboundMessage) -> None:
         """Process a single message flow using AgentRouter."""
         session_key = message.session_key
-        logger.info(f"⚡ Processing message from {session_key}")
+        logger.info("⚡ Processing message from %s", session_key)
 
         # Resolve alias so two chats aliased to the same session serialize correctly
-        resolved_key = await self.memory.resolve_session_key(session_key)
+        try:
+            resolved_key = await self.memory.resolve_session_key(session_key)
+        except Exception:
+            logger.exception("Failed to resolve session key for %s", session_key)
+            return
         task = asyncio.current_task()
         if task is not None:
-            self._session_tasks[resolved_key] = task
+            self._track_session_task(resolved_key, task, session_key)
 
         try:
             # Global concurrency limit — blocks until a slot is available
             async with self._global_semaphore:
-                # Per-session lock — serializes messages within the same session
-                if resolved_key not in self._session_locks:
-                    self._session_locks[resolved_key] = asyncio.Lock()
-                lock = self._session_locks[resolved_key]
-                async with lock:
+                # Per-session turn — serializes messages within the same session
+                async with self._session_cond:
+                    await self._session_cond.wait_for(
+                        lambda: resolved_key not in self._session_inflight
+                    )
+                    self._session_inflight.add(resolved_key)
+                try:
                     await self._process_message_inner(message, resolved_key)
-
-                # Clean up lock if no one else is waiting on it
-                if not lock.locked():
-                    self._session_locks.pop(resolved_key, None)
+                finally:
+                    self._session_inflight.discard(resolved_key)
+                    # Shielded so a cancellation cannot strand the session's waiters
+                    await asyncio.shield(self._notify_session_waiters())
         except asyncio.CancelledError:
             logger.info("⏹️ Cancelled in-flight response for %s", resolved_key)
             raise
-        finally:
-            if task is not None and self._session_tasks.get(resolved_key) is task:
-                self._session_tasks.pop(resolved_key, None)
+        except Exception:
+            # Never let one message failure tear down the loop's task group.
+            logger.exception("Unhandled error processing message for %s", resolved_key)
+
+    async def _notify_session_waiters(self) -> None:
+        """Wake messages waiting for their session's turn."""
+        async with self._session_cond:
+            self._session_cond.notify_all()
 
     _WELCOME_EXCLUDED = frozenset({Channel.WEBSOCKET, Channel.CLI, Channel.SYSTEM, Channel.TELEGRAM})
 
     async def _process_message_inner(self, message: InboundMessage, session_key: str) -> None:
         """Inner message processing (called under concurrency guards)."""
-        # Keep context_builder in sync if memory manager was hot-reloaded
-        if self.context_builder.memory is not self.memory:
-            self.context_builder.memory = self.memory
+        channel, chat_id = message.channel, message.chat_id
+        # Every exit path closes the stream with the same empty marker.
+        end_marker = OutboundMessage(
+            channel=channel,
+            chat_id=chat_id,
+            content="",
+            is_stream_end=True,
+        )
 
         # Command interception — handle /new, /sessions, /resume, /help
         # before any agent processing or memory storage
-        cmd_handler = get_command_handler()
+        cmd_handler = self._cmd_handler
         if cmd_handler.is_command(message.content):
             response = await cmd_handler.handle(message)
             if response is not None:
-                await self.bus.publish_outbound(response)
-                await self.bus.publish_outbound(
-                    OutboundMessage(
-                        channel=message.channel,
-                        chat_id=message.chat_id,
-                        content="",
-                        is_stream_end=True,
-                    )
+                await self.bus.publish_outbound_many(
+                    [
+                        response,
+                        end_marker,
+                    ]
                 )
                 return
 
-        # Welcome hint — one-time message on first interaction in a channel
-        if self.settings.welcome_hint_enabled and message.channel not in self._WELCOME_EXCLUDED:
+        # Welcome hint — one-time message on first interaction in a channel.
+        # Known sessions are the common case, so check them first.
+        if (
+            not self._is_seen_session(session_key)
+            and self.settings.welcome_hint_enabled
+            and channel not in self._WELCOME_EXCLUDED
+        ):
             existing = await self.memory.get_session_history(session_key, limit=1)
+            self._mark_session_seen(session_key)
             if not existing:
                 await self.bus.publish_outbound(
                     OutboundMessage(
-                        channel=message.channel,
-                        chat_id=message.chat_id,
+                        channel=channel,
+                        chat_id=chat_id,
                         content=(
                             f"مرحباً بك في {self.settings.assistant_display_name_ar}! اكتب /help لعرض الأوامر."
                         ),
@@ -2400,14 +2862,16 @@ class AgentLoop:
             content = message.content
             if self.settings.injection_scan_enabled:
                 scanner = get_injection_scanner()
-                source = message.metadata.get("source", message.channel.value)
+                source = message.metadata.get("source", channel.value)
                 scan_result = scanner.scan(content, source=source)
 
-                if scan_result.threat_level == ThreatLevel.HIGH:
+                if scan_result.threat_level is ThreatLevel.HIGH:
                     if self.settings.injection_scan_llm:
-                        scan_result = await scanner.deep_scan(content, source=source)
+                        scan_result = await scanner.deep_scan(
+                            content, source=source, result=scan_result
+                        )
 
-                    if scan_result.threat_level == ThreatLevel.HIGH:
+                    if scan_result.threat_level is ThreatLevel.HIGH:
                         logger.warning(
                             "Blocked HIGH threat injection from %s: %s",
                             source,
@@ -2424,8 +2888,8 @@ class AgentLoop:
                         )
                         await self.bus.publish_outbound(
                             OutboundMessage(
-                                channel=message.channel,
-                                chat_id=message.chat_id,
+                                channel=channel,
+                                chat_id=chat_id,
                                 content=(
                                     "Your message was flagged by the security scanner and blocked."
                                 ),
@@ -2434,7 +2898,7 @@ class AgentLoop:
                         return
 
                 # Wrap suspicious (non-blocked) content with sanitization markers
-                if scan_result.threat_level != ThreatLevel.NONE:
+                if scan_result.threat_level is not ThreatLevel.NONE:
                     content = scan_result.sanitized_content
 
             # Deterministic Windows desktop fast-path (independent from backend/provider)
@@ -2442,58 +2906,36 @@ class AgentLoop:
                 text=content, session_key=session_key
             )
             if handled_fastpath:
-                await self.memory.add_to_session(
-                    session_key=session_key,
-                    role="user",
-                    content=content,
-                    metadata=message.metadata,
-                )
+                # The reply is already known: overlap the user-turn write with the
+                # outbound publishes (gather cancels both together), then append
+                # the assistant turn after it.
                 reply_text = str(fastpath_reply or "").strip() or "Done."
-                await self.bus.publish_outbound(
-                    OutboundMessage(
-                        channel=message.channel,
-                        chat_id=message.chat_id,
-                        content=reply_text,
-                        is_stream_chunk=True,
-                    )
-                )
-                await self.bus.publish_outbound(
-                    OutboundMessage(
-                        channel=message.channel,
-                        chat_id=message.chat_id,
-                        content="",
-                        is_stream_end=True,
-                    )
+                await asyncio.gather(
+                    self._publish_terminal(message, reply_text, end_marker),
+                    self.memory.add_to_session(
+                        session_key=session_key,
+                        role="user",
+                        content=content,
+                        metadata=message.metadata,
+                    ),
                 )
                 await self.memory.add_to_session(
                     session_key=session_key, role="assistant", content=reply_text
                 )
                 return
 
-            # 1. Store User Message
-            await self.memory.add_to_session(
-                session_key=session_key,
-                role="user",
-                content=content,
-                metadata=message.metadata,
-            )
-
-            # 2. Build dynamic system prompt (identity + memory context + channel hint)
+            # 1-2a. Store the user message then load compacted history, while the
+            # dynamic system prompt (identity + memory context + channel hint) is
+            # built concurrently; the prompt does not read session history.
             sender_id = message.sender_id
-            system_prompt = await self.context_builder.build_system_prompt(
-                user_query=content,
-                channel=message.channel,
-                sender_id=sender_id,
-                session_key=message.session_key,
-            )
-
-            # 2a. Retrieve session history with compaction
-            history = await self.memory.get_compacted_history(
-                session_key,
-                recent_window=self.settings.compaction_recent_window,
-                char_budget=self.settings.compaction_char_budget,
-                summary_chars=self.settings.compaction_summary_chars,
-                llm_summarize=self.settings.compaction_llm_summarize,
+            system_prompt, history = await asyncio.gather(
+                self.context_builder.build_system_prompt(
+                    user_query=content,
+                    channel=channel,
+                    sender_id=sender_id,
+                    session_key=message.session_key,
+                ),
+                self._store_user_turn_and_load_history(message, session_key, content),
             )
 
             # 2b. Emit thinking event
@@ -2503,12 +2945,17 @@ class AgentLoop:
 
             # 3. Run through AgentRouter (handles all backends)
             router = self._get_router()
-            full_response = ""
-            composition_events: list[dict] = []
             use_ai_composer = bool(
-                getattr(self.settings, "ai_response_composer_enabled", True)
+                self.settings.ai_response_composer_enabled
                 and self.settings.agent_backend == "open_interpreter"
             )
+            turn = _StreamTurn(
+                message=message,
+                session_key=session_key,
+                use_ai_composer=use_ai_composer,
+                stream=_StreamCoalescer(self.bus, channel, chat_id),
+            )
+            handlers = self._chunk_handlers
 
             run_iter = router.run(content, system_prompt=system_prompt, history=history)
             try:
@@ -2518,210 +2965,33 @@ class AgentLoop:
                     timeout=STREAM_CHUNK_TIMEOUT_SECONDS,
                 ):
                     chunk_type = chunk.get("type", "")
-                    content = chunk.get("content", "")
-                    metadata = chunk.get("metadata") or {}
-
-                    if chunk_type == "message":
-                        content = self._sanitize_stream_chunk(content)
-                        if not content:
-                            continue
-                        composition_events.append({"type": "message", "content": content})
-                        full_response += content
-                        if not use_ai_composer:
-                            # Stream text to user
-                            await self.bus.publish_outbound(
-                                OutboundMessage(
-                                    channel=message.channel,
-                                    chat_id=message.chat_id,
-                                    content=content,
-                                    is_stream_chunk=True,
-                                )
-                            )
-
-                    elif chunk_type == "code":
-                        # Code block from Open Interpreter - emit as tool_use
-                        language = metadata.get("language", "code")
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="tool_start",
-                                data={
-                                    "name": f"run_{language}",
-                                    "params": {"code": content[:100]},
-                                },
-                            )
-                        )
-                        # Also stream to user
-                        code_block = f"\n```{language}\n{content}\n```\n"
-                        composition_events.append({"type": "code", "language": language})
-                        full_response += code_block
-                        if not use_ai_composer:
-                            await self.bus.publish_outbound(
-                                OutboundMessage(
-                                    channel=message.channel,
-                                    chat_id=message.chat_id,
-                                    content=code_block,
-                                    is_stream_chunk=True,
-                                )
-                            )
-
-                    elif chunk_type == "output":
-                        # Output from code execution - emit as tool_result
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="tool_result",
-                                data={
-                                    "name": "code_execution",
-                                    "result": content[:200],
-                                    "status": "success",
-                                },
-                            )
-                        )
-                        # Also stream to user
-                        output_block = f"\n```output\n{content}\n```\n"
-                        composition_events.append({"type": "output", "content": content[:400]})
-                        full_response += output_block
-                        if not use_ai_composer:
-                            await self.bus.publish_outbound(
-                                OutboundMessage(
-                                    channel=message.channel,
-                                    chat_id=message.chat_id,
-                                    content=output_block,
-                                    is_stream_chunk=True,
-                                )
-                            )
-
-                    elif chunk_type == "thinking":
-                        # Thinking goes to Activity panel only
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="thinking",
-                                data={"content": content, "session_key": session_key},
-                            )
-                        )
-
-                    elif chunk_type == "thinking_done":
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="thinking_done",
-                                data={"session_key": session_key},
-                            )
-                        )
-
-                    elif chunk_type == "tool_use":
-                        # Emit tool_start system event for Activity panel
-                        tool_name = metadata.get("name") or metadata.get("tool", "unknown")
-                        tool_input = metadata.get("input") or metadata
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="tool_start",
-                                data={"name": tool_name, "params": tool_input},
-                            )
-                        )
-
-                    elif chunk_type == "tool_result":
-                        # Emit tool_result system event for Activity panel
-                        tool_name = metadata.get("name") or metadata.get("tool", "unknown")
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="tool_result",
-                                data={
-                                    "name": tool_name,
-                                    "result": content[:200],
-                                    "status": "success",
-                                },
-                            )
-                        )
-                        composition_events.append(
-                            {
-                                "type": "tool_result",
-                                "tool": metadata.get("name") or metadata.get("tool", "unknown"),
-                                "content": str(content)[:400],
-                            }
-                        )
-
-                    elif chunk_type == "result":
-                        composition_events.append(
-                            {
-                                "type": "result",
-                                "content": str(content or ""),
-                                "metadata": metadata,
-                            }
-                        )
-                        rendered = str(content or "")
-                        full_response += rendered
-                        if not use_ai_composer and rendered:
-                            await self.bus.publish_outbound(
-                                OutboundMessage(
-                                    channel=message.channel,
-                                    chat_id=message.chat_id,
-                                    content=rendered,
-                                    is_stream_chunk=True,
-                                )
-                            )
-
-                    elif chunk_type == "error":
-                        # Emit error and send to user
-                        await self.bus.publish_system(
-                            SystemEvent(
-                                event_type="tool_result",
-                                data={
-                                    "name": "agent",
-                                    "result": content,
-                                    "status": "error",
-                                },
-                            )
-                        )
-                        composition_events.append({"type": "error", "content": content})
-                        await self.bus.publish_outbound(
-                            OutboundMessage(
-                                channel=message.channel,
-                                chat_id=message.chat_id,
-                                content=content,
-                                is_stream_chunk=True,
-                            )
-                        )
-
-                    elif chunk_type == "done":
-                        # Agent finished - will send stream_end below
-                        pass
-
-                    elif chunk_type == "status":
-                        # Internal backend heartbeat/status chunk.
-                        logger.debug(
-                            "Internal status chunk ignored (session=%s content=%s)",
-                            session_key,
-                            content,
+                    if turn.thinking_parts and chunk_type != "thinking":
+                        await self._flush_thinking(turn)
+                    # "done" and unknown chunk types have no handler.
+                    handler = handlers.get(chunk_type)
+                    if handler is not None:
+                        await handler(
+                            turn, chunk.get("content", ""), chunk.get("metadata") or {}
                         )
-                        continue
             finally:
                 # Always close the async generator to kill any subprocess
                 await run_iter.aclose()
+                # Deliver buffered text before any end marker or error reply
+                await self._flush_thinking(turn)
+                await turn.stream.close()
+            full_response = "".join(turn.response_parts)
 
             # 4. Send stream end marker
             if use_ai_composer and full_response.strip():
                 composed = await self._compose_response(
                     user_query=message.content,
-                    events=composition_events,
+                    events=turn.composition_events,
                     fallback_text=full_response,
                 )
                 full_response = composed
-                await self.bus.publish_outbound(
-                    OutboundMessage(
-                        channel=message.channel,
-                        chat_id=message.chat_id,
-                        content=composed,
-                        is_stream_chunk=True,
-                    )
-                )
-
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content="",
-                    is_stream_end=True,
-                )
-            )
+                await self._publish_terminal(message, composed, end_marker)
+            else:
+                await self.bus.publish_outbound(end_marker)
 
             # 5. Store assistant response in memory
             if full_response:
@@ -2734,161 +3004,280 @@ class AgentLoop:
                     self.settings.memory_backend == "mem0" and self.settings.mem0_auto_learn
                 ) or (self.settings.memory_backend == "file" and self.settings.file_auto_learn)
                 if should_auto_learn:
-                    task = asyncio.create_task(
-                        self._auto_learn(
-                            message.content,
-                            full_response,
-                            session_key,
-                            sender_id=sender_id,
-                        )
+                    self._enqueue_auto_learn(
+                        message.content, full_response, session_key, sender_id
                     )
-                    self._background_tasks.add(task)
-                    task.add_done_callback(self._background_tasks.discard)
 
+        except asyncio.CancelledError:
+            raise
         except StreamTimeoutError as e:
-            llm_provider = str(getattr(self.settings, "llm_provider", "auto") or "auto")
-            llm_model = "unknown"
-            try:
-                from Mudabbir.llm.client import resolve_llm_client
-
-                llm = resolve_llm_client(self.settings)
-                llm_provider = llm.provider
-                llm_model = llm.model
-            except Exception:
-                provider_model_map = {
-                    "gemini": str(getattr(self.settings, "gemini_model", "") or "unknown"),
-                    "openai": str(getattr(self.settings, "openai_model", "") or "unknown"),
-                    "anthropic": str(getattr(self.settings, "anthropic_model", "") or "unknown"),
-                    "ollama": str(getattr(self.settings, "ollama_model", "") or "unknown"),
-                    "openai_compatible": str(
-                        getattr(self.settings, "openai_compatible_model", "") or "unknown"
-                    ),
-                }
-                llm_model = provider_model_map.get(llm_provider, "unknown")
-
-            logger.error(
-                "Agent backend timed out (session=%s backend=%s provider=%s model=%s phase=%s timeout_seconds=%s first_timeout=%ss chunk_timeout=%ss)",
+            await self._handle_timeout(
+                message,
                 session_key,
-                self.settings.agent_backend,
-                llm_provider,
-                llm_model,
-                e.phase,
-                e.timeout_seconds,
-                FIRST_RESPONSE_TIMEOUT_SECONDS,
-                STREAM_CHUNK_TIMEOUT_SECONDS,
+                end_marker,
+                phase=e.phase,
+                timeout_seconds=e.timeout_seconds,
             )
-            # Kill the hung backend so it releases resources
-            try:
-                active_router = self._router
-                if active_router is not None:
-                    await active_router.stop()
-            except Exception:
-                pass
-            # Force router re-init on next message
-            self._router = None
+        except TimeoutError:
+            await self._handle_timeout(message, session_key, end_marker)
+        except Exception as e:
+            logger.exception("❌ Error processing message: %s", e)
+            # Kill the backend on error
+            self._schedule_router_shutdown()
 
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content=self._timeout_message(
-                        backend=self.settings.agent_backend,
-                        provider=llm_provider,
-                    ),
-                    is_stream_chunk=True,
-                )
+            await self._publish_terminal(
+                message, f"An error occurred: {str(e)}", end_marker, stream_chunk=False
             )
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content="",
-                    is_stream_end=True,
-                )
+
+    async def _store_user_turn_and_load_history(
+        self, message: InboundMessage, session_key: str, content: str
+    ) -> list[dict[str, str]]:
+        """Append the user turn, then read history so it includes that turn."""
+        await self.memory.add_to_session(
+            session_key=session_key,
+            role="user",
+            content=content,
+            metadata=message.metadata,
+        )
+        return await self.memory.get_compacted_history(
+            session_key,
+            recent_window=self.settings.compaction_recent_window,
+            char_budget=self.settings.compaction_char_budget,
+            summary_chars=self.settings.compaction_summary_chars,
+            llm_summarize=self.settings.compaction_llm_summarize,
+        )
+
+    async def _on_message_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        content = self._sanitize_stream_chunk(content)
+        if not content:
+            return
+        turn.response_parts.append(content)
+        if turn.use_ai_composer:
+            turn.composition_events.append({"type": "message", "content": content})
+        else:
+            # Stream text to user
+            await turn.stream.write(content)
+
+    async def _on_code_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Code block from Open Interpreter - emit as tool_use
+        language = metadata.get("language", "code")
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="tool_start",
+                data={
+                    "name": f"run_{language}",
+                    "params": {"code": content[:100]},
+                },
             )
-        except TimeoutError:
-            llm_provider = str(getattr(self.settings, "llm_provider", "auto") or "auto")
-            llm_model = "unknown"
-            try:
-                from Mudabbir.llm.client import resolve_llm_client
+        )
+        # Also stream to user
+        code_block = f"\n```{language}\n{content}\n```\n"
+        turn.response_parts.append(code_block)
+        if turn.use_ai_composer:
+            turn.composition_events.append({"type": "code", "language": language})
+        else:
+            await turn.stream.write(code_block)
+
+    async def _on_output_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Output from code execution - emit as tool_result
+        preview = content[:400]
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="tool_result",
+                data={
+                    "name": "code_execution",
+                    "result": preview[:200],
+                    "status": "success",
+                },
+            )
+        )
+        # Also stream to user
+        output_block = f"\n```output\n{content}\n```\n"
+        turn.response_parts.append(output_block)
+        if turn.use_ai_composer:
+            turn.composition_events.append({"type": "output", "content": preview})
+        else:
+            await turn.stream.write(output_block)
+
+    async def _on_thinking_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Thinking goes to Activity panel only
+        if not turn.thinking_started:
+            turn.thinking_started = True
+            await self._publish_thinking(turn.session_key, content)
+            return
+        if not content:
+            return
+        turn.thinking_parts.append(content)
+        turn.thinking_chars += len(content)
+        if turn.thinking_chars >= THINKING_COALESCE_CHARS:
+            await self._flush_thinking(turn)
+
+    async def _flush_thinking(self, turn: _StreamTurn) -> None:
+        if not turn.thinking_parts:
+            return
+        text = "".join(turn.thinking_parts)
+        turn.thinking_parts.clear()
+        turn.thinking_chars = 0
+        await self._publish_thinking(turn.session_key, text)
+
+    async def _publish_thinking(self, session_key: str, content: Any) -> None:
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="thinking",
+                data={"content": content, "session_key": session_key},
+            )
+        )
 
-                llm = resolve_llm_client(self.settings)
-                llm_provider = llm.provider
-                llm_model = llm.model
-            except Exception:
-                provider_model_map = {
-                    "gemini": str(getattr(self.settings, "gemini_model", "") or "unknown"),
-                    "openai": str(getattr(self.settings, "openai_model", "") or "unknown"),
-                    "anthropic": str(getattr(self.settings, "anthropic_model", "") or "unknown"),
-                    "ollama": str(getattr(self.settings, "ollama_model", "") or "unknown"),
-                    "openai_compatible": str(
-                        getattr(self.settings, "openai_compatible_model", "") or "unknown"
-                    ),
-                }
-                llm_model = provider_model_map.get(llm_provider, "unknown")
+    async def _on_thinking_done_chunk(
+        self, turn: _StreamTurn, content: Any, metadata: dict
+    ) -> None:
+        turn.thinking_started = False
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="thinking_done",
+                data={"session_key": turn.session_key},
+            )
+        )
 
-            logger.error(
-                "Agent backend timed out (session=%s backend=%s provider=%s model=%s phase=unknown timeout_seconds=unknown first_timeout=%ss chunk_timeout=%ss)",
-                session_key,
-                self.settings.agent_backend,
-                llm_provider,
-                llm_model,
-                FIRST_RESPONSE_TIMEOUT_SECONDS,
-                STREAM_CHUNK_TIMEOUT_SECONDS,
+    async def _on_tool_use_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Emit tool_start system event for Activity panel
+        tool_name = _tool_name(metadata)
+        tool_input = metadata.get("input") or metadata
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="tool_start",
+                data={"name": tool_name, "params": tool_input},
             )
-            try:
-                active_router = self._router
-                if active_router is not None:
-                    await active_router.stop()
-            except Exception:
-                pass
-            self._router = None
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content=self._timeout_message(
-                        backend=self.settings.agent_backend,
-                        provider=llm_provider,
-                    ),
-                    is_stream_chunk=True,
-                )
+        )
+
+    async def _on_tool_result_chunk(
+        self, turn: _StreamTurn, content: Any, metadata: dict
+    ) -> None:
+        # Emit tool_result system event for Activity panel
+        tool_name = _tool_name(metadata)
+        preview = (content if isinstance(content, str) else str(content))[:400]
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="tool_result",
+                data={
+                    "name": tool_name,
+                    "result": preview[:200],
+                    "status": "success",
+                },
             )
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content="",
-                    is_stream_end=True,
-                )
+        )
+        if turn.use_ai_composer:
+            turn.composition_events.append(
+                {
+                    "type": "tool_result",
+                    "tool": tool_name,
+                    "content": preview,
+                }
             )
-        except asyncio.CancelledError:
-            raise
-        except Exception as e:
-            logger.exception(f"❌ Error processing message: {e}")
-            # Kill the backend on error
-            try:
-                active_router = self._router
-                if active_router is not None:
-                    await active_router.stop()
-            except Exception:
-                pass
 
-            await self.bus.publish_outbound(
-                OutboundMessage(
-                    channel=message.channel,
-                    chat_id=message.chat_id,
-                    content=f"An error occurred: {str(e)}",
-                )
+    async def _on_result_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        rendered = str(content or "")
+        turn.response_parts.append(rendered)
+        if turn.use_ai_composer:
+            turn.composition_events.append(
+                {
+                    "type": "result",
+                    "content": rendered,
+                    "metadata": metadata,
+                }
             )
-            await self.bus.publish_outbound(
+        elif rendered:
+            await turn.stream.write(rendered)
+
+    async def _on_error_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Emit error and send to user
+        await self.bus.publish_system(
+            SystemEvent(
+                event_type="tool_result",
+                data={
+                    "name": "agent",
+                    "result": content,
+                    "status": "error",
+                },
+            )
+        )
+        if turn.use_ai_composer:
+            turn.composition_events.append({"type": "error", "content": content})
+        await turn.stream.write(content)
+        await turn.stream.flush()
+
+    async def _on_status_chunk(self, turn: _StreamTurn, content: Any, metadata: dict) -> None:
+        # Internal backend heartbeat/status chunk.
+        logger.debug(
+            "Internal status chunk ignored (session=%s content=%s)",
+            turn.session_key,
+            content,
+        )
+
+    async def _handle_timeout(
+        self,
+        message: InboundMessage,
+        session_key: str,
+        end_marker: OutboundMessage,
+        *,
+        phase: str = "unknown",
+        timeout_seconds: float | str = "unknown",
+    ) -> None:
+        """Log a backend timeout, reset the router and tell the user what to check."""
+        backend = self.settings.agent_backend
+        llm_provider = str(self.settings.llm_provider or "auto")
+        llm_model = "unknown"
+        try:
+            llm = self._get_llm_client()
+            llm_provider = llm.provider
+            llm_model = llm.model
+        except Exception:
+            llm_model = self._provider_model_map().get(llm_provider, "unknown")
+
+        logger.error(
+            "Agent backend timed out (session=%s backend=%s provider=%s model=%s phase=%s timeout_seconds=%s first_timeout=%ss chunk_timeout=%ss)",
+            session_key,
+            backend,
+            llm_provider,
+            llm_model,
+            phase,
+            timeout_seconds,
+            FIRST_RESPONSE_TIMEOUT_SECONDS,
+            STREAM_CHUNK_TIMEOUT_SECONDS,
+        )
+        # Kill the hung backend in the background; next message re-inits the router
+        self._schedule_router_shutdown()
+
+        await self._publish_terminal(
+            message,
+            self._timeout_message(backend=backend, provider=llm_provider),
+            end_marker,
+        )
+
+    async def _publish_terminal(
+        self,
+        message: InboundMessage,
+        body: str,
+        end_marker: OutboundMessage,
+        *,
+        stream_chunk: bool = True,
+    ) -> None:
+        """Send a final message and close the stream in one fan-out.
+
+        ``stream_chunk=False`` sends ``body`` as a standalone message rather than
+        appending it to whatever was already streamed.
+        """
+        await self.bus.publish_outbound_many(
+            [
                 OutboundMessage(
                     channel=message.channel,
                     chat_id=message.chat_id,
-                    content="",
-                    is_stream_end=True,
-                )
-            )
+                    content=body,
+                    is_stream_chunk=stream_chunk,
+                ),
+                end_marker,
+            ]
+        )
 
     async def _send_response(self, original: InboundMessage, content: str) -> None:
         """Helper to send a simple text response."""
@@ -2904,6 +3293,9 @@ class AgentLoop:
         sender_id: str | None = None,
     ) -> None:
         """Background task: feed conversation turn for fact extraction."""
+        # Nothing to learn from an empty turn; skip the store round-trip.
+        if not user_msg.strip() or not assistant_msg.strip():
+            return
         try:
             messages = [
                 {"role": "user", "content": user_msg},
@@ -2920,24 +3312,105 @@ class AgentLoop:
         except Exception:
             logger.debug("Auto-learn background task failed", exc_info=True)
 
+    def _enqueue_auto_learn(
+        self,
+        user_msg: str,
+        assistant_msg: str,
+        session_key: str,
+        sender_id: str | None,
+    ) -> None:
+        """Hand a finished turn to the auto-learn workers without waiting."""
+        queue = self._auto_learn_queue
+        if queue is None:
+            queue = self._auto_learn_queue = asyncio.Queue(maxsize=AUTO_LEARN_QUEUE_SIZE)
+            self._auto_learn_workers = [
+                asyncio.create_task(self._auto_learn_worker(queue))
+                for _ in range(AUTO_LEARN_WORKERS)
+            ]
+        if queue.full():
+            dropped = queue.get_nowait()
+            queue.task_done()
+            logger.debug("Auto-learn queue full; dropped turn from %s", dropped[2])
+        queue.put_nowait((user_msg, assistant_msg, session_key, sender_id))
+
+    async def _auto_learn_worker(
+        self, queue: asyncio.Queue[tuple[str, str, str, str | None]]
+    ) -> None:
+        while True:
+            user_msg, assistant_msg, session_key, sender_id = await queue.get()
+            try:
+                await self._auto_learn(user_msg, assistant_msg, session_key, sender_id=sender_id)
+            finally:
+                queue.task_done()
+
+    async def _stop_auto_learn(self) -> None:
+        """Give queued turns a short grace period, then stop the workers."""
+        queue, self._auto_learn_queue = self._auto_learn_queue, None
+        workers, self._auto_learn_workers = self._auto_learn_workers, []
+        if queue is None:
+            return
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(AUTO_LEARN_DRAIN_SECONDS):
+                await queue.join()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
     async def cancel_session(self, session_key: str) -> bool:
         """Cancel the current in-flight message task for a session key."""
-        resolved_key = await self.memory.resolve_session_key(session_key)
+        resolved_key = self._resolved_keys.get(session_key)
+        if resolved_key is None:
+            resolved_key = await self.memory.resolve_session_key(session_key)
         task = self._session_tasks.get(resolved_key)
         if task is None or task.done():
             return False
         task.cancel()
-        try:
-            await asyncio.wait_for(asyncio.shield(task), timeout=2.0)
-        except asyncio.TimeoutError:
+        # wait() neither re-raises the task's CancelledError nor cancels it on timeout.
+        _, pending = await asyncio.wait({task}, timeout=2.0)
+        if pending:
             logger.warning("Timed out waiting for cancelled task to finish: %s", resolved_key)
-        except asyncio.CancelledError:
-            pass
-        except Exception:
-            logger.debug("Cancelled task finished with non-cancel exception", exc_info=True)
         return True
 
+    def _schedule_router_shutdown(self) -> None:
+        """Detach the active router and stop it without blocking the caller."""
+        router, self._router = self._router, None
+        if router is None:
+            return
+        task = asyncio.create_task(self._stop_router(router))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    @staticmethod
+    async def _stop_router(router: AgentRouter) -> None:
+        try:
+            await router.stop()
+        except Exception:
+            logger.debug("Router shutdown failed", exc_info=True)
+
+    def _provider_model_map(self) -> dict[str, str]:
+        """Configured model per provider, cached until the next router reset."""
+        if self._provider_models is None:
+            settings = self.settings
+            self._provider_models = {
+                "gemini": str(settings.gemini_model or "unknown"),
+                "openai": str(settings.openai_model or "unknown"),
+                "anthropic": str(settings.anthropic_model or "unknown"),
+                "ollama": str(settings.ollama_model or "unknown"),
+                "openai_compatible": str(settings.openai_compatible_model or "unknown"),
+            }
+        return self._provider_models
+
+    def _get_llm_client(self) -> LLMClient:
+        """Resolved composer LLM settings, cached until the next router reset."""
+        if self._llm_client is None:
+            self._llm_client = resolve_llm_client(self.settings)
+        return self._llm_client
+
     def reset_router(self) -> None:
         """Reset the router to pick up new settings."""
         self._router = None
+        self._router_signature = None
+        self._provider_models = None
+        self._llm_client = None
+        self._sdk_client = None
 
@@ -45,6 +45,8 @@ _PROVIDER_MODEL_FIELDS: dict[str, str] = {
 # The "!" prefix is a fallback for channels where "/" is intercepted client-side
 # (e.g. Matrix/Element treats unknown /commands locally).
 _CMD_RE = re.compile(r"^([/!]\w+)(?:@\S+)?\s*(.*)", re.DOTALL)
+# Just the command word, skipping the leading whitespace strip() would remove.
+_CMD_HEAD_RE = re.compile(r"\s*([/!]\w+)")
 
 
 def _normalize_cmd(raw: str) -> str:
@@ -73,7 +75,7 @@ class CommandHandler:
 
     def is_command(self, content: str) -> bool:
         """Check if the message content is a recognised command."""
-        m = _CMD_RE.match(content.strip())
+        m = _CMD_HEAD_RE.match(content)
         return bool(m and _normalize_cmd(m.group(1).lower()) in _COMMANDS)
 
     async def handle(self, message: InboundMessage) -> OutboundMessage | None:
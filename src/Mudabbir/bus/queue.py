@@ -4,8 +4,9 @@ Created: 2026-02-02
 """
 
 import asyncio
+import contextlib
 import logging
-from collections.abc import Awaitable, Callable
+from collections.abc import Awaitable, Callable, Sequence
 
 from Mudabbir.bus.events import Channel, InboundMessage, OutboundMessage, SystemEvent
 
@@ -58,6 +59,24 @@ class MessageBus:
         except TimeoutError:
             return None
 
+    async def consume_inbound_batch(
+        self, max_items: int = 16, timeout: float = 1.0
+    ) -> list[InboundMessage]:
+        """Wait for one inbound message, then drain up to ``max_items`` already queued.
+
+        Returns an empty list if nothing arrives within ``timeout``.
+        """
+        first = await self.consume_inbound(timeout=timeout)
+        if first is None:
+            return []
+        batch = [first]
+        while len(batch) < max_items:
+            try:
+                batch.append(self._inbound.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
     def inbound_pending(self) -> int:
         """Number of pending inbound messages."""
         return self._inbound.qsize()
@@ -80,10 +99,8 @@ class MessageBus:
     ) -> None:
         """Unsubscribe from outbound messages."""
         if channel in self._outbound_subscribers:
-            try:
+            with contextlib.suppress(ValueError):
                 self._outbound_subscribers[channel].remove(callback)
-            except ValueError:
-                pass
 
     async def publish_outbound(self, message: OutboundMessage) -> None:
         """Publish a message to channel subscribers."""
@@ -105,6 +122,44 @@ class MessageBus:
                     result,
                 )
 
+    async def publish_outbound_many(self, messages: Sequence[OutboundMessage]) -> None:
+        """Publish several messages with a single fan-out.
+
+        Each subscriber receives its channel's messages in order; subscribers
+        run concurrently. A failing delivery is logged and does not stop the
+        remaining messages.
+        """
+        batches: dict[Channel, list[OutboundMessage]] = {}
+        for message in messages:
+            batches.setdefault(message.channel, []).append(message)
+
+        async def _deliver(
+            sub: Callable[[OutboundMessage], Awaitable[None]],
+            index: int,
+            batch: list[OutboundMessage],
+        ) -> None:
+            for message in batch:
+                try:
+                    await sub(message)
+                except Exception as e:
+                    logger.error(
+                        "Outbound subscriber %d for %s failed: %s",
+                        index,
+                        message.channel.value,
+                        e,
+                    )
+
+        tasks = []
+        for channel, batch in batches.items():
+            subscribers = self._outbound_subscribers.get(channel, [])
+            if not subscribers:
+                logger.warning(f"⚠️ No subscribers for {channel.value}")
+                continue
+            tasks.extend(_deliver(sub, i, batch) for i, sub in enumerate(subscribers))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
     async def broadcast_outbound(
         self, message: OutboundMessage, exclude: Channel | None = None
     ) -> None:
@@ -2644,7 +2644,6 @@ async def websocket_endpoint(
 
                 # Reload memory manager with fresh settings
                 agent_loop.memory = get_memory_manager(force_reload=True)
-                agent_loop.context_builder.memory = agent_loop.memory
 
                 await websocket.send_json({"type": "message", "content": "⚙️ Settings updated"})
 
@@ -3757,7 +3756,6 @@ async def save_memory_settings(request: Request):
 
     manager = get_memory_manager(force_reload=True)
     agent_loop.memory = manager
-    agent_loop.context_builder.memory = manager
 
     return {"status": "ok"}
 
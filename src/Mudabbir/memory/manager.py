@@ -7,6 +7,7 @@
 import hashlib
 import inspect
 import logging
+from collections import OrderedDict
 from datetime import UTC, datetime
 from pathlib import Path
 from typing import Any
@@ -16,6 +17,8 @@ from Mudabbir.memory.protocol import MemoryEntry, MemoryStoreProtocol, MemoryTyp
 
 logger = logging.getLogger(__name__)
 _MEM0_FALLBACK_WARNED = False
+# Sessions whose Tier 1 extract lines are kept between compactions, least recently used evicted.
+_EXTRACT_CACHE_SIZE = 256
 
 
 def create_memory_store(
@@ -163,6 +166,8 @@ class MemoryManager:
                 anthropic_api_key=anthropic_api_key,
                 openai_api_key=openai_api_key,
             )
+        # session_key -> (summary_chars, first entry id, last extracted entry id, lines)
+        self._extract_cache: OrderedDict[str, tuple[int, str, str, list[str]]] = OrderedDict()
 
     # =========================================================================
     # User Scoping
@@ -384,22 +389,58 @@ class MemoryManager:
 
         # Tier 1 fallback: one-liner extracts
         if summary_block is None:
-            lines = []
-            for msg in older:
-                role = msg["role"].capitalize()
-                text = msg["content"].replace("\n", " ").strip()
-                if len(text) > summary_chars:
-                    # Truncate at word boundary
-                    truncated = text[:summary_chars].rsplit(" ", 1)[0]
-                    text = truncated + "..."
-                lines.append(f"{role}: {text}")
-            summary_block = "\n".join(lines)
+            summary_block = "\n".join(
+                self._older_extracts(session_key, entries, older, summary_chars)
+            )
 
         compacted = [{"role": "user", "content": f"[Earlier conversation]\n{summary_block}"}]
         compacted.extend(recent)
 
         return self._enforce_budget(compacted, char_budget)
 
+    def _older_extracts(
+        self,
+        session_key: str,
+        entries: list[MemoryEntry],
+        older: list[dict[str, str]],
+        summary_chars: int,
+    ) -> list[str]:
+        """Return Tier 1 one-liners for ``older``, extracting only new messages.
+
+        Session history is append-only, so the cached prefix stays valid as
+        long as the entries it started and ended on are still in the same
+        positions. Entry ids are compared rather than content, so a window
+        that slid past repeated messages is not mistaken for the same prefix.
+        """
+        lines: list[str] = []
+        cache = self._extract_cache
+        cached = cache.get(session_key)
+        if cached is not None:
+            cached_chars, first_id, last_id, cached_lines = cached
+            count = len(cached_lines)
+            if (
+                cached_chars == summary_chars
+                and 0 < count <= len(older)
+                and entries[0].id == first_id
+                and entries[count - 1].id == last_id
+            ):
+                lines = list(cached_lines)
+
+        for msg in older[len(lines) :]:
+            role = msg["role"].capitalize()
+            text = msg["content"].replace("\n", " ").strip()
+            if len(text) > summary_chars:
+                # Truncate at word boundary
+                truncated = text[:summary_chars].rsplit(" ", 1)[0]
+                text = truncated + "..."
+            lines.append(f"{role}: {text}")
+
+        cache[session_key] = (summary_chars, entries[0].id, entries[len(older) - 1].id, lines)
+        cache.move_to_end(session_key)
+        while len(cache) > _EXTRACT_CACHE_SIZE:
+            cache.popitem(last=False)
+        return lines
+
     @staticmethod
     def _enforce_budget(messages: list[dict[str, str]], char_budget: int) -> list[dict[str, str]]:
         """Drop oldest messages until total chars fit within budget.
@@ -411,9 +452,11 @@ class MemoryManager:
             return messages
 
         # Drop from oldest until within budget
-        result = list(messages)
-        while len(result) > 1 and sum(len(m["content"]) for m in result) > char_budget:
-            result.pop(0)
+        start = 0
+        while start < len(messages) - 1 and total > char_budget:
+            total -= len(messages[start]["content"])
+            start += 1
+        result = messages[start:]
 
         # If single remaining message still exceeds budget, truncate it
         if result and len(result[0]["content"]) > char_budget:
@@ -479,10 +522,11 @@ class MemoryManager:
             )
             summary = response.content[0].text
 
-            # Write cache
+            # Write cache atomically (write to .tmp then rename)
             import json
 
-            cache_path.write_text(
+            tmp = cache_path.with_suffix(".tmp")
+            tmp.write_text(
                 json.dumps(
                     {
                         "watermark": current_total,
@@ -492,6 +536,7 @@ class MemoryManager:
                     indent=2,
                 )
             )
+            tmp.replace(cache_path)
 
             return summary
 
@@ -630,10 +675,12 @@ class MemoryManager:
 
     async def clear_session(self, session_key: str) -> int:
         """Clear session history."""
+        self._extract_cache.pop(session_key, None)
         return await self._store.clear_session(session_key)
 
     async def delete_session(self, session_key: str) -> bool:
         """Delete a session entirely (file, compaction cache, index entry)."""
+        self._extract_cache.pop(session_key, None)
         if hasattr(self._store, "delete_session"):
             return await self._store.delete_session(session_key)
         # Fallback: clear is the best we can do
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from datetime import datetime
 import re
@@ -1214,6 +1215,54 @@ RULES: tuple[IntentRule, ...] = (
 )
 
 
+# Aliases are normalized once at import; resolve_windows_intent runs on every message.
+_NORMALIZED_RULE_ALIASES: tuple[tuple[IntentRule, tuple[str, ...]], ...] = tuple(
+    (rule, tuple(_normalize_text(a) for a in rule.aliases)) for rule in RULES
+)
+# Aliases bucketed by their first characters, as (alias, rule index) in rule order, so
+# one pass over the message finds the first matching rule instead of a scan per alias.
+_ALIAS_PREFIX_LEN = 3
+
+
+def _build_alias_index() -> tuple[dict[str, list[tuple[str, int]]], list[tuple[str, int]]]:
+    index: dict[str, list[tuple[str, int]]] = {}
+    short: list[tuple[str, int]] = []
+    for rule_index, (_, aliases) in enumerate(_NORMALIZED_RULE_ALIASES):
+        for alias in aliases:
+            if len(alias) >= _ALIAS_PREFIX_LEN:
+                index.setdefault(alias[:_ALIAS_PREFIX_LEN], []).append((alias, rule_index))
+            elif alias:
+                short.append((alias, rule_index))
+    return index, short
+
+
+_ALIAS_INDEX, _SHORT_ALIASES = _build_alias_index()
+
+
+def _first_matching_rule(normalized: str) -> IntentRule | None:
+    """Return the earliest rule in ``RULES`` with an alias contained in ``normalized``."""
+    best = len(_NORMALIZED_RULE_ALIASES)
+    for alias, index in _SHORT_ALIASES:
+        if index >= best:
+            break
+        if alias in normalized:
+            best = index
+    buckets = _ALIAS_INDEX.get
+    for start in range(len(normalized) - _ALIAS_PREFIX_LEN + 1):
+        bucket = buckets(normalized[start : start + _ALIAS_PREFIX_LEN])
+        if bucket is None:
+            continue
+        for alias, index in bucket:
+            if index >= best:
+                break
+            if normalized.startswith(alias, start):
+                best = index
+                break
+    if best == len(_NORMALIZED_RULE_ALIASES):
+        return None
+    return _NORMALIZED_RULE_ALIASES[best][0]
+
+
 def _build_params(rule: IntentRule, raw_text: str, normalized: str) -> dict[str, Any]:
     params: dict[str, Any] = {}
     if rule.mode:
@@ -1950,8 +1999,27 @@ def _build_params(rule: IntentRule, raw_text: str, normalized: str) -> dict[str,
     return params
 
 
+# Recent messages known not to match any intent. Misses depend only on the text,
+# so repeats (retries, small talk) skip the full resolver; hits are never cached
+# because some build time-dependent params.
+_NO_MATCH_CACHE_SIZE = 512
+_no_match_cache: OrderedDict[str, None] = OrderedDict()
+
+
 def resolve_windows_intent(message: str) -> IntentResolution:
     raw = message or ""
+    if raw in _no_match_cache:
+        _no_match_cache.move_to_end(raw)
+        return IntentResolution(matched=False)
+    resolution = _resolve_windows_intent(raw)
+    if not resolution.matched:
+        _no_match_cache[raw] = None
+        if len(_no_match_cache) > _NO_MATCH_CACHE_SIZE:
+            _no_match_cache.popitem(last=False)
+    return resolution
+
+
+def _resolve_windows_intent(raw: str) -> IntentResolution:
     normalized = _normalize_text(raw)
     if not normalized:
         return IntentResolution(matched=False)
@@ -2189,27 +2257,27 @@ def resolve_windows_intent(message: str) -> IntentResolution:
                         risk_level="safe",
                     )
 
-    for rule in RULES:
-        if _contains_any(normalized, tuple(_normalize_text(a) for a in rule.aliases)):
-            if rule.unsupported_reason:
-                return IntentResolution(
-                    matched=True,
-                    capability_id=rule.capability_id,
-                    risk_level=rule.risk_level,
-                    unsupported=True,
-                    unsupported_reason=rule.unsupported_reason,
-                )
-            params = _build_params(rule, raw, normalized)
-            risk_level = rule.risk_level
-            if rule.capability_id in {"process.app_reduce_ram_execute", "process.app_reduce_cpu_execute", "process.app_reduce_disk_execute", "process.app_reduce_network_execute", "process.app_reduce_generic_execute", "apps.close_all", "process.kill_high_cpu"} and bool(params.get("dry_run")):
-                risk_level = "safe"
+    rule = _first_matching_rule(normalized)
+    if rule is not None:
+        if rule.unsupported_reason:
             return IntentResolution(
                 matched=True,
                 capability_id=rule.capability_id,
-                action=rule.action,
-                params=params,
-                risk_level=risk_level,
+                risk_level=rule.risk_level,
+                unsupported=True,
+                unsupported_reason=rule.unsupported_reason,
             )
+        params = _build_params(rule, raw, normalized)
+        risk_level = rule.risk_level
+        if rule.capability_id in {"process.app_reduce_ram_execute", "process.app_reduce_cpu_execute", "process.app_reduce_disk_execute", "process.app_reduce_network_execute", "process.app_reduce_generic_execute", "apps.close_all", "process.kill_high_cpu"} and bool(params.get("dry_run")):
+            risk_level = "safe"
+        return IntentResolution(
+            matched=True,
+            capability_id=rule.capability_id,
+            action=rule.action,
+            params=params,
+            risk_level=risk_level,
+        )
 
     # Unsupported but explicitly known asks from requested catalog.
     return IntentResolution(matched=False)
@@ -0,0 +1,631 @@
+"""Agent loop lifecycle, session bookkeeping, and streaming tests."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from Mudabbir.agents.loop import AgentLoop
+from Mudabbir.bus.events import Channel, InboundMessage, OutboundMessage
+
+
+class FakeBus:
+    """Records everything the loop publishes instead of fanning it out."""
+
+    def __init__(self) -> None:
+        self.published: list[OutboundMessage] = []
+        self.system_events: list = []
+
+    async def publish_outbound(self, message: OutboundMessage) -> None:
+        self.published.append(message)
+
+    async def publish_outbound_many(self, messages: list[OutboundMessage]) -> None:
+        self.published.extend(messages)
+
+    async def publish_system(self, event) -> None:
+        self.system_events.append(event)
+
+
+class FakeMemory:
+    """Session store stand-in that records writes, lookups, and learned turns."""
+
+    def __init__(self) -> None:
+        self.writes: list[tuple[str, str]] = []
+        self.lookups: list[str] = []
+        self.learned: list = []
+
+    async def resolve_session_key(self, session_key: str) -> str:
+        return session_key
+
+    async def add_to_session(self, *, session_key, role, content, metadata=None):
+        self.writes.append((role, content))
+        return role
+
+    async def get_session_history(self, session_key, limit=None):
+        self.lookups.append(session_key)
+        return []
+
+    async def get_compacted_history(self, session_key, **kwargs):
+        return []
+
+    async def auto_learn(self, messages, **kwargs) -> dict:
+        self.learned.append(messages)
+        return {}
+
+
+def _wired_loop(monkeypatch: pytest.MonkeyPatch, *, fastpath_reply: str | None = None) -> AgentLoop:
+    """A loop on fake memory and bus; ``fastpath_reply`` answers every message."""
+
+    async def _fastpath(*, text: str, session_key: str):
+        return fastpath_reply is not None, fastpath_reply
+
+    async def _system_prompt(**kwargs):
+        return "sys"
+
+    loop = AgentLoop()
+    loop.memory = FakeMemory()  # type: ignore[assignment]
+    loop.context_builder.build_system_prompt = _system_prompt  # type: ignore[method-assign]
+    loop.bus = FakeBus()  # type: ignore[assignment]
+    monkeypatch.setattr(loop.settings, "injection_scan_enabled", False)
+    monkeypatch.setattr(loop.settings, "ai_response_composer_enabled", False)
+    loop._try_global_windows_fastpath = _fastpath  # type: ignore[method-assign]
+    return loop
+
+
+def _msg(content: str, *, chat_id: str = "c", channel: Channel = Channel.CLI) -> InboundMessage:
+    return InboundMessage(channel=channel, sender_id="u", chat_id=chat_id, content=content)
+
+
+@pytest.mark.asyncio
+async def test_loop_drains_in_flight_messages_on_stop() -> None:
+    processed: list[str] = []
+    loop = AgentLoop()
+
+    class InboundBus:
+        def __init__(self) -> None:
+            self._items = ["m1", "m2"]
+
+        async def consume_inbound_batch(self, max_items: int = 16, timeout: float = 1.0):
+            if self._items:
+                return [self._items.pop(0)]
+            loop._running = False
+            return []
+
+    async def _fake_process(message) -> None:
+        await asyncio.sleep(0)
+        processed.append(message)
+
+    loop.bus = InboundBus()  # type: ignore[assignment]
+    loop._process_message = _fake_process  # type: ignore[method-assign]
+    loop._running = True
+    await loop._loop()
+
+    assert processed == ["m1", "m2"]
+
+
+@pytest.mark.asyncio
+async def test_start_builds_router_before_first_message(monkeypatch: pytest.MonkeyPatch) -> None:
+    built: list[str] = []
+
+    class FakeRouter:
+        def __init__(self, settings) -> None:
+            built.append(settings.agent_backend)
+
+    monkeypatch.setattr("Mudabbir.agents.loop.AgentRouter", FakeRouter)
+    loop = AgentLoop()
+
+    async def _no_loop() -> None:
+        assert isinstance(loop._router, FakeRouter)
+
+    loop._loop = _no_loop  # type: ignore[method-assign]
+    await loop.start()
+
+    assert len(built) == 1
+    assert loop._get_router() is loop._router
+    assert len(built) == 1
+
+
+def test_provider_model_map_is_cached_until_router_reset() -> None:
+    loop = AgentLoop()
+    first = loop._provider_model_map()
+    assert loop._provider_model_map() is first
+    assert first["ollama"] == str(loop.settings.ollama_model or "unknown")
+
+    loop.reset_router()
+    assert loop._provider_model_map() is not first
+
+
+def test_router_survives_loop_only_settings_change(monkeypatch: pytest.MonkeyPatch) -> None:
+    from Mudabbir.config import Settings
+
+    base = Settings.load()
+    current = {"settings": base}
+
+    class DummyRouter:
+        def __init__(self, settings) -> None:
+            self.settings = settings
+
+    monkeypatch.setattr("Mudabbir.agents.loop.Settings.load", lambda: current["settings"])
+    monkeypatch.setattr("Mudabbir.agents.loop.AgentRouter", DummyRouter)
+
+    loop = AgentLoop()
+    router = loop._get_router()
+
+    current["settings"] = base.model_copy(update={"ai_response_style": "concise"})
+    loop._on_settings_changed()
+    assert loop._get_router() is router
+    assert loop.settings.ai_response_style == "concise"
+
+    current["settings"] = base.model_copy(update={"agent_backend": "open_interpreter"})
+    loop._on_settings_changed()
+    assert loop._get_router() is not router
+
+
+@pytest.mark.asyncio
+async def test_router_shutdown_is_detached_and_resets_router() -> None:
+    stopped = asyncio.Event()
+
+    class SlowRouter:
+        async def stop(self) -> None:
+            await asyncio.sleep(0)
+            stopped.set()
+
+    loop = AgentLoop()
+    loop._router = SlowRouter()  # type: ignore[assignment]
+    loop._schedule_router_shutdown()
+
+    assert loop._router is None
+    assert not stopped.is_set()
+    await asyncio.wait_for(stopped.wait(), timeout=1.0)
+
+
+def test_memory_swap_updates_context_builder() -> None:
+    loop = AgentLoop()
+    replacement = object()
+
+    loop.memory = replacement  # type: ignore[assignment]
+
+    assert loop.memory is replacement
+    assert loop.context_builder.memory is replacement
+
+
+@pytest.mark.asyncio
+async def test_cancel_session_cancels_in_flight_task() -> None:
+    loop = AgentLoop()
+    loop.memory = FakeMemory()  # type: ignore[assignment]
+    started = asyncio.Event()
+
+    async def _hang() -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    task = asyncio.create_task(_hang())
+    loop._track_session_task("cli:c", task)
+    await started.wait()
+
+    assert await loop.cancel_session("cli:c") is True
+    assert task.cancelled()
+    assert await loop.cancel_session("cli:c") is False
+
+
+@pytest.mark.asyncio
+async def test_cancel_session_waits_for_task_cleanup() -> None:
+    loop = AgentLoop()
+    started = asyncio.Event()
+    cleaned_up: list[bool] = []
+
+    async def _hang() -> None:
+        started.set()
+        try:
+            await asyncio.sleep(60)
+        finally:
+            await asyncio.sleep(0)
+            cleaned_up.append(True)
+
+    task = asyncio.create_task(_hang())
+    loop._track_session_task("cli:c", task, "cli:c")
+    await started.wait()
+
+    assert await loop.cancel_session("cli:c") is True
+    assert cleaned_up == [True]
+    assert "cli:c" not in loop._session_tasks
+
+
+@pytest.mark.asyncio
+async def test_cancel_session_uses_cached_resolved_key() -> None:
+    loop = AgentLoop()
+
+    class UnresolvableMemory(FakeMemory):
+        async def resolve_session_key(self, session_key: str) -> str:
+            raise AssertionError("resolved key should come from the in-flight cache")
+
+    loop.memory = UnresolvableMemory()  # type: ignore[assignment]
+    started = asyncio.Event()
+
+    async def _hang() -> None:
+        started.set()
+        await asyncio.sleep(60)
+
+    task = asyncio.create_task(_hang())
+    loop._track_session_task("cli:aliased", task, "cli:c")
+    await started.wait()
+
+    assert await loop.cancel_session("cli:c") is True
+    assert task.cancelled()
+    assert "cli:c" not in loop._resolved_keys
+
+
+@pytest.mark.asyncio
+async def test_session_task_entry_dropped_when_task_finishes() -> None:
+    loop = AgentLoop()
+
+    async def _noop() -> None:
+        return None
+
+    task = asyncio.create_task(_noop())
+    loop._track_session_task("cli:c", task)
+    await task
+    await asyncio.sleep(0)
+
+    assert "cli:c" not in loop._session_tasks
+
+
+@pytest.mark.asyncio
+async def test_messages_serialize_per_session() -> None:
+    loop = AgentLoop()
+    loop.memory = FakeMemory()  # type: ignore[assignment]
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def _inner(message: InboundMessage, session_key: str) -> None:
+        order.append(f"start:{message.content}")
+        if message.content == "a1":
+            await release.wait()
+        order.append(f"end:{message.content}")
+
+    loop._process_message_inner = _inner  # type: ignore[method-assign]
+
+    first = asyncio.create_task(loop._process_message(_msg("a1", chat_id="a")))
+    second = asyncio.create_task(loop._process_message(_msg("a2", chat_id="a")))
+    other = asyncio.create_task(loop._process_message(_msg("b1", chat_id="b")))
+    await other
+    assert order == ["start:a1", "start:b1", "end:b1"]
+
+    release.set()
+    await asyncio.gather(first, second)
+    assert order[3:] == ["end:a1", "start:a2", "end:a2"]
+    assert not loop._session_inflight
+
+
+def test_seen_sessions_evicts_least_recently_used(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("Mudabbir.agents.loop.SEEN_SESSIONS_CAP", 2)
+    loop = AgentLoop()
+
+    loop._mark_session_seen("a")
+    loop._mark_session_seen("b")
+    assert loop._is_seen_session("a")
+    loop._mark_session_seen("c")
+    assert list(loop._seen_sessions) == ["a", "c"]
+    assert not loop._is_seen_session("b")
+
+
+@pytest.mark.asyncio
+async def test_welcome_history_lookup_runs_once_per_session(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    loop = _wired_loop(monkeypatch, fastpath_reply="done")
+    monkeypatch.setattr(loop.settings, "welcome_hint_enabled", True)
+
+    message = _msg("hi", channel=Channel.DISCORD)
+    await loop._process_message_inner(message, "discord:c")
+    await loop._process_message_inner(message, "discord:c")
+
+    published = loop.bus.published  # type: ignore[attr-defined]
+    assert loop.memory.lookups == ["discord:c"]  # type: ignore[attr-defined]
+    assert [m.content for m in published].count("done") == 2
+    assert len(published) == 5
+
+
+@pytest.mark.asyncio
+async def test_system_prompt_builds_while_user_turn_is_stored() -> None:
+    order: list[str] = []
+    stored = asyncio.Event()
+
+    class SlowStoreMemory(FakeMemory):
+        async def add_to_session(self, *, session_key, role, content, metadata=None):
+            order.append("store:start")
+            await asyncio.sleep(0.01)
+            order.append("store:end")
+            stored.set()
+
+        async def get_compacted_history(self, session_key, **kwargs):
+            assert stored.is_set()
+            return [{"role": "user", "content": "hi"}]
+
+    loop = AgentLoop()
+    loop.memory = SlowStoreMemory()  # type: ignore[assignment]
+
+    async def _build_prompt():
+        order.append("prompt")
+        return "sys"
+
+    prompt, history = await asyncio.gather(
+        _build_prompt(), loop._store_user_turn_and_load_history(_msg("hi"), "cli:c", "hi")
+    )
+    assert prompt == "sys"
+    assert history == [{"role": "user", "content": "hi"}]
+    assert order.index("prompt") < order.index("store:end")
+
+
+@pytest.mark.asyncio
+async def test_handle_timeout_publishes_hint_and_resets_router() -> None:
+    bus = FakeBus()
+    loop = AgentLoop()
+    loop.bus = bus  # type: ignore[assignment]
+    loop._router = None
+    end_marker = OutboundMessage(channel=Channel.CLI, chat_id="c", content="", is_stream_end=True)
+
+    await loop._handle_timeout(_msg("hi"), "cli:c", end_marker, phase="first", timeout_seconds=90)
+
+    assert len(bus.published) == 2
+    assert "timed out" in bus.published[0].content
+    assert bus.published[1] is end_marker
+    assert loop._router is None
+
+
+@pytest.mark.asyncio
+async def test_auto_learn_skips_empty_turn() -> None:
+    memory = FakeMemory()
+    loop = AgentLoop()
+    loop.memory = memory  # type: ignore[assignment]
+
+    await loop._auto_learn("hello", "   ", "cli:c")
+    assert memory.learned == []
+
+    await loop._auto_learn("hello", "hi there", "cli:c")
+    assert len(memory.learned) == 1
+
+
+@pytest.mark.asyncio
+async def test_auto_learn_queue_is_bounded_and_drained_on_stop(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("Mudabbir.agents.loop.AUTO_LEARN_WORKERS", 1)
+    monkeypatch.setattr("Mudabbir.agents.loop.AUTO_LEARN_QUEUE_SIZE", 2)
+
+    learned: list[str] = []
+    release = asyncio.Event()
+
+    loop = AgentLoop()
+
+    async def _fake_auto_learn(user_msg, assistant_msg, session_key, sender_id=None):
+        await release.wait()
+        learned.append(user_msg)
+
+    loop._auto_learn = _fake_auto_learn  # type: ignore[method-assign]
+
+    loop._enqueue_auto_learn("t1", "a", "s", None)
+    await asyncio.sleep(0)  # worker picks up t1 and blocks
+    for text in ("t2", "t3", "t4"):
+        loop._enqueue_auto_learn(text, "a", "s", None)
+    assert len(loop._auto_learn_workers) == 1
+
+    release.set()
+    await loop.stop()
+
+    assert learned == ["t1", "t3", "t4"]
+    assert loop._auto_learn_queue is None
+    assert loop._auto_learn_workers == []
+
+
+@pytest.mark.asyncio
+async def test_turn_finishing_after_stop_is_cleaned_up_when_loop_exits(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    class DummyRouter:
+        def __init__(self, settings) -> None:
+            self.settings = settings
+
+    monkeypatch.setattr("Mudabbir.agents.loop.AgentRouter", DummyRouter)
+    learned: list[str] = []
+    clients: list = []
+    release = asyncio.Event()
+    loop = AgentLoop()
+
+    class InboundBus:
+        def __init__(self) -> None:
+            self._items = ["m1"]
+
+        async def consume_inbound_batch(self, max_items: int = 16, timeout: float = 1.0):
+            await asyncio.sleep(0)
+            return [self._items.pop()] if self._items else []
+
+    async def _late_turn(message) -> None:
+        await release.wait()
+        clients.append(loop._get_ollama_client())
+        loop._enqueue_auto_learn("late", "a", "s", None)
+
+    async def _fake_auto_learn(user_msg, assistant_msg, session_key, sender_id=None):
+        learned.append(user_msg)
+
+    loop.bus = InboundBus()  # type: ignore[assignment]
+    loop._process_message = _late_turn  # type: ignore[method-assign]
+    loop._auto_learn = _fake_auto_learn  # type: ignore[method-assign]
+
+    running = asyncio.create_task(loop.start())
+    await asyncio.sleep(0.01)
+    await loop.stop()
+    release.set()
+    await asyncio.wait_for(running, timeout=1.0)
+
+    assert learned == ["late"]
+    assert loop._auto_learn_queue is None
+    assert loop._auto_learn_workers == []
+    assert clients[0].is_closed
+    assert loop._ollama_http is None
+
+
+def test_shrink_event_clips_long_string_fields():
+    from Mudabbir.agents.loop import _MAX_EVENT_FIELD, _shrink_event
+
+    small = {"type": "message", "content": "hi"}
+    assert _shrink_event(small) is small
+
+    big = {"type": "result", "content": "x" * (_MAX_EVENT_FIELD * 3), "metadata": {"a": 1}}
+    shrunk = _shrink_event(big)
+    assert len(shrunk["content"]) == _MAX_EVENT_FIELD
+    assert shrunk["metadata"] == {"a": 1}
+    assert len(big["content"]) == _MAX_EVENT_FIELD * 3
+
+
+@pytest.mark.asyncio
+async def test_iter_with_timeout_reports_phase():
+    from Mudabbir.agents.loop import StreamTimeoutError, _iter_with_timeout
+
+    async def _gen(delays):
+        for i, delay in enumerate(delays):
+            await asyncio.sleep(delay)
+            yield i
+
+    items = [i async for i in _iter_with_timeout(_gen([0, 0, 0]), first_timeout=1, timeout=1)]
+    assert items == [0, 1, 2]
+
+    with pytest.raises(StreamTimeoutError) as first_exc:
+        async for _ in _iter_with_timeout(_gen([0.2]), first_timeout=0.01, timeout=1):
+            pass
+    assert first_exc.value.phase == "first"
+
+    seen = []
+    with pytest.raises(StreamTimeoutError) as stream_exc:
+        async for item in _iter_with_timeout(_gen([0, 0.2]), first_timeout=1, timeout=0.01):
+            seen.append(item)
+    assert seen == [0]
+    assert stream_exc.value.phase == "stream"
+
+
+def test_sanitize_stream_chunk_passes_plain_tokens_and_drops_payloads() -> None:
+    for token in (" Sure", ", I can", " help.", " مرحبا", "\n"):
+        assert AgentLoop._sanitize_stream_chunk(token) == token
+    assert AgentLoop._sanitize_stream_chunk('{"name": "execute", "arguments": {}}') == ""
+    assert AgentLoop._sanitize_stream_chunk("}") == ""
+    assert AgentLoop._sanitize_stream_chunk('": "powershell"') == ""
+
+
+@pytest.mark.asyncio
+async def test_stream_coalescer_batches_after_first_chunks(monkeypatch: pytest.MonkeyPatch) -> None:
+    from Mudabbir.agents.loop import _StreamCoalescer
+
+    monkeypatch.setattr("Mudabbir.agents.loop.STREAM_PASSTHROUGH_CHUNKS", 2)
+    monkeypatch.setattr("Mudabbir.agents.loop.STREAM_COALESCE_CHARS", 6)
+    monkeypatch.setattr("Mudabbir.agents.loop.STREAM_COALESCE_INTERVAL_SECONDS", 0.01)
+
+    bus = FakeBus()
+
+    def published() -> list[str]:
+        assert all(m.is_stream_chunk for m in bus.published)
+        return [m.content for m in bus.published]
+
+    stream = _StreamCoalescer(bus, Channel.CLI, "c")  # type: ignore[arg-type]
+    for token in ("a", "b", "cc", "dd", "eee", "f"):
+        await stream.write(token)
+    assert published() == ["a", "b", "ccddeee"]
+
+    await asyncio.sleep(0.05)
+    assert published() == ["a", "b", "ccddeee", "f"]
+
+    await stream.write("g")
+    await stream.close()
+    assert published() == ["a", "b", "ccddeee", "f", "g"]
+
+
+@pytest.mark.asyncio
+async def test_stream_chunks_dispatch_to_handlers(monkeypatch: pytest.MonkeyPatch) -> None:
+    class FakeRouter:
+        async def run(self, content, *, system_prompt, history):
+            yield {"type": "status", "content": "warming up"}
+            yield {"type": "message", "content": "Hello "}
+            yield {"type": "tool_use", "metadata": {"name": "shell", "input": {"cmd": "ls"}}}
+            yield {"type": "tool_result", "content": "a.txt", "metadata": {"name": "shell"}}
+            yield {"type": "code", "content": "print(1)", "metadata": {"language": "python"}}
+            yield {"type": "output", "content": "1"}
+            yield {"type": "result", "content": "world"}
+            yield {"type": "done"}
+
+    loop = _wired_loop(monkeypatch)
+    loop._router = FakeRouter()  # type: ignore[assignment]
+
+    await loop._process_message_inner(_msg("hi"), "cli:c")
+
+    bus: FakeBus = loop.bus  # type: ignore[assignment]
+    expected = "Hello \n```python\nprint(1)\n```\n\n```output\n1\n```\nworld"
+    assert "".join(m.content for m in bus.published) == expected
+    assert bus.published[-1].is_stream_end is True
+    assert loop.memory.writes == [("user", "hi"), ("assistant", expected)]  # type: ignore[attr-defined]
+    assert [e.event_type for e in bus.system_events] == [
+        "thinking",
+        "tool_start",
+        "tool_result",
+        "tool_start",
+        "tool_result",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_error_after_partial_output_is_sent_as_its_own_message(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    class FailingRouter:
+        async def run(self, content, *, system_prompt, history):
+            yield {"type": "message", "content": "Partial answer"}
+            raise RuntimeError("boom")
+
+        async def stop(self) -> None:
+            return None
+
+    loop = _wired_loop(monkeypatch)
+    loop._router = FailingRouter()  # type: ignore[assignment]
+
+    await loop._process_message_inner(_msg("hi"), "cli:c")
+
+    published = loop.bus.published  # type: ignore[attr-defined]
+    chunks = [m.content for m in published if m.is_stream_chunk]
+    assert "".join(chunks) == "Partial answer"
+    error = published[-2]
+    assert error.content == "An error occurred: boom"
+    assert error.is_stream_chunk is False
+    assert published[-1].is_stream_end is True
+    assert loop._router is None
+
+
+@pytest.mark.asyncio
+async def test_thinking_chunks_are_coalesced(monkeypatch: pytest.MonkeyPatch) -> None:
+    from Mudabbir.agents.loop import _StreamCoalescer, _StreamTurn
+
+    monkeypatch.setattr("Mudabbir.agents.loop.THINKING_COALESCE_CHARS", 6)
+    bus = FakeBus()
+
+    def system_events() -> list[tuple[str, str | None]]:
+        return [(e.event_type, e.data.get("content")) for e in bus.system_events]
+
+    loop = AgentLoop()
+    loop.bus = bus  # type: ignore[assignment]
+    turn = _StreamTurn(
+        message=_msg("hi"),
+        session_key="cli:c",
+        use_ai_composer=False,
+        stream=_StreamCoalescer(loop.bus, Channel.CLI, "c"),
+    )
+
+    for token in ("Let", " me", " think", " it"):
+        await loop._on_thinking_chunk(turn, token, {})
+    assert system_events() == [("thinking", "Let"), ("thinking", " me think")]
+
+    await loop._flush_thinking(turn)
+    await loop._on_thinking_done_chunk(turn, "", {})
+    await loop._on_thinking_chunk(turn, "Next", {})
+    assert system_events()[2:] == [
+        ("thinking", " it"),
+        ("thinking_done", None),
+        ("thinking", "Next"),
+    ]
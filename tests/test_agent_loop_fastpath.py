@@ -2087,3 +2087,211 @@ async def test_global_fastpath_repeat_last_interval_replays_multiple_times(
     assert len(calls) == 4
     assert all(call[0] == "volume" for call in calls)
     assert all(call[1].get("mode") == "mute" for call in calls)
+
+
+@pytest.mark.asyncio
+async def test_fastpath_reply_persists_user_then_assistant_turn(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from Mudabbir.bus.events import Channel, InboundMessage
+
+    writes: list[tuple[str, str]] = []
+    published: list = []
+
+    class FakeMemory:
+        async def add_to_session(self, *, session_key, role, content, metadata=None):
+            writes.append((role, content))
+            return role
+
+    class FakeBus:
+        async def publish_outbound(self, message) -> None:
+            published.append(message)
+
+        async def publish_outbound_many(self, messages) -> None:
+            published.extend(messages)
+
+    async def _fake_fastpath(*, text: str, session_key: str):
+        return True, "Volume muted."
+
+    loop = AgentLoop()
+    loop.memory = FakeMemory()  # type: ignore[assignment]
+    loop.context_builder.memory = loop.memory
+    loop.bus = FakeBus()  # type: ignore[assignment]
+    monkeypatch.setattr(loop.settings, "injection_scan_enabled", False)
+    loop._try_global_windows_fastpath = _fake_fastpath  # type: ignore[method-assign]
+
+    message = InboundMessage(channel=Channel.CLI, sender_id="u", chat_id="c", content="mute")
+    await loop._process_message_inner(message, "cli:c")
+
+    assert writes == [("user", "mute"), ("assistant", "Volume muted.")]
+    assert [m.content for m in published] == ["Volume muted.", ""]
+    assert published[-1].is_stream_end is True
+
+
+@pytest.mark.asyncio
+async def test_cancelled_fastpath_reply_cancels_the_user_turn_write(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    import asyncio
+
+    from Mudabbir.bus.events import Channel, InboundMessage
+
+    started: list[str] = []
+    cancelled: list[str] = []
+
+    async def _block(name: str) -> None:
+        started.append(name)
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    class FakeMemory:
+        async def add_to_session(self, *, session_key, role, content, metadata=None):
+            await _block(role)
+
+    class FakeBus:
+        async def publish_outbound_many(self, messages) -> None:
+            await _block("publish")
+
+    async def _fake_fastpath(*, text: str, session_key: str):
+        return True, "Volume muted."
+
+    loop = AgentLoop()
+    loop.memory = FakeMemory()  # type: ignore[assignment]
+    loop.bus = FakeBus()  # type: ignore[assignment]
+    monkeypatch.setattr(loop.settings, "injection_scan_enabled", False)
+    loop._try_global_windows_fastpath = _fake_fastpath  # type: ignore[method-assign]
+
+    message = InboundMessage(channel=Channel.CLI, sender_id="u", chat_id="c", content="mute")
+    task = asyncio.create_task(loop._process_message_inner(message, "cli:c"))
+    while len(started) < 2:
+        await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert sorted(cancelled) == ["publish", "user"]
+
+
+@pytest.mark.asyncio
+async def test_global_fastpath_static_ack_with_followup(monkeypatch: pytest.MonkeyPatch) -> None:
+    class DummyDesktopTool:
+        async def execute(self, action: str, **kwargs):
+            assert action == "network_tools"
+            assert kwargs.get("mode") == "wifi_off"
+            return '{"ok": true}'
+
+    monkeypatch.setattr("Mudabbir.tools.builtin.desktop.DesktopTool", DummyDesktopTool)
+
+    loop = AgentLoop()
+    handled, reply = await loop._try_global_windows_fastpath(
+        text="turn off wifi", session_key="s-wifi"
+    )
+    assert handled is True
+    assert reply == "Wi-Fi turned off. Want me to enable airplane mode too?"
+
+
+def test_pending_dangerous_is_bounded_and_expires(monkeypatch: pytest.MonkeyPatch) -> None:
+    loop = AgentLoop()
+    loop._pending_dangerous_cap = 2
+    now = [1000.0]
+    monkeypatch.setattr("Mudabbir.agents.loop.time.monotonic", lambda: now[0])
+
+    loop._set_pending_dangerous("a", {"action": "a"})
+    loop._set_pending_dangerous("b", {"action": "b"})
+    loop._set_pending_dangerous("c", {"action": "c"})
+    assert list(loop._pending_windows_dangerous) == ["b", "c"]
+    assert loop._get_pending_dangerous("c") == {"action": "c"}
+
+    now[0] += 301
+    assert loop._get_pending_dangerous("c") is None
+    assert "c" not in loop._pending_windows_dangerous
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("action", "mode", "state", "expected"),
+    [
+        ("service_tools", "restart", {"last_service": "Spooler"}, {"name": "Spooler"}),
+        ("process_tools", "app_close", {"last_app": "chrome"}, {"name": "chrome"}),
+        (
+            "app_tools",
+            "close",
+            {"last_app": "chrome"},
+            {"process_name": "chrome", "query": "chrome"},
+        ),
+        ("window_control", "hide", {"last_window": "Notes"}, {"query": "Notes"}),
+        ("window_control", "rename_title", {"last_window": "Notes"}, {"text": "Notes"}),
+        ("window_control", "minimize", {"last_window": "Notes"}, {}),
+    ],
+)
+async def test_global_fastpath_followup_reuses_last_target(
+    monkeypatch: pytest.MonkeyPatch, action: str, mode: str, state: dict, expected: dict
+) -> None:
+    from Mudabbir.tools.capabilities.windows_intent_map import IntentResolution
+
+    calls: list[dict] = []
+
+    class DummyDesktopTool:
+        async def execute(self, action: str, **kwargs):
+            calls.append(kwargs)
+            return '{"ok": true, "message": "done"}'
+
+    monkeypatch.setattr("Mudabbir.tools.builtin.desktop.DesktopTool", DummyDesktopTool)
+    monkeypatch.setattr(
+        "Mudabbir.agents.loop.resolve_windows_intent",
+        lambda text: IntentResolution(
+            matched=True, capability_id="x", action=action, params={"mode": mode}
+        ),
+    )
+    loop = AgentLoop()
+    loop._get_windows_session_state("s").update(state)
+    await loop._try_global_windows_fastpath(text="do it again", session_key="s")
+    assert calls == [{"mode": mode, **expected}]
+
+
+def test_target_message_fills_target_or_default() -> None:
+    from Mudabbir.agents.loop import _target_message
+
+    assert _target_message("task_tools", "run", {"name": "{backup}"}, False) == (
+        "Ran scheduled task: {backup}."
+    )
+    assert _target_message("task_tools", "create", {}, False) == "Created scheduled task: new task."
+    assert _target_message("task_tools", "run", {}, True) == "تم تشغيل المهمة المجدولة: المحددة."
+    assert _target_message("user_tools", "list", {}, False) == "Fetched users list."
+    assert _target_message("user_tools", "unknown", {}, False) is None
+
+
+def test_windows_session_state_evicts_least_recently_used(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("Mudabbir.agents.loop.WINDOWS_SESSION_STATE_CAP", 2)
+    loop = AgentLoop()
+
+    loop._get_windows_session_state("a")["last_app"] = "notepad"
+    loop._get_windows_session_state("b")
+    assert loop._get_windows_session_state("a") == {"last_app": "notepad"}
+    loop._get_windows_session_state("c")
+    assert list(loop._windows_session_state) == ["a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_global_fastpath_reuses_desktop_tool(monkeypatch: pytest.MonkeyPatch) -> None:
+    created = []
+
+    class DummyDesktopTool:
+        def __init__(self):
+            created.append(self)
+
+        async def execute(self, action: str, **kwargs):
+            return '{"level_percent": 37, "muted": false}'
+
+    monkeypatch.setattr("Mudabbir.tools.builtin.desktop.DesktopTool", DummyDesktopTool)
+
+    loop = AgentLoop()
+    for _ in range(3):
+        handled, _reply = await loop._try_global_windows_fastpath(
+            text="كم نسبة الصوت", session_key="s1"
+        )
+        assert handled is True
+    assert len(created) == 1
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import asyncio
+
 import pytest
 
 from Mudabbir.agents.loop import AgentLoop
@@ -42,3 +44,219 @@ async def test_response_composer_uses_fallback_when_llm_unavailable() -> None:
         fallback_text="Current volume: 37% (muted=False)",
     )
     assert result == "Current volume: 37% (muted=False)"
+
+
+@pytest.mark.asyncio
+async def test_ollama_client_is_reused_and_closed_on_stop() -> None:
+    loop = AgentLoop()
+
+    client = loop._get_ollama_client()
+    assert loop._get_ollama_client() is client
+
+    await loop.stop()
+
+    assert client.is_closed
+    assert loop._ollama_http is None
+
+
+@pytest.mark.asyncio
+async def test_compose_response_sends_recent_events_only(monkeypatch: pytest.MonkeyPatch) -> None:
+    import json
+
+    from Mudabbir.agents.loop import _COMPOSER_EVENT_WINDOW
+
+    loop = AgentLoop()
+    captured = {}
+
+    async def _fake_one_shot(*, system_prompt, user_prompt, max_tokens, temperature):
+        captured["user_prompt"] = user_prompt
+        return "composed"
+
+    monkeypatch.setattr(loop, "_llm_one_shot_text", _fake_one_shot)
+    events = [{"type": "message", "content": str(i)} for i in range(40)]
+
+    reply = await loop._compose_response(user_query="q", events=events, fallback_text="fb")
+
+    assert reply == "composed"
+    payload = captured["user_prompt"].split("Execution events (JSON):\n", 1)[1].split("\n\n")[0]
+    sent = json.loads(payload)
+    assert len(sent) == _COMPOSER_EVENT_WINDOW
+    assert sent[-1]["content"] == "39"
+
+
+def test_stream_turn_keeps_only_the_composer_window() -> None:
+    from Mudabbir.agents.loop import _COMPOSER_EVENT_WINDOW, _StreamTurn
+
+    turn = _StreamTurn(
+        message=None,  # type: ignore[arg-type]
+        session_key="s",
+        use_ai_composer=True,
+        stream=None,  # type: ignore[arg-type]
+    )
+    for i in range(_COMPOSER_EVENT_WINDOW * 3):
+        turn.composition_events.append({"type": "message", "content": str(i)})
+    assert len(turn.composition_events) == _COMPOSER_EVENT_WINDOW
+    assert turn.composition_events[0]["content"] == str(_COMPOSER_EVENT_WINDOW * 2)
+
+
+def test_contains_arabic_detection() -> None:
+    assert AgentLoop._contains_arabic("كم نسبة الصوت") is True
+    assert AgentLoop._contains_arabic("volume 50% please") is False
+    assert AgentLoop._contains_arabic("café ok") is False
+    assert AgentLoop._contains_arabic(None) is False
+
+
+def test_llm_client_is_cached_until_router_reset() -> None:
+    loop = AgentLoop()
+    first = loop._get_llm_client()
+    assert loop._get_llm_client() is first
+
+    loop.reset_router()
+    assert loop._get_llm_client() is not first
+
+
+@pytest.mark.asyncio
+async def test_one_shot_requests_share_sdk_client_until_reset() -> None:
+    from types import SimpleNamespace
+
+    created: list[object] = []
+
+    class FakeMessages:
+        async def create(self, **kwargs):
+            block = SimpleNamespace(type="text", text="ok")
+            return SimpleNamespace(content=[block])
+
+    def _create_anthropic_client(**kwargs):
+        client = SimpleNamespace(messages=FakeMessages())
+        created.append(client)
+        return client
+
+    llm = SimpleNamespace(
+        provider="anthropic",
+        model="m",
+        is_ollama=False,
+        create_anthropic_client=_create_anthropic_client,
+    )
+    loop = AgentLoop()
+    loop._llm_client = llm  # type: ignore[assignment]
+    for _ in range(3):
+        assert (
+            await loop._llm_one_shot_request(
+                system_prompt="s", user_prompt="u", max_tokens=100, temperature=0.2
+            )
+            == "ok"
+        )
+    assert len(created) == 1
+
+    loop.reset_router()
+    assert loop._sdk_client is None
+
+
+@pytest.mark.asyncio
+async def test_ollama_one_shot_request_caps_generation_at_max_tokens() -> None:
+    from types import SimpleNamespace
+
+    payloads: list[dict] = []
+
+    class FakeHttp:
+        is_closed = False
+
+        async def post(self, url, json):
+            payloads.append(json)
+            return SimpleNamespace(
+                raise_for_status=lambda: None,
+                json=lambda: {"message": {"content": " composed "}},
+            )
+
+    loop = AgentLoop()
+    loop._llm_client = SimpleNamespace(  # type: ignore[assignment]
+        provider="ollama", model="m", is_ollama=True, ollama_host="http://ollama"
+    )
+    loop._ollama_http = FakeHttp()  # type: ignore[assignment]
+    text = await loop._llm_one_shot_request(
+        system_prompt="s", user_prompt="u", max_tokens=120, temperature=0.25
+    )
+    assert text == "composed"
+    assert payloads[0]["options"] == {"temperature": 0.25, "num_predict": 120}
+
+
+@pytest.mark.asyncio
+async def test_llm_one_shot_text_reuses_identical_completions(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("Mudabbir.agents.loop.ONE_SHOT_CACHE_SIZE", 2)
+    calls: list[str] = []
+
+    async def _request(*, system_prompt, user_prompt, max_tokens, temperature):
+        calls.append(user_prompt)
+        return None if user_prompt == "empty" else f"re:{user_prompt}"
+
+    loop = AgentLoop()
+    monkeypatch.setattr(loop, "_llm_one_shot_request", _request)
+
+    for prompt in ("a", "a", "b", "a", "c", "b", "empty", "empty"):
+        await loop._llm_one_shot_text(system_prompt="s", user_prompt=prompt)
+    assert await loop._llm_one_shot_text(system_prompt="s", user_prompt="c") == "re:c"
+    assert await loop._llm_one_shot_text(system_prompt="other", user_prompt="c") == "re:c"
+    # "b" was evicted by "c"; failed completions are never cached.
+    assert calls == ["a", "b", "c", "b", "empty", "empty", "c"]
+
+
+@pytest.mark.asyncio
+async def test_llm_one_shot_text_buckets_sampling_settings(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    sent: list[tuple[int, float]] = []
+
+    async def _request(*, system_prompt, user_prompt, max_tokens, temperature):
+        sent.append((max_tokens, temperature))
+        return "ok"
+
+    loop = AgentLoop()
+    monkeypatch.setattr(loop, "_llm_one_shot_request", _request)
+
+    for max_tokens, temperature in ((300, 0.25), (320, 0.26), (321, 0.25), (300, 0.3)):
+        await loop._llm_one_shot_text(
+            system_prompt="s", user_prompt="u", max_tokens=max_tokens, temperature=temperature
+        )
+    # 300/320 share a 64-token bucket and 0.25/0.26 a 0.05 step; the provider
+    # still gets the exact values of the first request in each bucket.
+    assert sent == [(300, 0.25), (321, 0.25), (300, 0.3)]
+
+
+@pytest.mark.asyncio
+async def test_llm_one_shot_text_caps_concurrent_requests(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("Mudabbir.agents.loop.ONE_SHOT_CONCURRENCY", 2)
+    active = peak = 0
+
+    async def _request(*, system_prompt, user_prompt, max_tokens, temperature):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return user_prompt
+
+    loop = AgentLoop()
+    monkeypatch.setattr(loop, "_llm_one_shot_request", _request)
+    results = await asyncio.gather(
+        *(loop._llm_one_shot_text(system_prompt="s", user_prompt=str(i)) for i in range(6))
+    )
+    assert results == [str(i) for i in range(6)]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_one_shot_text_times_out_to_none(monkeypatch: pytest.MonkeyPatch) -> None:
+    loop = AgentLoop()
+
+    async def _slow_request(**kwargs):
+        await asyncio.sleep(1)
+        return "late"
+
+    monkeypatch.setattr(loop, "_llm_one_shot_request", _slow_request)
+    monkeypatch.setattr("Mudabbir.agents.loop.COMPOSER_TIMEOUT_SECONDS", 0.01)
+
+    assert await loop._llm_one_shot_text(system_prompt="s", user_prompt="u") is None
@@ -46,3 +46,13 @@ def test_backends_command_available() -> None:
     assert response is not None
     assert "Available Backends" in response.content
 
+
+def test_is_command_matches_known_commands_only() -> None:
+    """Command detection should tolerate leading whitespace, "!" and @BotName suffixes."""
+    handler = get_command_handler()
+    assert handler.is_command("/help")
+    assert handler.is_command("  /NEW@MudabbirBot")
+    assert handler.is_command("!resume 2")
+    assert not handler.is_command("/newest")
+    assert not handler.is_command("please /help")
+    assert not handler.is_command("")
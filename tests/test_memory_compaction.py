@@ -0,0 +1,91 @@
+"""Session history compaction tests."""
+
+from __future__ import annotations
+
+import pytest
+
+from Mudabbir.memory.file_store import FileMemoryStore
+from Mudabbir.memory.manager import MemoryManager
+from Mudabbir.memory.protocol import MemoryEntry, MemoryType
+
+
+class WindowStore:
+    """Serves only the newest ``window`` entries, like the mem0 fallback's capped read."""
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.entries: list[MemoryEntry] = []
+
+    def append(self, content: str) -> None:
+        self.entries.append(
+            MemoryEntry(
+                id=str(len(self.entries)),
+                type=MemoryType.SESSION,
+                content=content,
+                role="user",
+            )
+        )
+
+    async def get_session(self, session_key: str) -> list[MemoryEntry]:
+        return self.entries[-self.window :]
+
+
+@pytest.mark.asyncio
+async def test_incremental_extracts_match_fresh_compaction(tmp_path) -> None:
+    manager = MemoryManager(store=FileMemoryStore(tmp_path))
+    key = "telegram:42"
+    for i in range(12):
+        await manager.add_to_session(key, "user", f"question {i} " + "word " * (i * 10))
+        await manager.add_to_session(key, "assistant", f"answer {i}\nwith a newline")
+        incremental = await manager.get_compacted_history(
+            key, recent_window=4, char_budget=100_000, summary_chars=40
+        )
+        fresh = await MemoryManager(store=manager._store).get_compacted_history(
+            key, recent_window=4, char_budget=100_000, summary_chars=40
+        )
+        assert incremental == fresh
+
+    # A different extract width must not reuse the cached lines.
+    narrow = await manager.get_compacted_history(
+        key, recent_window=4, char_budget=100_000, summary_chars=10
+    )
+    assert narrow[0]["content"].splitlines()[2] == "Assistant: answer 0..."
+
+    await manager.clear_session(key)
+    assert key not in manager._extract_cache
+
+
+def test_enforce_budget_drops_oldest_then_truncates() -> None:
+    messages = [{"role": "user", "content": "a" * n} for n in (50, 30, 20)]
+    assert MemoryManager._enforce_budget(messages, 100) == messages
+    assert MemoryManager._enforce_budget(messages, 60) == messages[1:]
+    assert MemoryManager._enforce_budget(messages, 10) == [{"role": "user", "content": "a" * 10}]
+
+
+@pytest.mark.asyncio
+async def test_slid_window_with_repeated_content_is_not_reused() -> None:
+    store = WindowStore(window=6)
+    manager = MemoryManager(store=store)
+    for content in ("alpha", "ok", "beta", "ok", "gamma", "ok", "delta", "ok"):
+        store.append(content)
+    await manager.get_compacted_history("s", recent_window=2, char_budget=100_000)
+
+    # The window slides by two; the last extracted message is "ok" again.
+    store.append("epsilon")
+    store.append("ok")
+    compacted = await manager.get_compacted_history("s", recent_window=2, char_budget=100_000)
+    fresh = await MemoryManager(store=store).get_compacted_history(
+        "s", recent_window=2, char_budget=100_000
+    )
+    assert compacted == fresh
+
+
+@pytest.mark.asyncio
+async def test_extract_cache_is_bounded(monkeypatch: pytest.MonkeyPatch, tmp_path) -> None:
+    monkeypatch.setattr("Mudabbir.memory.manager._EXTRACT_CACHE_SIZE", 2)
+    manager = MemoryManager(store=FileMemoryStore(tmp_path))
+    for key in ("a:1", "b:1", "c:1"):
+        for i in range(3):
+            await manager.add_to_session(key, "user", f"message {i}")
+        await manager.get_compacted_history(key, recent_window=1)
+    assert list(manager._extract_cache) == ["b:1", "c:1"]
@@ -0,0 +1,72 @@
+"""Message bus fan-out and inbound batching tests."""
+
+from __future__ import annotations
+
+import pytest
+
+from Mudabbir.bus.events import Channel, InboundMessage, OutboundMessage
+from Mudabbir.bus.queue import MessageBus
+
+
+@pytest.mark.asyncio
+async def test_publish_outbound_many_preserves_order_per_subscriber() -> None:
+    bus = MessageBus()
+    seen: dict[str, list[str]] = {"a": [], "b": []}
+
+    async def sub_a(message: OutboundMessage) -> None:
+        seen["a"].append(message.content)
+
+    async def sub_b(message: OutboundMessage) -> None:
+        seen["b"].append(message.content)
+
+    bus.subscribe_outbound(Channel.CLI, sub_a)
+    bus.subscribe_outbound(Channel.CLI, sub_b)
+
+    await bus.publish_outbound_many(
+        [
+            OutboundMessage(
+                channel=Channel.CLI, chat_id="c", content="chunk", is_stream_chunk=True
+            ),
+            OutboundMessage(channel=Channel.CLI, chat_id="c", content="", is_stream_end=True),
+        ]
+    )
+
+    assert seen == {"a": ["chunk", ""], "b": ["chunk", ""]}
+
+
+@pytest.mark.asyncio
+async def test_publish_outbound_many_continues_after_subscriber_failure() -> None:
+    bus = MessageBus()
+    seen: list[str] = []
+
+    async def flaky(message: OutboundMessage) -> None:
+        if message.content == "boom":
+            raise RuntimeError("send failed")
+        seen.append(message.content)
+
+    bus.subscribe_outbound(Channel.CLI, flaky)
+
+    await bus.publish_outbound_many(
+        [
+            OutboundMessage(channel=Channel.CLI, chat_id="c", content="boom"),
+            OutboundMessage(channel=Channel.CLI, chat_id="c", content="", is_stream_end=True),
+        ]
+    )
+
+    assert seen == [""]
+
+
+@pytest.mark.asyncio
+async def test_consume_inbound_batch_drains_queued_messages() -> None:
+    bus = MessageBus()
+    for i in range(5):
+        await bus.publish_inbound(
+            InboundMessage(channel=Channel.CLI, sender_id="u", chat_id="c", content=str(i))
+        )
+
+    first = await bus.consume_inbound_batch(max_items=3, timeout=0.1)
+    rest = await bus.consume_inbound_batch(max_items=3, timeout=0.1)
+
+    assert [m.content for m in first] == ["0", "1", "2"]
+    assert [m.content for m in rest] == ["3", "4"]
+    assert await bus.consume_inbound_batch(timeout=0.01) == []
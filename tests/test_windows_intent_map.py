@@ -1073,3 +1073,35 @@ def test_resolve_docx_to_pdf_extracts_paths() -> None:
     assert result.params.get("mode") == "docx_to_pdf"
     assert str(result.params.get("path", "")).endswith("a.docx")
     assert str(result.params.get("target", "")).endswith("a.pdf")
+
+
+def test_unmatched_message_is_cached_and_matches_are_not() -> None:
+    from Mudabbir.tools.capabilities import windows_intent_map
+
+    text = "tell me a story about the sea"
+    first = resolve_windows_intent(text)
+    assert first.matched is False
+    assert text in windows_intent_map._no_match_cache
+    second = resolve_windows_intent(text)
+    assert second.matched is False
+    assert second is not first
+
+    hit = "shutdown the pc now"
+    assert resolve_windows_intent(hit).matched is True
+    assert hit not in windows_intent_map._no_match_cache
+
+
+def test_alias_index_picks_earliest_rule_like_linear_scan() -> None:
+    from Mudabbir.tools.capabilities import windows_intent_map
+
+    def linear(normalized: str):
+        for rule, aliases in windows_intent_map._NORMALIZED_RULE_ALIASES:
+            if any(alias and alias in normalized for alias in aliases):
+                return rule
+        return None
+
+    aliases = [a for _, group in windows_intent_map._NORMALIZED_RULE_ALIASES for a in group]
+    samples = ["", "tell me a story", "please " + aliases[-1], aliases[-1] + " " + aliases[0]]
+    samples += [f"x{alias}y" for alias in aliases[::25]]
+    for text in samples:
+        assert windows_intent_map._first_matching_rule(text) is linear(text)